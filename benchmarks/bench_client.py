@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Client benchmarks against the local Livebox simulator:
+
+    python benchmarks/bench_client.py [--latency S] [--jitter S] [-n ROUNDS]
+
+Reports the mean, p50 and p99 of each operation, in milliseconds, and exits
+with a non-zero status when:
+
+- an optimized path is not faster than the one it replaces (CHECKS), or
+- a p50 exceeds its baseline by more than the tolerance. The baseline is
+  machine specific, record one with --save-baseline before a change and
+  compare with --baseline after it.
+"""
+
+import argparse
+import importlib.util
+import json
+import marshal
+import os
+import sys
+import tempfile
+import time
+
+from liveboxplaytv import LiveboxPlayTv
+from liveboxplaytv.fleet import LiveboxFleet
+from liveboxplaytv.lineup import load_compiled, save_compiled
+from liveboxplaytv.registry import REGISTRY, make_channel
+from liveboxplaytv.resolver import ChannelResolver
+from liveboxplaytv.simulator import LiveboxSimulator
+
+# (fast, slow): the fast operation must have the lower p50
+CHECKS = [
+    ("4 properties, cached", "4 properties, uncached"),
+    ("raw: rq(10)", "rq(10)"),
+    ("raw: press_key(VOL+)", "press_key(VOL+)"),
+    ("resolve(fuzzy, cached)", "resolve(fuzzy, uncached)"),
+    ("lineup: compiled cache load", "lineup: CHANNELS literal load"),
+]
+
+# Allowed p50 regression over the baseline: ratio, plus an absolute slack
+# in ms for the sub-microsecond operations
+DEFAULT_TOLERANCE = 1.5
+SLACK_MS = 0.05
+
+RESULTS = {}
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+    return samples[index]
+
+
+def load_channels_literal():
+    """Load CHANNELS from the bytecode cache, like an import would"""
+    import liveboxplaytv.channels
+
+    pyc = importlib.util.cache_from_source(liveboxplaytv.channels.__file__)
+    with open(pyc, "rb") as fp:
+        code = marshal.loads(fp.read()[16:])
+    namespace = {}
+    exec(code, namespace)
+    return namespace["CHANNELS"]
+
+
+def bench(name, func, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    print(
+        "{:<32} mean {:>9.3f}  p50 {:>9.3f}  p99 {:>9.3f} ms".format(
+            name,
+            sum(samples) / len(samples),
+            percentile(samples, 50),
+            percentile(samples, 99),
+        )
+    )
+    RESULTS[name] = percentile(samples, 50)
+    return samples
+
+
+def check(results, baseline=None, tolerance=DEFAULT_TOLERANCE):
+    """List of failure messages, empty when everything is within bounds"""
+    failures = []
+    for fast, slow in CHECKS:
+        if fast in results and slow in results and results[fast] >= results[slow]:
+            failures.append(
+                "{} ({:.3f} ms) is not faster than {} ({:.3f} ms)".format(
+                    fast, results[fast], slow, results[slow]
+                )
+            )
+    for name, reference in sorted((baseline or {}).items()):
+        if name in results and results[name] > reference * tolerance + SLACK_MS:
+            failures.append(
+                "{}: p50 {:.3f} ms, baseline {:.3f} ms".format(
+                    name, results[name], reference
+                )
+            )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rounds", type=int, default=200)
+    parser.add_argument("-l", "--latency", type=float, default=0.0)
+    parser.add_argument("-j", "--jitter", type=float, default=0.0)
+    parser.add_argument("--fleet-size", type=int, default=20)
+    parser.add_argument("--baseline", help="Compare the p50s to this JSON file")
+    parser.add_argument("--save-baseline", help="Save the p50s to this JSON file")
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Allowed p50 ratio over the baseline (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    sim_kwargs = dict(latency=args.latency, jitter=args.jitter, seed=0)
+    with LiveboxSimulator(**sim_kwargs) as sim:
+        box = LiveboxPlayTv(sim.host, port=sim.port)
+
+        bench("rq(10)", lambda: box.rq(10), args.rounds)
+        bench("press_key(VOL+)", box.volume_up, args.rounds)
+        bench("press_keys(12 OK, pace=0)", lambda: box.press_keys("12 OK", 0), 50)
+        bench("set_channel(Arte)", lambda: box.set_channel("Arte"), args.rounds)
+        # Time spent in the caller only, then wait for the queued keys
+        bench("nowait.press_key(VOL+)", box.nowait.volume_up, args.rounds)
+        box.nowait.submit(int).result()
+
+        def uncached_properties():
+            box.invalidate()
+            box.is_on, box.channel, box.media_state, box.osd_context
+
+        bench("4 properties, uncached", uncached_properties, args.rounds)
+        bench(
+            "4 properties, cached",
+            lambda: (box.is_on, box.channel, box.media_state, box.osd_context),
+            args.rounds,
+        )
+        box.close()
+
+        # Same operations with prebuilt requests on persistent sockets
+        raw = LiveboxPlayTv(sim.host, port=sim.port, transport="raw")
+        bench("raw: rq(10)", lambda: raw.rq(10), args.rounds)
+        bench("raw: press_key(VOL+)", raw.volume_up, args.rounds)
+        bench("raw: press_keys(12 OK, pace=0)", lambda: raw.press_keys("12 OK", 0), 50)
+        bench("raw: set_channel(Arte)", lambda: raw.set_channel("Arte"), args.rounds)
+        raw.close()
+
+    bench("registry.get(#7)", lambda: REGISTRY.get("#7"), 10000)
+    bench("registry.by_epg_id(192)", lambda: REGISTRY.by_epg_id("192"), 10000)
+    resolver = ChannelResolver()
+    bench("resolve(exact)", lambda: resolver.resolve("France 2"), 10000)
+    bench("resolve(fuzzy, cached)", lambda: resolver.resolve("frnce 2"), 10000)
+
+    def fuzzy_uncached():
+        resolver._fuzzy.cache_clear()
+        resolver.resolve("canal plus decale")
+
+    bench("resolve(fuzzy, uncached)", fuzzy_uncached, 500)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "lineup.marshal")
+        save_compiled(path, REGISTRY)
+        bench("lineup: compiled cache load", lambda: load_compiled(path), 2000)
+        bench(
+            "lineup: CHANNELS literal load",
+            lambda: [make_channel(c) for c in load_channels_literal()],
+            2000,
+        )
+
+    sims = [LiveboxSimulator(**sim_kwargs).start() for _ in range(args.fleet_size)]
+    try:
+        hosts = ["{}:{}".format(s.host, s.port) for s in sims]
+        with LiveboxFleet(hosts) as fleet:
+            bench("fleet connect ({} hosts)".format(len(hosts)), fleet.connect, 1)
+            bench(
+                "fleet refresh ({} hosts)".format(len(hosts)),
+                lambda: fleet.broadcast("refresh"),
+                20,
+            )
+            bench(
+                "fleet VOL+ ({} hosts)".format(len(hosts)),
+                lambda: fleet.press_key("VOL+"),
+                20,
+            )
+    finally:
+        for sim in sims:
+            sim.stop()
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as fp:
+            json.dump(RESULTS, fp, indent=2, sort_keys=True)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+    failures = check(RESULTS, baseline, args.tolerance)
+    for failure in failures:
+        print("FAILED: {}".format(failure))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
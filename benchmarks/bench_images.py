@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Compare the logo extraction paths on saved Wikipedia articles:
+
+    python benchmarks/bench_images.py [article.html ...]
+
+Without arguments a synthetic article (infobox followed by a long body) is
+generated. The script exits with a non-zero status when the streaming path
+is not faster and lighter than the former BeautifulSoup one, or when they
+disagree on the logo. Save real articles with e.g.:
+
+    curl -o tf1.html https://fr.wikipedia.org/wiki/TF1
+"""
+
+import argparse
+import re
+import sys
+import time
+import tracemalloc
+
+from liveboxplaytv.images import find_logo_src, resize_image_url
+
+
+def synthetic_article(paragraphs=2000):
+    infobox = (
+        '<table class="infobox_v2"><tr><td>'
+        '<img alt="Image illustrative de l\'article TF1" '
+        'src="//upload.wikimedia.org/wikipedia/commons/thumb/a/a0/TF1.svg/'
+        '220px-TF1.svg.png" width="220" height="110"></td></tr></table>'
+    )
+    body = "".join(
+        '<p>Paragraphe {0} <a href="/wiki/Lien_{0}">lien</a> '
+        '<img alt="Figure {0}" src="//upload.wikimedia.org/{0}px.png"></p>'
+        "<table><tr><td>{0}</td><td>donnée</td></tr></table>".format(i)
+        for i in range(paragraphs)
+    )
+    html = "<html><head><title>TF1</title></head><body>{}{}</body></html>"
+    return html.format(infobox, body).encode("utf-8")
+
+
+def bs4_path(html, img_size=300):
+    """The former implementation: full BeautifulSoup parse of the article"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html.decode("utf-8"), "html.parser")
+    img_src = None
+    for i in soup.find_all("img"):
+        if i.get("alt", "").startswith("Image illustrative"):
+            img_src = re.sub(r"\d+px", "{}px".format(img_size), i["src"])
+    return "https:{}".format(img_src) if img_src else None
+
+
+def stream_path(html, img_size=300, chunk_size=8192):
+    chunks = (html[i : i + chunk_size] for i in range(0, len(html), chunk_size))
+    src = find_logo_src(chunks)
+    return resize_image_url(src, img_size) if src else None
+
+
+def bench(func, html, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = func(html)
+    elapsed = (time.perf_counter() - start) / rounds
+    # Separate run: tracemalloc skews the timings
+    tracemalloc.start()
+    func(html)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("articles", nargs="*", help="Saved article HTML files")
+    parser.add_argument("-n", "--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    fixtures = [(path, open(path, "rb").read()) for path in args.articles]
+    if not fixtures:
+        fixtures = [("synthetic", synthetic_article())]
+
+    paths = [("stream", stream_path)]
+    try:
+        import bs4  # noqa: F401
+
+        paths.insert(0, ("bs4", bs4_path))
+    except ImportError:
+        print("bs4 is not installed, skipping the former implementation")
+
+    failed = False
+    for name, html in fixtures:
+        print("{} ({} KiB)".format(name, len(html) // 1024))
+        measures = {}
+        for path_name, func in paths:
+            result, elapsed, peak = bench(func, html, args.rounds)
+            measures[path_name] = result, elapsed, peak
+            print(
+                "  {:<8} {:>9.2f} ms  peak {:>8.1f} KiB  {}".format(
+                    path_name, elapsed * 1000, peak / 1024.0, result
+                )
+            )
+        if "bs4" in measures:
+            stream, former = measures["stream"], measures["bs4"]
+            if stream[0] != former[0]:
+                print("  FAILED: the logos differ")
+                failed = True
+            if stream[1] >= former[1] or stream[2] >= former[2]:
+                print("  FAILED: streaming is not faster and lighter than bs4")
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Guard the import time of the package and its CLI:
+
+    python benchmarks/bench_import.py [--budget MS] [module ...]
+
+Each module is imported in a fresh interpreter with "python -X importtime",
+the best cumulative time of several runs is compared to the budget and the
+script exits with a non-zero status when it is exceeded.
+"""
+
+import argparse
+import subprocess
+import sys
+
+
+DEFAULT_MODULES = ["liveboxplaytv", "liveboxplaytv.cli"]
+DEFAULT_BUDGET_MS = 40.0
+
+
+def top_level_imports(code):
+    """{module: cumulative us} of the top level imports done running code"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    imports = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        # Nested imports are indented
+        if not parts[2].startswith("  "):
+            imports[parts[2].strip()] = int(parts[1])
+    return imports
+
+
+def import_time(module, startup=()):
+    """Cumulative import time of a module in a fresh interpreter, in ms"""
+    imports = top_level_imports("import {}".format(module))
+    return sum(t for m, t in imports.items() if m not in startup) / 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("-b", "--budget", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("-n", "--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    # Modules imported by the interpreter startup (site...) are not counted
+    startup = set(top_level_imports("pass"))
+    failed = False
+    for module in args.modules:
+        # Warm up the bytecode cache
+        import_time(module, startup)
+        best = min(import_time(module, startup) for _ in range(args.rounds))
+        ok = best <= args.budget
+        failed |= not ok
+        print(
+            "{:<24} {:>8.1f} ms  (budget {:.0f} ms) {}".format(
+                module, best, args.budget, "OK" if ok else "OVER BUDGET"
+            )
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,44 @@
 from __future__ import absolute_import
 
 # from .liveboxplaytv import CHANNEL_EPG_IDS
-from .channels import CHANNELS
+from .exceptions import (
+    ChannelNotFoundError,
+    CommandTimeoutError,
+    HostUnavailableError,
+    LiveboxPlayTvError,
+)
 from .keys import KEYS
 from .liveboxplaytv import LiveboxPlayTv
 from .liveboxplaytv import _LOGGER
+from .registry import Channel, ChannelRegistry, REGISTRY
+from .resolver import ChannelResolver
+
+# These pull in heavy dependencies (aiohttp, requests, asyncio) or large
+# literals (the bundled lineup), they are imported on first access to keep
+# "import liveboxplaytv" fast
+_LAZY_IMPORTS = {
+    "AsyncLiveboxPlayTv": ".aio",
+    "CHANNELS": ".channels",
+    "DiscoveryCache": ".discovery",
+    "FleetResult": ".fleet",
+    "LineupSync": ".lineup",
+    "LiveboxFleet": ".fleet",
+    "ProgramGuide": ".guide",
+    "PollScheduler": ".scheduler",
+    "StateChange": ".watcher",
+    "StateWatcher": ".watcher",
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    from importlib import import_module
+
+    value = getattr(import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_IMPORTS))
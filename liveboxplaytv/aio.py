@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+
+from collections import OrderedDict
+import asyncio
+import logging
+import weakref
+
+import aiohttp
+from yarl import URL
+
+from .keys import KEYS
+from .registry import REGISTRY
+from .resolver import RESOLVER, ChannelResolver
+from .state import LiveboxState
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# One pooled aiohttp session per event loop, shared by all the clients that
+# were not given an explicit session: {loop: (session, clients using it)}
+_SHARED_SESSIONS = weakref.WeakKeyDictionary()
+
+# Default of timeout arguments, None means no timeout
+_DEFAULT_TIMEOUT = object()
+
+
+def get_shared_session(limit=100, limit_per_host=4, client=None):
+    """The session of the running loop, client is recorded as one of its users"""
+    loop = asyncio.get_running_loop()
+    entry = _SHARED_SESSIONS.get(loop)
+    if entry is None or entry[0].closed:
+        connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host)
+        entry = (aiohttp.ClientSession(connector=connector), weakref.WeakSet())
+        _SHARED_SESSIONS[loop] = entry
+    if client is not None:
+        entry[1].add(client)
+    return entry[0]
+
+
+async def release_shared_session(client):
+    """Forget a user of the session of the loop, close it after the last one"""
+    loop = asyncio.get_running_loop()
+    entry = _SHARED_SESSIONS.get(loop)
+    if entry is None:
+        return
+    entry[1].discard(client)
+    if not entry[1]:
+        del _SHARED_SESSIONS[loop]
+        await entry[0].close()
+
+
+async def close_shared_session():
+    entry = _SHARED_SESSIONS.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        await entry[0].close()
+
+
+class AsyncLiveboxPlayTv(object):
+    """
+    asyncio counterpart of LiveboxPlayTv. The constructor does no I/O, use:
+
+        box = await AsyncLiveboxPlayTv.create('livebox-play.lan')
+
+    or the client as an async context manager, which closes it on exit.
+    """
+
+    def __init__(self, hostname, port=8080, timeout=3, session=None, registry=None):
+        self.hostname = hostname
+        self.port = port
+        self.timeout = timeout
+        self._session = session
+        self._info = None
+        self._state = None
+        if registry is None or registry is REGISTRY:
+            self.registry = REGISTRY
+            self.resolver = RESOLVER
+        else:
+            self.registry = registry
+            self.resolver = ChannelResolver(registry)
+
+    @classmethod
+    async def create(cls, *args, **kwargs):
+        box = cls(*args, **kwargs)
+        await box.connect()
+        return box
+
+    async def connect(self):
+        info = await self.get_info()
+        assert isinstance(info, dict), "Failed to retrive info from {}".format(
+            self.hostname
+        )
+        return info
+
+    async def close(self):
+        """
+        Release the shared session of the loop, which is closed once none of
+        its clients use it. A session given to the constructor is left open.
+        """
+        await release_shared_session(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            return get_shared_session(client=self)
+        return self._session
+
+    @property
+    def info(self):
+        """Last state snapshot retrieved with get_info()"""
+        return self._info or {}
+
+    @property
+    def status(self):
+        """The last snapshot decoded as a LiveboxState"""
+        info = self.info
+        if self._state is None or self._state.raw is not info:
+            self._state = LiveboxState.from_info(info, self.registry)
+        return self._state
+
+    @property
+    def standby_state(self):
+        return self.status.is_on
+
+    @property
+    def is_on(self):
+        return self.standby_state
+
+    @property
+    def epg_id(self):
+        return self.status.epg_id
+
+    @property
+    def name(self):
+        return self.status.friendly_name
+
+    async def _get(self, url, params=None, timeout=_DEFAULT_TIMEOUT):
+        if timeout is _DEFAULT_TIMEOUT:
+            timeout = self.timeout
+        async with self.session.get(
+            url, params=params, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as resp:
+            resp.raise_for_status()
+            # The box does not always send a JSON content type
+            return await resp.json(content_type=None)
+
+    async def rq(self, operation, params=None):
+        url = "http://{}:{}/remoteControl/cmd".format(self.hostname, self.port)
+        get_params = OrderedDict({"operation": operation})
+        if params:
+            get_params.update(params)
+        _LOGGER.debug("GET parameters: %s", get_params)
+        return await self._get(url, params=get_params)
+
+    async def get_info(self):
+        self._info = (await self.rq(10))["result"]["data"]
+        return self._info
+
+    async def turn_on(self):
+        await self.get_info()
+        if not self.standby_state:
+            await self.press_key(key=KEYS["POWER"])
+            await asyncio.sleep(0.8)
+            await self.press_key(key=KEYS["OK"])
+
+    async def turn_off(self):
+        await self.get_info()
+        if self.standby_state:
+            return await self.press_key(key=KEYS["POWER"])
+
+    async def set_epg_id(self, epg_id):
+        # The EPG ID needs to be 10 chars long, padded with '*' chars
+        epg_id_str = str(epg_id).rjust(10, "*")
+        _LOGGER.debug("EPG ID string: %s", epg_id_str)
+        # Pass a pre-encoded URL so that the '*' chars are sent verbatim
+        url = URL(
+            "http://{}:{}/remoteControl/cmd?operation=09&epg_id={}&uui=1".format(
+                self.hostname, self.port, epg_id_str
+            ),
+            encoded=True,
+        )
+        return await self._get(url)
+
+    async def set_channel(self, channel):
+        return await self.set_epg_id(self.resolver.resolve(channel).epg_id)
+
+    async def press_key(self, key, mode=0):
+        """
+        modes:
+            0 -> simple press
+            1 -> long press
+            2 -> release after long press
+        """
+        if isinstance(key, str):
+            assert key in KEYS, "No such key: {}".format(key)
+            key = KEYS[key]
+        _LOGGER.info("Press key %s", key)
+        return await self.rq("01", OrderedDict([("key", key), ("mode", mode)]))
+
+    async def volume_up(self):
+        return await self.press_key(key=KEYS["VOL+"])
+
+    async def volume_down(self):
+        return await self.press_key(key=KEYS["VOL-"])
+
+    async def mute(self):
+        return await self.press_key(key=KEYS["MUTE"])
+
+    async def channel_up(self):
+        return await self.press_key(key=KEYS["CH+"])
+
+    async def channel_down(self):
+        return await self.press_key(key=KEYS["CH-"])
+
+    async def event_notify(self, timeout=None):
+        # Long polling request: no timeout unless explicitly requested
+        url = "http://{}:{}/remoteControl/notifyEvent".format(self.hostname, self.port)
+        return await self._get(url, timeout=timeout)
@@ -7,7 +7,13 @@ CHANNELS = [
     {"epg_id": "192", "index": "1", "name": "TF1", "wiki_page": "TF1"},
     {"epg_id": "4", "index": "2", "name": "France 2", "wiki_page": "France 2"},
     {"epg_id": "80", "index": "3", "name": "France 3", "wiki_page": "France 3"},
-    {"epg_id": "34", "index": "4", "name": "Canal+", "wiki_page": "Canal+"},
+    {
+        "epg_id": "34",
+        "index": "4",
+        "name": "Canal+",
+        "wiki_page": "Canal+",
+        "aliases": ["Canal Plus"],
+    },
     {"epg_id": "47", "index": "5", "name": "France 5", "wiki_page": "France 5"},
     {"epg_id": "118", "index": "6", "name": "M6", "wiki_page": "M6"},
     {"epg_id": "111", "index": "7", "name": "Arte", "wiki_page": "Arte"},
@@ -16,6 +22,7 @@ CHANNELS = [
         "index": "8",
         "name": "C8",
         "wiki_page": "C8 (chaîne de télévision)",
+        "aliases": ["D8"],
     },
     {"epg_id": "119", "index": "9", "name": "W9", "wiki_page": "W9"},
     {
@@ -31,11 +38,24 @@ CHANNELS = [
         "index": "13",
         "name": "LCP/PS",
         "wiki_page": "LCP (chaîne de télévision)",
+        "aliases": ["LCP", "Public Sénat"],
     },
     {"epg_id": "78", "index": "14", "name": "France 4", "wiki_page": "France 4"},
     {"epg_id": "481", "index": "15", "name": "BFM TV", "wiki_page": "BFM TV"},
-    {"epg_id": "226", "index": "16", "name": "i>Télé", "wiki_page": "I-Télé"},
-    {"epg_id": "458", "index": "17", "name": "CStar", "wiki_page": "CStar"},
+    {
+        "epg_id": "226",
+        "index": "16",
+        "name": "i>Télé",
+        "wiki_page": "I-Télé",
+        "aliases": ["iTélé", "I-Télé"],
+    },
+    {
+        "epg_id": "458",
+        "index": "17",
+        "name": "CStar",
+        "wiki_page": "CStar",
+        "aliases": ["D17"],
+    },
     {"epg_id": "482", "index": "18", "name": "Gulli", "wiki_page": "Gulli"},
     {"epg_id": "160", "index": "19", "name": "France Ô", "wiki_page": "France Ô"},
     {"epg_id": "1404", "index": "20", "name": "HD1", "wiki_page": "HD1"},
@@ -56,7 +76,13 @@ CHANNELS = [
     {"epg_id": "1399", "index": "25", "name": "Chérie 25", "wiki_page": "Chérie 25"},
     {"epg_id": "112", "index": "26", "name": "LCI", "wiki_page": "LCI"},
     {"epg_id": "191", "index": "34", "name": "Téva", "wiki_page": "Téva"},
-    {"epg_id": "205", "index": "35", "name": "TV5 Monde", "wiki_page": "TV5 Monde"},
+    {
+        "epg_id": "205",
+        "index": "35",
+        "name": "TV5 Monde",
+        "wiki_page": "TV5 Monde",
+        "aliases": ["TV5MONDE"],
+    },
     {
         "epg_id": "145",
         "index": "36",
@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-import asyncio
 import logging
 import argparse
+import os
+import sys
 
 
 from liveboxplaytv import LiveboxPlayTv
@@ -15,8 +16,9 @@ def parse_args():
     parser.add_argument(
         "-H",
         "--hostname",
-        required=True,
-        help="IP address or hostname of the Livebox Play",
+        action="append",
+        help="IP address or hostname of the Livebox Play "
+        "(repeat to run the action on several boxes in parallel)",
     )
     parser.add_argument(
         "-j",
@@ -26,6 +28,19 @@ def parse_args():
         required=False,
         help="Format output as JSON",
     )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        default=False,
+        help="Go through the daemon (see serve), also the default when "
+        "$LIVEBOXPLAYTV_DAEMON is set",
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        default=False,
+        help="Talk to the box directly, even if $LIVEBOXPLAYTV_DAEMON is set",
+    )
     parser.add_argument(
         "-d",
         "--debug",
@@ -36,42 +51,151 @@ def parse_args():
     )
     key_parser = subparsers.add_parser("key", help="Press an arbitrary key")
     key_parser.add_argument("key", help="Name or ID of the key to press")
+    keys_parser = subparsers.add_parser(
+        "keys", help="Press a sequence of keys (eg. '1 2 OK', 'VOL+*5', 'wait:0.5')"
+    )
+    keys_parser.add_argument("SEQUENCE", nargs="+", help="Keys to press")
+    keys_parser.add_argument(
+        "-p",
+        "--pace",
+        type=float,
+        default=None,
+        help="Minimum delay between two keys, in seconds",
+    )
     vol_parser = subparsers.add_parser("vol", help="Volume Control")
     vol_parser.add_argument("volume_action", choices=["up", "down", "mute"])
     subparsers.add_parser("info", help="Get info")
     subparsers.add_parser("program", help="Get current program")
-    subparsers.add_parser("channel", help="Get current channel")
+    guide_parser = subparsers.add_parser(
+        "guide", help="Program guide of a channel, or of all channels"
+    )
+    guide_parser.add_argument("CHANNEL", nargs="?")
+    guide_parser.add_argument(
+        "-a", "--at", help="Time (HH:MM, today) to look up instead of now"
+    )
+    guide_parser.add_argument(
+        "-r", "--refresh", action="store_true", help="Force a guide refresh"
+    )
     subparsers.add_parser("state", help="Get the current state (on or off)")
-    subparsers.add_parser("on", help="Turn the Livebox Play appliance on")
+    on_parser = subparsers.add_parser("on", help="Turn the Livebox Play appliance on")
+    on_parser.add_argument(
+        "-w", "--wait", action="store_true", help="Wait until the box is on"
+    )
+    on_parser.add_argument(
+        "-W",
+        "--wol",
+        action="store_true",
+        help="Wake the box with Wake-on-LAN if it does not answer (implies --wait)",
+    )
     subparsers.add_parser("off", help="Turn the Livebox Play appliance off")
     channel_parser = subparsers.add_parser(
         "channel", help="Get or set the current channel"
     )
     channel_parser.add_argument("CHANNEL", nargs="?")
+    channel_parser.add_argument(
+        "-w", "--wait", action="store_true", help="Wait until the channel is played"
+    )
+    stats_parser = subparsers.add_parser(
+        "stats",
+        help="Dump the latency and error metrics collected by the daemon "
+        "(or probe the box(es) with -n)",
+    )
+    stats_parser.add_argument(
+        "-n",
+        "--count",
+        type=int,
+        default=None,
+        help="Probe the box(es) with this number of info requests instead",
+    )
+    stats_parser.add_argument(
+        "-p",
+        "--prometheus",
+        action="store_true",
+        help="Output the metrics in the Prometheus text format",
+    )
+    discover_parser = subparsers.add_parser(
+        "discover", help="Find the Livebox Play boxes of the LAN"
+    )
+    discover_parser.add_argument(
+        "-n",
+        "--network",
+        help="Also scan this subnet (eg. 192.168.1.0/24, or 'auto' for the local /24)",
+    )
+    discover_parser.add_argument(
+        "-p",
+        "--port",
+        type=int,
+        action="append",
+        help="Port of the remote control API (default: 8080, repeatable)",
+    )
+    discover_parser.add_argument(
+        "--no-ssdp", action="store_true", help="Do not send an SSDP search"
+    )
+    discover_parser.add_argument(
+        "-c", "--cached", action="store_true", help="List the boxes found previously"
+    )
+    serve_parser = subparsers.add_parser(
+        "serve", help="Run a daemon keeping the clients of the boxes warm"
+    )
+    serve_parser.add_argument(
+        "-l",
+        "--listen",
+        help="Address of the HTTP API (default: 127.0.0.1:8765 or $LIVEBOXPLAYTV_DAEMON)",
+    )
+    serve_parser.add_argument(
+        "--no-watch",
+        action="store_true",
+        help="Do not watch the boxes for state changes",
+    )
+    serve_parser.add_argument(
+        "--any-host",
+        action="store_true",
+        help="Also serve the boxes named by the requests, not only the -H ones",
+    )
+    serve_parser.add_argument(
+        "--allow-remote",
+        action="store_true",
+        help="Allow listening on a non-loopback address, "
+        "anyone reaching it can control the boxes",
+    )
     # Debuggign methods
     subparsers.add_parser("notify", help="Wait and notify of new events")
     op_parser = subparsers.add_parser("op", help="[DEBUG] Send request")
     op_parser.add_argument("OPERATION", help="Operation")
-    return parser.parse_args()
+    args = parser.parse_args()
+    # The daemon metrics cover the boxes it serves
+    no_host = ("discover", "serve")
+    if getattr(args, "count", None) is None:
+        no_host += ("stats",)
+    if not args.hostname and args.action not in no_host:
+        parser.error("the following arguments are required: -H/--hostname")
+    if args.action == "serve" and not args.hostname and not args.any_host:
+        parser.error("serve needs the boxes to serve (-H) or --any-host")
+    return args
 
 
-def main():
-    args = parse_args()
-    if args.debug:
-        logging.basicConfig(level=logging.DEBUG)
+def run_action(l, args):
     output = ""
-    l = LiveboxPlayTv(args.hostname)
-
     if args.action == "info":
-        output = l.info
+        output = l.status.as_dict()
     elif args.action == "state":
         output = "on" if l.state() else "off"
     elif args.action == "on":
-        output = l.turn_on()
+        if args.wol:
+            output = format_wake(l.power_on())
+        elif args.wait:
+            output = format_wake(l.turn_on_confirmed())
+        else:
+            output = l.turn_on()
     elif args.action == "off":
         output = l.turn_off()
     elif args.action == "key":
         output = l.press_key(args.key)
+    elif args.action == "keys":
+        res = l.press_keys(" ".join(args.SEQUENCE), pace=args.pace)
+        output = "{} keys sent in {:.2f}s".format(res.sent, res.elapsed)
+        if res.errors:
+            output += ", {} failed".format(len(res.errors))
     elif args.action == "vol":
         if args.volume_action == "up":
             output = l.volume_up()
@@ -80,29 +204,333 @@ def main():
         elif args.volume_action == "mute":
             output = l.mute()
     elif args.action == "channel":
-        if args.CHANNEL:
-            if args.CHANNEL.lower() == "list":
-                output = l.get_channel_names(args.json)
-            else:
-                output = l.set_channel(args.CHANNEL)
+        if args.CHANNEL and args.wait:
+            output = format_zap(args.CHANNEL, l.set_channel_confirmed(args.CHANNEL))
+        elif args.CHANNEL:
+            output = l.set_channel(args.CHANNEL)
         else:
             output = l.get_current_channel_name()
     elif args.action == "notify":
         output = l.event_notify()
     elif args.action == "op":
         output = l.rq(args.OPERATION)
-    elif args.action == "channel":
-        output = l.channel
     elif args.action == "program":
-        loop = asyncio.get_event_loop()
-        output = loop.run_until_complete(l.async_get_current_program_name())
-        loop.close()
+        import asyncio
 
-    if output:
+        output = asyncio.run(l.async_get_current_program_name())
+    return output
+
+
+def format_wake(elapsed):
+    return "On in {:.2f}s".format(elapsed) if elapsed else "Already on"
+
+
+def format_zap(channel, elapsed):
+    return "Tuned to {} in {:.2f}s".format(channel, elapsed)
+
+
+def daemon_request(args):
+    """(method, path, params) of an action the daemon supports, or None"""
+    if args.action == "info":
+        return "GET", "/status", {}
+    if args.action == "state":
+        return "GET", "/state", {}
+    if args.action == "on" and args.wol:
+        return "POST", "/on", {"wol": True}
+    if args.action == "on" and args.wait:
+        return "POST", "/on", {"confirm": True}
+    if args.action in ("on", "off"):
+        return "POST", "/" + args.action, {}
+    if args.action == "key":
+        return "POST", "/key", {"key": args.key}
+    if args.action == "keys":
+        return "POST", "/keys", {"sequence": " ".join(args.SEQUENCE), "pace": args.pace}
+    if args.action == "vol":
+        return "POST", "/vol", {"action": args.volume_action}
+    if args.action == "channel":
+        if args.CHANNEL and args.wait:
+            return "POST", "/channel", {"channel": args.CHANNEL, "confirm": True}
+        if args.CHANNEL:
+            return "POST", "/channel", {"channel": args.CHANNEL}
+        return "GET", "/channel", {}
+
+
+def run_daemon(host, args):
+    """Run the action through the daemon, returns None if it is not running"""
+    from liveboxplaytv.server import DaemonClient, DaemonError
+
+    request = daemon_request(args)
+    if request is None:
+        return
+    # Confirmed commands take as long as the box
+    waits = getattr(args, "wait", False) or getattr(args, "wol", False)
+    daemon = DaemonClient(timeout=90 if waits else 10)
+    if not daemon.is_running():
+        return
+    method, path, params = request
+    try:
+        output = daemon.call(method, path, host=host, **params)
+    except DaemonError as exc:
+        if exc.status not in (401, 403):
+            raise
+        # The daemon does not serve this box (or is not ours), talk to it
+        # directly
+        return
+    finally:
+        daemon.close()
+    if args.action == "keys":
+        res = output
+        output = "{} keys sent in {:.2f}s".format(res["sent"], res["elapsed"])
+        if res["errors"]:
+            output += ", {} failed".format(len(res["errors"]))
+    elif args.action == "on" and (args.wait or args.wol):
+        output = format_wake(output)
+    elif args.action == "channel" and args.CHANNEL and args.wait:
+        output = format_zap(args.CHANNEL, output)
+    # Distinguish "the daemon ran it" from "no daemon"
+    return (output,)
+
+
+def run_serve(args):
+    from liveboxplaytv.server import LiveboxServer, get_daemon_address
+
+    address = get_daemon_address()
+    if args.listen:
+        host, _, port = args.listen.rpartition(":")
+        address = (host or address[0], int(port))
+    if not args.debug:
+        logging.basicConfig(level=logging.INFO)
+    try:
+        server = LiveboxServer(
+            args.hostname or (),
+            address,
+            watch=not args.no_watch,
+            any_host=args.any_host,
+            allow_remote=args.allow_remote,
+            mac_cache=True,
+        )
+    except ValueError as exc:
+        sys.exit("{} (--allow-remote to listen there anyway)".format(exc))
+    server.warm_up()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+def format_program(program):
+    import datetime
+
+    return "{} - {}  {}".format(
+        datetime.datetime.fromtimestamp(program.start).strftime("%H:%M"),
+        datetime.datetime.fromtimestamp(program.end).strftime("%H:%M"),
+        program.name,
+    )
+
+
+def run_guide(args):
+    import datetime
+    from liveboxplaytv.guide import get_program_guide
+
+    guide = get_program_guide()
+    at = None
+    if args.at:
+        at = datetime.datetime.combine(
+            datetime.date.today(), datetime.datetime.strptime(args.at, "%H:%M").time()
+        )
+    if args.CHANNEL:
+        if args.refresh:
+            guide.refresh([args.CHANNEL], force=True)
+        if at is not None:
+            program = guide.get_program(args.CHANNEL, at=at)
+            return format_program(program) if program else None
+        return "\n".join(format_program(p) for p in guide.get_programs(args.CHANNEL))
+    guide.refresh(force=args.refresh)
+    return "\n".join(
+        "{:<24} {}".format(name, format_program(program))
+        for name, program in guide.now_playing(at).items()
+    )
+
+
+def is_wake_up(args):
+    """Whether the action may target boxes in deep standby (no connect)"""
+    return args.action == "on" and args.wol
+
+
+def uses_mac_cache(args):
+    """
+    Whether the action reads or saves the MAC address of the box: only
+    power commands do, to wake it up from deep standby later on
+    """
+    return args.action in ("on", "off")
+
+
+def uses_daemon(args):
+    """The daemon is only tried when asked for, it costs a connect otherwise"""
+    if args.no_daemon:
+        return False
+    return args.daemon or bool(os.environ.get("LIVEBOXPLAYTV_DAEMON"))
+
+
+def run_fleet(hosts, args):
+    from liveboxplaytv.fleet import LiveboxFleet
+
+    with LiveboxFleet(
+        hosts, mac_cache=True if uses_mac_cache(args) else None, lazy=is_wake_up(args)
+    ) as fleet:
+        results = fleet.broadcast(run_action, args)
+    return {
+        host: res.result if res.error is None else "ERROR: {}".format(res.error)
+        for host, res in results.items()
+    }
+
+
+def format_stats(summary):
+    lines = []
+    for host, operations in sorted(summary["requests"].items()):
+        for operation, stats in sorted(operations.items()):
+            lines.append(
+                "{} op={} count={} p50={:.1f}ms p90={:.1f}ms p99={:.1f}ms "
+                "errors={} timeouts={} retries={} bytes={}".format(
+                    host,
+                    operation,
+                    stats["count"],
+                    stats["p50"] * 1000,
+                    stats["p90"] * 1000,
+                    stats["p99"] * 1000,
+                    stats["errors"],
+                    stats["timeouts"],
+                    stats["retries"],
+                    stats["bytes"],
+                )
+            )
+    for cache, stats in sorted(summary["caches"].items()):
+        lines.append(
+            "cache={} hits={} misses={}".format(cache, stats["hits"], stats["misses"])
+        )
+    for name, hosts in sorted(summary["histograms"].items()):
+        for host, stats in sorted(hosts.items(), key=lambda item: str(item[0])):
+            lines.append(
+                "{} {} count={} p50={:.2f}s p90={:.2f}s max={:.2f}s".format(
+                    host, name, stats["count"], stats["p50"], stats["p90"], stats["max"]
+                )
+            )
+    return "\n".join(lines)
+
+
+def daemon_stats():
+    """Metrics collected by the running daemon"""
+    from liveboxplaytv.server import DaemonClient
+
+    daemon = DaemonClient()
+    if not daemon.is_running():
+        sys.exit(
+            "No daemon running on {}:{}: start one with 'serve', "
+            "or probe the boxes with 'stats -n N'".format(*daemon.address)
+        )
+    try:
+        return daemon.call("GET", "/stats")
+    finally:
+        daemon.close()
+
+
+def run_stats(args):
+    from liveboxplaytv.fleet import LiveboxFleet
+    from liveboxplaytv.metrics import MetricsCollector, add_observer, remove_observer
+
+    if args.count is None:
+        stats = daemon_stats()
+        if args.prometheus:
+            return stats["prometheus"].rstrip()
+        if args.json:
+            return stats["summary"]
+        return format_stats(stats["summary"])
+    collector = add_observer(MetricsCollector())
+    try:
+        with LiveboxFleet(args.hostname, lazy=True) as fleet:
+            for host in args.hostname:
+                client = fleet.client(host)
+                for _ in range(args.count):
+                    try:
+                        client.refresh()
+                    except Exception as exc:
+                        logging.debug("Probe of %s failed: %s", host, exc)
+    finally:
+        remove_observer(collector)
+    if args.prometheus:
+        return collector.to_prometheus().rstrip()
+    if args.json:
+        return collector.summary()
+    return format_stats(collector.summary())
+
+
+def run_discover(args):
+    from liveboxplaytv.discovery import DEFAULT_PORT, discover, get_discovery_cache
+
+    if args.cached:
+        boxes = get_discovery_cache().boxes()
+    else:
+        boxes = discover(
+            network=args.network,
+            ports=args.port or (DEFAULT_PORT,),
+            ssdp=not args.no_ssdp,
+        )
+    output = []
+    for box in boxes:
         if args.json:
+            output.append({k: v for k, v in box._asdict().items() if k != "info"})
+        else:
+            # Print them as they are found
+            print(
+                "{} {}:{} {} ({})".format(
+                    box.mac, box.host, box.port, box.name, box.source
+                )
+            )
+    return output
+
+
+def main():
+    args = parse_args()
+    if args.debug:
+        logging.basicConfig(level=logging.DEBUG)
+
+    if args.action == "channel" and args.CHANNEL and args.CHANNEL.lower() == "list":
+        # The lineup is local, no need to reach the box
+        client = LiveboxPlayTv(args.hostname[0], lazy=True)
+        output = client.get_channel_names(args.json)
+    elif args.action == "guide":
+        output = run_guide(args)
+    elif args.action == "discover":
+        output = run_discover(args)
+    elif args.action == "stats":
+        output = run_stats(args)
+    elif args.action == "serve":
+        return run_serve(args)
+    elif len(args.hostname) > 1:
+        output = run_fleet(args.hostname, args)
+    else:
+        res = run_daemon(args.hostname[0], args) if uses_daemon(args) else None
+        if res is not None:
+            output = res[0]
+        else:
+            # Remember the MAC address of the box for on --wol
+            client = LiveboxPlayTv(
+                args.hostname[0],
+                mac_cache=True if uses_mac_cache(args) else None,
+                lazy=is_wake_up(args),
+            )
+            output = run_action(client, args)
+
+    if output:
+        if args.json and not isinstance(output, str):
             from pprint import pprint
 
             pprint(output)
+        elif isinstance(output, dict) and len(args.hostname or ()) > 1:
+            for host, host_output in output.items():
+                print("{}: {}".format(host, host_output))
         else:
             print(output)
 
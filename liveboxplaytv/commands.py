@@ -0,0 +1,192 @@
+# coding: utf-8
+"""
+Serialized command queue of a box.
+
+Commands are sent one at a time, in order, from a worker thread, and each
+submission returns a concurrent.futures.Future. Commands superseded while
+they wait are coalesced:
+
+- a tune (set_channel, set_epg_id) followed by another one is replaced by it
+- consecutive volume steps add up to a single delta (VOL+ x3 and VOL- x1
+  send VOL+ twice, VOL+ then VOL- sends nothing)
+
+Tunes and volume steps are debounced: they are only sent once no other
+command came to replace them for debounce seconds.
+"""
+
+from collections import deque
+from concurrent.futures import Future
+import logging
+import threading
+import time
+
+
+_LOGGER = logging.getLogger(__name__)
+
+TUNE = "tune"
+VOLUME = "volume"
+KEY = "key"
+
+COALESCED = (TUNE, VOLUME)
+
+
+class _Command(object):
+    __slots__ = ("kind", "value", "futures")
+
+    def __init__(self, kind, value, future):
+        self.kind = kind
+        self.value = value
+        self.futures = [future]
+
+    def merge(self, value, future):
+        if self.kind == VOLUME:
+            self.value += value
+        else:
+            self.value = value
+        self.futures.append(future)
+
+
+class CommandQueue(object):
+    """Command queue of a client, see the module docstring"""
+
+    def __init__(self, client, debounce=0.05, pace=None):
+        self.client = client
+        self.debounce = debounce
+        # Delay between the key presses of a volume delta
+        self.pace = pace
+        self.sent = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self._pending = deque()
+        self._busy = False
+        self._last_change = 0
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+
+    @property
+    def depth(self):
+        """Number of commands waiting to be sent"""
+        return len(self._pending)
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "busy": self._busy,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "max_depth": self.max_depth,
+        }
+
+    def submit(self, kind, value):
+        future = Future()
+        with self._cond:
+            if self._stop:
+                raise RuntimeError("The command queue is closed")
+            tail = self._pending[-1] if self._pending else None
+            if tail is not None and tail.kind == kind and kind in COALESCED:
+                tail.merge(value, future)
+                self.coalesced += 1
+            else:
+                self._pending.append(_Command(kind, value, future))
+                self.max_depth = max(self.max_depth, len(self._pending))
+            self._last_change = time.monotonic()
+            self._cond.notify_all()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="liveboxplaytv-commands-{}".format(self.client.hostname),
+                    daemon=True,
+                )
+                self._thread.start()
+        return future
+
+    def set_channel(self, channel):
+        # Resolve now: a typo fails right away rather than in the worker
+        return self.submit(TUNE, self.client.get_channel_epg_id(channel))
+
+    def set_epg_id(self, epg_id):
+        return self.submit(TUNE, epg_id)
+
+    def volume(self, delta):
+        return self.submit(VOLUME, delta)
+
+    def volume_up(self, steps=1):
+        return self.submit(VOLUME, steps)
+
+    def volume_down(self, steps=1):
+        return self.submit(VOLUME, -steps)
+
+    def press_key(self, key, mode=0):
+        return self.submit(KEY, (key, mode))
+
+    def join(self, timeout=None):
+        """Wait until every queued command was sent"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        """Send the queued commands and stop the worker"""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _next(self):
+        with self._cond:
+            while True:
+                if not self._pending:
+                    if self._stop:
+                        return
+                    self._cond.wait()
+                    continue
+                head = self._pending[0]
+                if head.kind in COALESCED and len(self._pending) == 1:
+                    # Might still be superseded
+                    remaining = self._last_change + self.debounce - time.monotonic()
+                    if remaining > 0 and not self._stop:
+                        self._cond.wait(remaining)
+                        continue
+                self._busy = True
+                return self._pending.popleft()
+
+    def _run(self):
+        while True:
+            command = self._next()
+            if command is None:
+                return
+            try:
+                result = self._execute(command)
+            except Exception as exc:
+                _LOGGER.warning("Command %s failed: %s", command.kind, exc)
+                for future in command.futures:
+                    future.set_exception(exc)
+            else:
+                for future in command.futures:
+                    future.set_result(result)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _execute(self, command):
+        if command.kind == TUNE:
+            self.sent += 1
+            return self.client.set_epg_id(command.value)
+        if command.kind == VOLUME:
+            if not command.value:
+                _LOGGER.debug("Volume steps cancel out, nothing to send")
+                return
+            key = "VOL+" if command.value > 0 else "VOL-"
+            self.sent += abs(command.value)
+            return self.client.press_keys([key] * abs(command.value), pace=self.pace)
+        key, mode = command.value
+        self.sent += 1
+        return self.client.press_key(key, mode)
@@ -0,0 +1,306 @@
+# coding: utf-8
+"""
+Find the Livebox Play decoders of the LAN.
+
+Candidates come from an SSDP (UPnP) M-SEARCH and/or a scan of a subnet,
+each of them is confirmed with a remoteControl info request (operation 10)
+on a bounded thread pool. Boxes are yielded as they answer:
+
+    for box in discover(network="192.168.1.0/24"):
+        print(box.mac, box.host)
+
+Found boxes are cached by MAC address, their stable identity, so that
+they can be found again after their IP address changed.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import ipaddress
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+
+from .utils import get_cache_dir
+
+
+_LOGGER = logging.getLogger(__name__)
+
+SSDP_ADDRESS = ("239.255.255.250", 1900)
+SSDP_SEARCH_TARGET = "ssdp:all"
+DEFAULT_PORT = 8080
+
+DiscoveredBox = namedtuple(
+    "DiscoveredBox", ["mac", "host", "port", "name", "source", "seen", "info"]
+)
+
+
+def ssdp_search(timeout=2, address=SSDP_ADDRESS, st=SSDP_SEARCH_TARGET, mx=1):
+    """
+    Send an M-SEARCH and yield (host, headers) for every answer received
+    within timeout seconds.
+    """
+    message = "\r\n".join(
+        [
+            "M-SEARCH * HTTP/1.1",
+            "HOST: {}:{}".format(*address),
+            'MAN: "ssdp:discover"',
+            "MX: {}".format(mx),
+            "ST: {}".format(st),
+            "",
+            "",
+        ]
+    ).encode("ascii")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+        sock.sendto(message, address)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                data, (host, _) = sock.recvfrom(4096)
+            except socket.timeout:
+                break
+            headers = {}
+            for line in data.decode("utf-8", "replace").split("\r\n")[1:]:
+                name, sep, value = line.partition(":")
+                if sep:
+                    headers[name.strip().upper()] = value.strip()
+            yield host, headers
+    except OSError as exc:
+        _LOGGER.warning("SSDP search failed: %s", exc)
+    finally:
+        sock.close()
+
+
+def local_network(prefix=24):
+    """The /24 of the interface used to reach the LAN, eg. 192.168.1.0/24"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # No packet is sent, this only selects the outgoing interface
+        sock.connect(("10.255.255.255", 1))
+        ip = sock.getsockname()[0]
+    finally:
+        sock.close()
+    return ipaddress.ip_network("{}/{}".format(ip, prefix), strict=False)
+
+
+def probe(host, port=DEFAULT_PORT, timeout=(0.5, 1.5), session=None):
+    """Confirm that host:port is a Livebox Play, returns its info or None"""
+    if session is None:
+        import requests as session
+
+    url = "http://{}:{}/remoteControl/cmd".format(host, port)
+    try:
+        resp = session.get(url, params={"operation": "10"}, timeout=timeout)
+        data = resp.json()["result"]["data"]
+    except Exception as exc:
+        _LOGGER.debug("%s:%s is not a Livebox Play: %s", host, port, exc)
+        return
+    if isinstance(data, dict) and "macAddress" in data:
+        return data
+
+
+class DiscoveryCache(object):
+    """Boxes found so far, keyed by MAC address, stored as JSON"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_cache_dir(), "discovery.json")
+        self._boxes = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except (IOError, ValueError):
+            return
+        self._boxes = {
+            mac: DiscoveredBox(**dict(box, info=None))
+            for mac, box in data.get("boxes", {}).items()
+        }
+
+    def save(self):
+        with self._lock:
+            data = {
+                "version": 1,
+                "boxes": {
+                    mac: {k: v for k, v in box._asdict().items() if k != "info"}
+                    for mac, box in self._boxes.items()
+                },
+            }
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as fp:
+                json.dump(data, fp)
+            os.replace(tmp, self.path)
+
+    def update(self, box, save=True):
+        """Remember box, and write the cache unless save is False"""
+        with self._lock:
+            self._boxes[box.mac] = box
+        if save:
+            self.save()
+
+    def get(self, mac):
+        return self._boxes.get(mac.lower())
+
+    def find(self, host, port=None):
+        """Last known box at this address"""
+        for box in self._boxes.values():
+            if box.host == host and port in (None, box.port):
+                return box
+
+    def boxes(self):
+        return sorted(self._boxes.values(), key=lambda box: box.seen, reverse=True)
+
+    def __iter__(self):
+        return iter(self.boxes())
+
+    def __len__(self):
+        return len(self._boxes)
+
+
+def _hosts(network):
+    if isinstance(network, str):
+        network = ipaddress.ip_network(network, strict=False)
+    if network.num_addresses == 1:
+        return [str(network.network_address)]
+    return [str(ip) for ip in network.hosts()]
+
+
+def discover(
+    network=None,
+    ports=(DEFAULT_PORT,),
+    ssdp=True,
+    ssdp_timeout=2,
+    ssdp_address=SSDP_ADDRESS,
+    timeout=(0.5, 1.5),
+    max_workers=128,
+    cache=None,
+):
+    """
+    Yield a DiscoveredBox for every Livebox Play found, as soon as it
+    answered. network (eg. "192.168.1.0/24", or "auto" for the local /24)
+    enables the subnet scan. The boxes found are written to the cache
+    once the scan is over (or stopped), unless cache is False.
+    """
+    import requests
+
+    if cache is None:
+        cache = get_discovery_cache()
+    results = queue.Queue()
+    submitted = set()
+    futures = []
+    found = False
+    pending = [0]
+    lock = threading.Lock()
+    # One session (connection pool) per worker thread
+    local = threading.local()
+
+    def check(host, port, source):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        info = probe(host, port, timeout, session)
+        if info is None:
+            return
+        return DiscoveredBox(
+            mac=info["macAddress"].lower(),
+            host=host,
+            port=port,
+            name=info.get("friendlyName"),
+            source=source,
+            seen=time.time(),
+            info=info,
+        )
+
+    def submit(host, source):
+        for port in ports:
+            with lock:
+                if (host, port) in submitted:
+                    continue
+                submitted.add((host, port))
+                pending[0] += 1
+            try:
+                future = executor.submit(check, host, port, source)
+            except RuntimeError:
+                # The consumer stopped iterating, the pool is shut down
+                return
+            futures.append(future)
+            future.add_done_callback(results.put)
+
+    def search():
+        try:
+            for host, headers in ssdp_search(ssdp_timeout, ssdp_address):
+                _LOGGER.debug("SSDP answer from %s: %s", host, headers.get("SERVER"))
+                submit(host, "ssdp")
+        finally:
+            # Wakes up the consumer once the search is over
+            results.put(None)
+
+    executor = ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="liveboxplaytv-discovery"
+    )
+    searching = False
+    try:
+        if ssdp:
+            searching = True
+            threading.Thread(
+                target=search, name="liveboxplaytv-ssdp", daemon=True
+            ).start()
+        if network is not None:
+            if network == "auto":
+                network = local_network()
+            for host in _hosts(network):
+                submit(host, "scan")
+        while True:
+            with lock:
+                if not searching and not pending[0]:
+                    break
+            future = results.get()
+            if future is None:
+                searching = False
+                continue
+            with lock:
+                pending[0] -= 1
+            box = future.result()
+            if box is None:
+                continue
+            _LOGGER.info(
+                "Found %s (%s) at %s:%s", box.name, box.mac, box.host, box.port
+            )
+            if cache is not False:
+                cache.update(box, save=False)
+                found = True
+            yield box
+    finally:
+        # Not shutdown(cancel_futures=True), which needs Python 3.9
+        with lock:
+            for future in futures:
+                future.cancel()
+        executor.shutdown(wait=False)
+        if found:
+            try:
+                cache.save()
+            except (IOError, OSError) as exc:
+                _LOGGER.warning("Could not save the discovery cache: %s", exc)
+
+
+_DEFAULT_CACHE = None
+_DEFAULT_CACHE_LOCK = threading.Lock()
+
+
+def get_discovery_cache():
+    global _DEFAULT_CACHE
+    with _DEFAULT_CACHE_LOCK:
+        if _DEFAULT_CACHE is None:
+            _DEFAULT_CACHE = DiscoveryCache()
+        return _DEFAULT_CACHE
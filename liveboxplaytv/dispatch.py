@@ -0,0 +1,116 @@
+# coding: utf-8
+"""
+Fire-and-forget commands:
+
+    future = box.nowait.press_key("OK")     # returns right away
+    future.result()["result"]["responseCode"]
+
+Commands run on a small executor of the client (a single worker by
+default, which keeps them in order). The box answer is only decoded when
+the result is read, errors are raised by future.result(). In asyncio code,
+await asyncio.wrap_future(future).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+from .keys import KEYS
+
+
+_LOGGER = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LazyResponse(object):
+    """Box answer, decoded on first access"""
+
+    __slots__ = ("response", "_data")
+
+    def __init__(self, response):
+        self.response = response
+        self._data = _MISSING
+
+    @property
+    def status_code(self):
+        return self.response.status_code
+
+    @property
+    def data(self):
+        if self._data is _MISSING:
+            self._data = self.response.json()
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def __repr__(self):
+        return "<LazyResponse [{}]>".format(self.status_code)
+
+
+class Dispatcher(object):
+    """Run the commands of a client in the background, see the module docstring"""
+
+    def __init__(self, client, max_workers=1):
+        self.client = client
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="liveboxplaytv-dispatch-{}".format(client.hostname),
+        )
+
+    def submit(self, func, *args, **kwargs):
+        return self._executor.submit(self._call, func, args, kwargs)
+
+    @staticmethod
+    def _call(func, args, kwargs):
+        result = func(*args, **kwargs)
+        if hasattr(result, "status_code") and hasattr(result, "json"):
+            # requests.Response (or RawResponse), from a decode=False call
+            return LazyResponse(result)
+        return result
+
+    def press_key(self, key, mode=0):
+        if isinstance(key, str):
+            # Fail in the caller rather than in the future
+            assert key in KEYS, "No such key: {}".format(key)
+        return self.submit(self.client.press_key, key, mode, decode=False)
+
+    def set_epg_id(self, epg_id):
+        return self.submit(self.client.set_epg_id, epg_id, decode=False)
+
+    def set_channel(self, channel):
+        return self.set_epg_id(self.client.get_channel_epg_id(channel))
+
+    def volume_up(self):
+        return self.press_key("VOL+")
+
+    def volume_down(self):
+        return self.press_key("VOL-")
+
+    def mute(self):
+        return self.press_key("MUTE")
+
+    def channel_up(self):
+        return self.press_key("CH+")
+
+    def channel_down(self):
+        return self.press_key("CH-")
+
+    def play_pause(self):
+        return self.press_key("PLAY/PAUSE")
+
+    def press_keys(self, macro, pace=None, stop_on_error=True):
+        return self.submit(self.client.press_keys, macro, pace, stop_on_error)
+
+    def turn_on(self):
+        return self.submit(self.client.turn_on)
+
+    def turn_off(self):
+        return self.submit(self.client.turn_off)
+
+    def close(self, wait=True):
+        """Stop the executor, by default once the pending commands are sent"""
+        self._executor.shutdown(wait=wait)
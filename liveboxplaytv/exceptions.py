@@ -0,0 +1,43 @@
+# coding: utf-8
+
+
+class LiveboxPlayTvError(Exception):
+    pass
+
+
+class ChannelNotFoundError(LiveboxPlayTvError, ValueError):
+    def __init__(self, query, best=None, score=0.0):
+        self.query = query
+        self.best = best
+        self.score = score
+        msg = "No channel matching {!r}".format(query)
+        if best is not None:
+            msg += " (closest: {!r}, score {:.2f})".format(best.name, score)
+        super(ChannelNotFoundError, self).__init__(msg)
+
+
+class HostUnavailableError(LiveboxPlayTvError, ConnectionError):
+    """Raised without any I/O while the circuit of a host is open"""
+
+    def __init__(self, host, retry_in=0, last_error=None):
+        self.host = host
+        self.retry_in = retry_in
+        self.last_error = last_error
+        msg = "{} is unavailable (retry in {:.0f}s)".format(host, retry_in)
+        if last_error is not None:
+            msg += ": {}".format(last_error)
+        super(HostUnavailableError, self).__init__(msg)
+
+
+class CommandTimeoutError(LiveboxPlayTvError, TimeoutError):
+    """The box did not reach the expected state in time"""
+
+    def __init__(self, host, operation, timeout, state=None):
+        self.host = host
+        self.operation = operation
+        self.timeout = timeout
+        # Last LiveboxState read, None if the box never answered
+        self.state = state
+        super(CommandTimeoutError, self).__init__(
+            "{}: {} not confirmed within {}s".format(host, operation, timeout)
+        )
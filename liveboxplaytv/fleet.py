@@ -0,0 +1,245 @@
+# coding: utf-8
+
+
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import logging
+import math
+import threading
+import time
+
+from .health import CircuitBreaker
+from .liveboxplaytv import LiveboxPlayTv, max_request_time
+
+
+_LOGGER = logging.getLogger(__name__)
+
+FleetResult = namedtuple("FleetResult", ["host", "result", "error"])
+
+
+class LiveboxFleet(object):
+    """
+    Run operations on many boxes concurrently, on a bounded thread pool.
+
+    Clients are created lazily, in the worker threads, so that a box which
+    is down does not hold back the others. Hosts may be given as
+    "host:port". Each broadcast returns a {host: FleetResult} dict.
+
+    Each host has its own circuit breaker, kept across client creation
+    attempts: once a host is known to be down, operations on it fail
+    immediately until it answers a probe again.
+    """
+
+    def __init__(
+        self,
+        hosts,
+        max_workers=16,
+        timeout=3,
+        failure_threshold=3,
+        reset_timeout=30,
+        **client_kwargs
+    ):
+        self.hosts = list(hosts)
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.client_kwargs = client_kwargs
+        self.client_kwargs.setdefault("timeout", timeout)
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._host_locks = {host: threading.Lock() for host in self.hosts}
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        # Running operations per host, their clients are closed when they
+        # end if the fleet was closed in the meantime
+        self._busy = {}
+        self._closed = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="liveboxplaytv-fleet"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def client(self, host, lazy=False):
+        """
+        Get (and create on first use) the client of a host. lazy creates it
+        without connecting to the box, eg. to wake it up.
+        """
+        with self._lock:
+            host_lock = self._host_locks.setdefault(host, threading.Lock())
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(
+                    self.failure_threshold, self.reset_timeout
+                )
+        with host_lock:
+            client = self._clients.get(host)
+            if client is None:
+                kwargs = dict(self.client_kwargs, breaker=breaker)
+                if lazy:
+                    kwargs["lazy"] = True
+                hostname = host
+                if host.count(":") == 1:
+                    # host:port
+                    hostname, port = host.split(":")
+                    kwargs["port"] = int(port)
+                client = LiveboxPlayTv(hostname, **kwargs)
+                self._clients[host] = client
+            return client
+
+    @property
+    def request_time(self):
+        """Worst case duration of a request of the clients"""
+        settings = ("timeout", "connect_timeout", "retries", "backoff_factor")
+        return max_request_time(
+            **{k: v for k, v in self.client_kwargs.items() if k in settings}
+        )
+
+    def _run(self, host, operation, args, kwargs, lazy=False):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The fleet is closed")
+            self._busy[host] = self._busy.get(host, 0) + 1
+        try:
+            client = self.client(host, lazy)
+            if callable(operation):
+                return operation(client, *args, **kwargs)
+            return getattr(client, operation)(*args, **kwargs)
+        finally:
+            client = None
+            with self._lock:
+                self._busy[host] -= 1
+                if not self._busy[host]:
+                    del self._busy[host]
+                    if self._closed:
+                        client = self._clients.pop(host, None)
+            if client is not None:
+                client.close()
+
+    def broadcast(self, operation, *args, **kwargs):
+        """
+        Run an operation on all the hosts. operation is either the name of a
+        LiveboxPlayTv method or a callable taking the client as first
+        argument.
+        """
+        return self._broadcast(operation, args, kwargs)
+
+    def _broadcast(self, operation, args, kwargs, duration=0, lazy=False):
+        """
+        broadcast, for operations which may take up to duration seconds.
+        lazy creates the missing clients without connecting to their box.
+        """
+        hosts = self.hosts
+        # Requests are bounded by the client timeouts and retries: each host
+        # gets the worst case of the client creation and of the operation,
+        # from the moment a worker picks it up. Hosts still queued behind
+        # stuck ones give up once every batch of workers had its budget.
+        budget = 2 * self.request_time + duration
+        batches = math.ceil(len(hosts) / float(self.max_workers))
+        give_up = time.monotonic() + budget * batches
+        started = {}
+
+        def run(host):
+            started[host] = time.monotonic()
+            return self._run(host, operation, args, kwargs, lazy)
+
+        futures = {self._executor.submit(run, host): host for host in hosts}
+        pending = set(futures)
+        timed_out = set()
+        while pending:
+            deadlines = [give_up] + [
+                started[futures[f]] + budget for f in pending if futures[f] in started
+            ]
+            remaining = max(min(deadlines) - time.monotonic(), 0)
+            _, pending = wait(pending, remaining, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future in list(pending):
+                start = started.get(futures[future])
+                if now >= give_up or (start is not None and now >= start + budget):
+                    pending.discard(future)
+                    timed_out.add(future)
+        results = {}
+        for future, host in futures.items():
+            if future in timed_out:
+                future.cancel()
+                if host in started:
+                    message = "{} did not answer within {:.1f}s".format(host, budget)
+                else:
+                    message = "{} was not reached, the workers were busy".format(host)
+                _LOGGER.warning("%s", message)
+                results[host] = FleetResult(host, None, TimeoutError(message))
+            elif future.exception() is not None:
+                _LOGGER.warning(
+                    "%s failed on %s: %s",
+                    getattr(operation, "__name__", operation),
+                    host,
+                    future.exception(),
+                )
+                results[host] = FleetResult(host, None, future.exception())
+            else:
+                results[host] = FleetResult(host, future.result(), None)
+        return results
+
+    def health(self):
+        """{host: health dict} of every host, without any I/O"""
+        result = {}
+        for host in self.hosts:
+            breaker = self._breakers.get(host)
+            result[host] = dict(
+                breaker.health() if breaker is not None else {"state": None},
+                host=host,
+            )
+        return result
+
+    def connect(self):
+        """Create all the clients in parallel"""
+        return self.broadcast(lambda client: client)
+
+    def info(self):
+        return self.broadcast(lambda client: client.info)
+
+    def set_channel(self, channel):
+        return self.broadcast("set_channel", channel)
+
+    def press_key(self, key, mode=0):
+        return self.broadcast("press_key", key, mode=mode)
+
+    def turn_on(self):
+        return self.broadcast("turn_on")
+
+    def turn_off(self):
+        return self.broadcast("turn_off")
+
+    def set_channel_confirmed(self, channel, timeout=10):
+        return self._broadcast(
+            "set_channel_confirmed", (channel,), {"timeout": timeout}, timeout
+        )
+
+    def turn_on_confirmed(self, timeout=30):
+        return self._broadcast("turn_on_confirmed", (), {"timeout": timeout}, timeout)
+
+    def power_on(self, timeout=60, **kwargs):
+        """Turn every box on, waking those in deep standby with Wake-on-LAN"""
+        kwargs["timeout"] = timeout
+        # Boxes in deep standby do not answer, connecting them would fail
+        return self._broadcast("power_on", (), kwargs, timeout, lazy=True)
+
+    def close(self):
+        """
+        Close the clients. Queued operations fail, the clients of the
+        running ones (eg. on a dead host) are closed when they end.
+        """
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            self._closed = True
+            idle = [host for host in self._clients if host not in self._busy]
+            clients = [self._clients.pop(host) for host in idle]
+        for client in clients:
+            client.close()
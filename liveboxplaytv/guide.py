@@ -0,0 +1,335 @@
+# coding: utf-8
+
+
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+from .registry import REGISTRY, Channel
+from .utils import get_cache_dir
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# start and end are UNIX timestamps
+Program = namedtuple(
+    "Program",
+    ["start", "end", "name", "type", "img", "url", "summary"],
+    defaults=(None,),
+)
+
+
+def to_timestamp(value):
+    if value is None:
+        return time.time()
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    return float(value)
+
+
+def make_program(data):
+    """Build a Program from a dict as returned by pyteleloisirs"""
+    return Program(
+        start=to_timestamp(data["start_time"]),
+        end=to_timestamp(data["end_time"]),
+        name=data.get("name"),
+        type=data.get("type"),
+        img=data.get("img"),
+        url=data.get("url"),
+        summary=data.get("summary"),
+    )
+
+
+def program_to_dict(program):
+    """The dict pyteleloisirs returns for a Program (local datetimes)"""
+    return {
+        "name": program.name,
+        "type": program.type,
+        "img": program.img,
+        "url": program.url,
+        "summary": program.summary,
+        "start_time": datetime.datetime.fromtimestamp(program.start),
+        "end_time": datetime.datetime.fromtimestamp(program.end),
+    }
+
+
+class ChannelSchedule(object):
+    """Programs of a channel sorted by start time, for bisect lookups"""
+
+    __slots__ = ("starts", "programs", "updated")
+
+    def __init__(self, programs=(), updated=0):
+        self.programs = sorted(programs)
+        self.starts = [p.start for p in self.programs]
+        self.updated = updated
+
+    def at(self, timestamp):
+        index = bisect_right(self.starts, timestamp) - 1
+        if index >= 0 and self.programs[index].end > timestamp:
+            return self.programs[index]
+
+    def between(self, start, end):
+        first = max(bisect_right(self.starts, start) - 1, 0)
+        last = bisect_left(self.starts, end)
+        return [p for p in self.programs[first:last] if p.end > start]
+
+    def merge(self, programs, updated, retention=0):
+        """
+        Replace the programs overlapping the time span of the new ones, keep
+        the others and drop the ones which ended before retention.
+        """
+        programs = sorted(programs)
+        if programs:
+            span_start, span_end = programs[0].start, programs[-1].end
+            kept = [
+                p
+                for p in self.programs
+                if (p.end <= span_start or p.start >= span_end) and p.end > retention
+            ]
+            programs = kept + programs
+        else:
+            programs = [p for p in self.programs if p.end > retention]
+        return ChannelSchedule(programs, updated)
+
+
+class TeleLoisirsFetcher(object):
+    """Fetch the schedule of a channel with pyteleloisirs"""
+
+    async def __call__(self, channel):
+        from pyteleloisirs import async_get_program_guide
+
+        return await async_get_program_guide(channel.name) or []
+
+
+class StaticFetcher(object):
+    """
+    Serve schedules from a {channel name: [program dict, ...]} mapping or
+    a JSON file with that structure, eg. for tests or offline use.
+    """
+
+    def __init__(self, data):
+        if isinstance(data, str):
+            with open(data) as fp:
+                data = json.load(fp)
+        self.data = data
+
+    async def __call__(self, channel):
+        return self.data.get(channel.name, [])
+
+
+class ProgramGuide(object):
+    """
+    Program guide of the whole lineup, indexed by EPG ID and time.
+
+    Schedules are fetched in bulk with a pluggable async fetcher (pyteleloisirs
+    by default), refreshed incrementally when older than max_age (optionally
+    from a background thread) and persisted to disk.
+    """
+
+    def __init__(
+        self,
+        fetcher=None,
+        registry=REGISTRY,
+        path=None,
+        max_age=4 * 3600,
+        retention=24 * 3600,
+        concurrency=8,
+    ):
+        self.fetcher = fetcher if fetcher is not None else TeleLoisirsFetcher()
+        self.registry = registry
+        self.path = path or os.path.join(get_cache_dir(), "guide.json")
+        self.max_age = max_age
+        self.retention = retention
+        self.concurrency = concurrency
+        self._schedules = {}
+        self._resolver = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.load()
+
+    @property
+    def resolver(self):
+        """Fuzzy matching of channel names, on the lineup of the guide"""
+        if self._resolver is None:
+            from .resolver import RESOLVER, ChannelResolver
+
+            if self.registry is REGISTRY:
+                self._resolver = RESOLVER
+            else:
+                self._resolver = ChannelResolver(self.registry)
+        return self._resolver
+
+    def _channel(self, channel):
+        if isinstance(channel, Channel):
+            return channel
+        if not isinstance(channel, str):
+            chan = self.registry.by_epg_id(channel)
+        else:
+            chan = self.registry.get(channel) or self.registry.by_epg_id(channel)
+        if chan is None:
+            chan = self.resolver.resolve(channel)
+        return chan
+
+    def schedule(self, channel):
+        return self._schedules.get(self._channel(channel).epg_id)
+
+    def is_stale(self, channel, now=None):
+        schedule = self._schedules.get(channel.epg_id)
+        now = time.time() if now is None else now
+        return schedule is None or now - schedule.updated >= self.max_age
+
+    async def async_refresh(self, channels=None, force=False):
+        """Fetch the schedules of the (stale) channels, returns their count"""
+        import asyncio
+
+        if channels is None:
+            channels = [c for c in self.registry if c.epg_id not in (None, "0")]
+        else:
+            channels = [self._channel(c) for c in channels]
+        if not force:
+            channels = [c for c in channels if self.is_stale(c)]
+        if not channels:
+            return 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(channel):
+            async with semaphore:
+                try:
+                    return await self.fetcher(channel)
+                except Exception as exc:
+                    _LOGGER.warning(
+                        "Failed to fetch the guide of %s: %s", channel.name, exc
+                    )
+
+        results = await asyncio.gather(*[fetch(c) for c in channels])
+        now = time.time()
+        retention = now - self.retention
+        with self._lock:
+            schedules = dict(self._schedules)
+            for channel, programs in zip(channels, results):
+                if programs is None:
+                    continue
+                old = schedules.get(channel.epg_id, ChannelSchedule())
+                schedules[channel.epg_id] = old.merge(
+                    [make_program(p) for p in programs], now, retention
+                )
+            self._schedules = schedules
+        # Writing the whole guide would block the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.save)
+        return len(channels)
+
+    def refresh(self, channels=None, force=False):
+        """
+        Blocking version of async_refresh, which get_program and
+        get_programs call for stale schedules: for threads without an
+        event loop, coroutines await async_refresh instead.
+        """
+        import asyncio
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.async_refresh(channels, force))
+        raise RuntimeError(
+            "ProgramGuide.refresh() blocks, await async_refresh() from the "
+            "event loop (or pass fetch=False)"
+        )
+
+    def get_program(self, channel, at=None, fetch=True):
+        """What is on a channel at a given time (now by default)"""
+        chan = self._channel(channel)
+        if fetch and self.is_stale(chan):
+            self.refresh([chan])
+        schedule = self._schedules.get(chan.epg_id)
+        if schedule is not None:
+            return schedule.at(to_timestamp(at))
+
+    def get_programs(self, channel, start=None, end=None, fetch=True):
+        """Programs of a channel between start (now) and end (+1 day)"""
+        chan = self._channel(channel)
+        if fetch and self.is_stale(chan):
+            self.refresh([chan])
+        start = to_timestamp(start)
+        end = start + 24 * 3600 if end is None else to_timestamp(end)
+        schedule = self._schedules.get(chan.epg_id)
+        return schedule.between(start, end) if schedule is not None else []
+
+    def now_playing(self, at=None):
+        """{channel name: Program} for all the channels in the guide"""
+        at = to_timestamp(at)
+        result = {}
+        for chan in self.registry:
+            schedule = self._schedules.get(chan.epg_id)
+            program = schedule.at(at) if schedule is not None else None
+            if program is not None:
+                result[chan.name] = program
+        return result
+
+    def load(self):
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except (IOError, ValueError):
+            return
+        self._schedules = {
+            epg_id: ChannelSchedule([Program(*p) for p in s["programs"]], s["updated"])
+            for epg_id, s in data.get("channels", {}).items()
+        }
+        _LOGGER.debug("Loaded the guide of %s channels", len(self._schedules))
+
+    def save(self):
+        data = {
+            "version": 1,
+            "channels": {
+                epg_id: {"updated": s.updated, "programs": s.programs}
+                for epg_id, s in self._schedules.items()
+            },
+        }
+        tmp = self.path + ".tmp"
+        # Refreshes may save from several threads
+        with self._lock:
+            with open(tmp, "w") as fp:
+                json.dump(data, fp)
+            os.replace(tmp, self.path)
+
+    def start(self, interval=900):
+        """Refresh the stale schedules from a background thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.refresh()
+                except Exception:
+                    _LOGGER.exception("Program guide refresh failed")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(
+            target=run, name="liveboxplaytv-guide", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+_DEFAULT_GUIDE = None
+_DEFAULT_GUIDE_LOCK = threading.Lock()
+
+
+def get_program_guide():
+    global _DEFAULT_GUIDE
+    with _DEFAULT_GUIDE_LOCK:
+        if _DEFAULT_GUIDE is None:
+            _DEFAULT_GUIDE = ProgramGuide()
+        return _DEFAULT_GUIDE
@@ -0,0 +1,96 @@
+# coding: utf-8
+
+
+import logging
+import threading
+import time
+
+
+_LOGGER = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker(object):
+    """
+    Health of a host. The circuit opens after failure_threshold consecutive
+    connection failures or timeouts: requests then fail immediately instead
+    of waiting for the timeout. After reset_timeout seconds, one caller is
+    allowed to probe the host (half-open), the circuit closes again when
+    the probe succeeds.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=30, on_change=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # on_change(old_state, new_state)
+        self.on_change = on_change
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.last_failure = None
+        self.last_success = None
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        old, self.state = self.state, state
+        if old != state:
+            _LOGGER.info("Circuit %s -> %s", old, state)
+            if self.on_change is not None:
+                self.on_change(old, state)
+
+    @property
+    def retry_in(self):
+        """Seconds until the next probe is allowed (0 unless open)"""
+        if self.state != OPEN:
+            return 0
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0)
+
+    def acquire(self):
+        """
+        Returns CLOSED (go ahead), HALF_OPEN (the caller is the one probing
+        the host) or None (rejected).
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return CLOSED
+            if self.state == OPEN and not self.retry_in:
+                self._set_state(HALF_OPEN)
+                return HALF_OPEN
+            # Open, or half-open with a probe in flight
+            return None
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.last_success = time.time()
+            self._set_state(CLOSED)
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            self.last_failure = time.time()
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def reset(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._set_state(CLOSED)
+
+    def health(self):
+        return {
+            "state": self.state,
+            "healthy": self.state == CLOSED,
+            "failures": self.failures,
+            "retry_in": self.retry_in,
+            "last_error": str(self.last_error) if self.last_error else None,
+            "last_failure": self.last_failure,
+            "last_success": self.last_success,
+        }
@@ -0,0 +1,245 @@
+# coding: utf-8
+
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from html.parser import HTMLParser
+from urllib.parse import quote
+import codecs
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from .metrics import emit
+from .registry import REGISTRY
+from .utils import get_cache_dir
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Channel logos rarely change, failed lookups are retried sooner
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_NEGATIVE_TTL = 24 * 3600
+
+WIKI_URL = "https://fr.wikipedia.org/wiki/{}"
+WIKI_TIMEOUT = 10
+WIKI_HEADERS = {
+    "User-Agent": "liveboxplaytv (+https://github.com/pschmitt/python-liveboxplaytv)"
+}
+WIKI_CHUNK_SIZE = 8192
+# What is left of an article after the logo is read up to this size so that
+# the connection goes back to the pool, longer ones are closed instead
+WIKI_DRAIN_SIZE = 128 * 1024
+
+_MISSING = object()
+
+
+class ImageCache(object):
+    """
+    Persistent channel logo cache, stored in a SQLite database and keyed by
+    (channel, image size). A None URL records a failed lookup.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.path = path or os.path.join(get_cache_dir(), "images.sqlite")
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS images ("
+                "channel TEXT, size INTEGER, url TEXT, expires REAL, "
+                "PRIMARY KEY (channel, size))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per operation keeps this thread safe.
+        # Using the connection as a context manager commits (or rolls back)
+        # but does not close it
+        with closing(sqlite3.connect(self.path, timeout=10)) as conn:
+            with conn:
+                yield conn
+
+    def get(self, channel, size, default=_MISSING):
+        """Return the cached URL, or default (a KeyError) on miss/expiry"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT url, expires FROM images WHERE channel = ? AND size = ?",
+                (channel, size),
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            if default is _MISSING:
+                raise KeyError((channel, size))
+            return default
+        return row[0]
+
+    def set(self, channel, size, url):
+        ttl = self.ttl if url else self.negative_ttl
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?)",
+                (channel, size, url, time.time() + ttl),
+            )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM images")
+
+
+_DEFAULT_CACHE = None
+_DEFAULT_CACHE_LOCK = threading.Lock()
+
+
+def get_image_cache():
+    global _DEFAULT_CACHE
+    with _DEFAULT_CACHE_LOCK:
+        if _DEFAULT_CACHE is None:
+            _DEFAULT_CACHE = ImageCache()
+        return _DEFAULT_CACHE
+
+
+def make_wiki_session(pool_size=8):
+    """Keep-alive HTTPS session to Wikipedia, with pool_size connections"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+    return session
+
+
+_WIKI_SESSION = None
+_WIKI_SESSION_LOCK = threading.Lock()
+
+
+def get_wiki_session():
+    """Session shared by the lookups which were not given one"""
+    global _WIKI_SESSION
+    with _WIKI_SESSION_LOCK:
+        if _WIKI_SESSION is None:
+            _WIKI_SESSION = make_wiki_session()
+        return _WIKI_SESSION
+
+
+class LogoParser(HTMLParser):
+    """
+    Incremental parser which stops looking after the first infobox image.
+
+    The former BeautifulSoup lookup kept the last "Image illustrative" <img>
+    of the article. Articles have a single one, the logo in the infobox at
+    the top, so taking the first one gives the same logo without parsing
+    (nor downloading) the rest of the article.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.src = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "img" or self.src is not None:
+            return
+        attrs = dict(attrs)
+        if (attrs.get("alt") or "").startswith("Image illustrative"):
+            self.src = attrs.get("src")
+
+
+def find_logo_src(chunks):
+    """Feed HTML chunks (bytes) until the logo <img> is found"""
+    parser = LogoParser()
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        if parser.src is not None:
+            break
+    return parser.src
+
+
+def resize_image_url(src, img_size):
+    src = re.sub(r"\d+px", "{}px".format(img_size), src)
+    return "https:{}".format(src) if src.startswith("//") else src
+
+
+def fetch_channel_image(channel_info, img_size=300, session=None):
+    """
+    Look up the logo of a channel on Wikipedia, bypassing the cache.
+    The article is streamed and only parsed up to the logo.
+    """
+    if session is None:
+        session = get_wiki_session()
+
+    url = WIKI_URL.format(quote(channel_info.wiki_page.replace(" ", "_")))
+    with session.get(
+        url, headers=WIKI_HEADERS, stream=True, timeout=WIKI_TIMEOUT
+    ) as resp:
+        if resp.status_code == 404:
+            _LOGGER.error("No Wikipedia article for %s", channel_info.name)
+            return
+        resp.raise_for_status()
+        chunks = resp.iter_content(chunk_size=WIKI_CHUNK_SIZE)
+        src = find_logo_src(chunks)
+        for _ in zip(range(WIKI_DRAIN_SIZE // WIKI_CHUNK_SIZE), chunks):
+            pass
+    if src:
+        return resize_image_url(src, img_size)
+
+
+def get_channel_image(
+    channel_info, img_size=300, skip_cache=False, cache=None, session=None
+):
+    """Get the logo URL of a channel (a Channel record of the registry)"""
+    if not channel_info.wiki_page:
+        _LOGGER.debug("Wiki page is not set for channel %s", channel_info.name)
+        return
+    # If there is a max image size defined use it.
+    if channel_info.max_img_size and img_size > channel_info.max_img_size:
+        _LOGGER.info(
+            "Requested image size is bigger than the max, setting it to %s",
+            channel_info.max_img_size,
+        )
+        img_size = channel_info.max_img_size
+
+    if cache is None:
+        cache = get_image_cache()
+    if not skip_cache:
+        try:
+            img = cache.get(channel_info.name, img_size)
+            _LOGGER.debug(
+                "Cache hit: %s (%spx) -> %s", channel_info.name, img_size, img
+            )
+            emit("on_cache", "images", True)
+            return img
+        except KeyError:
+            emit("on_cache", "images", False)
+
+    _LOGGER.debug("Query: %s", channel_info.wiki_page)
+    # A missing article or logo is cached as well (negative caching)
+    img = fetch_channel_image(channel_info, img_size, session)
+    cache.set(channel_info.name, img_size, img)
+    return img
+
+
+def prefetch_channel_images(registry=REGISTRY, img_size=300, max_workers=8, cache=None):
+    """
+    Warm the cache with the logos of every channel of the lineup.
+    Returns a {channel name: URL} dict.
+    """
+    if cache is None:
+        cache = get_image_cache()
+    channels = [c for c in registry if c.wiki_page]
+    # One connection per worker, kept alive from one article to the next
+    session = make_wiki_session(max_workers)
+
+    def fetch(channel_info):
+        try:
+            return get_channel_image(
+                channel_info, img_size, cache=cache, session=session
+            )
+        except Exception:
+            _LOGGER.exception("Failed to prefetch the image of %s", channel_info.name)
+
+    with session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        images = executor.map(fetch, channels)
+        return {c.name: img for c, img in zip(channels, images)}
@@ -0,0 +1,288 @@
+# coding: utf-8
+"""
+Channel lineup sync from the Orange rendezvous API.
+
+The API payload is parsed into the CHANNELS format, diffed against the
+current lineup and loaded into the channel registry. The result is saved
+as a compiled (marshal) cache, which loads faster than the Python literal:
+the default registry loads it on first use, until the next sync.
+
+    sync = get_lineup_sync()
+    sync.start()
+"""
+
+from collections import namedtuple
+import json
+import logging
+import marshal
+import os
+import threading
+import time
+import weakref
+
+from .registry import REGISTRY, Channel, make_channel
+from .utils import get_cache_dir
+
+
+_LOGGER = logging.getLogger(__name__)
+
+ORANGE_API_URL = "http://lsm-rendezvous040413.orange.fr/API/?output=json&withChannels=1"
+
+CACHE_VERSION = 1
+
+LineupDiff = namedtuple("LineupDiff", ["added", "removed", "changed"])
+
+# Candidate keys of the API channel objects, in order of preference
+_EPG_ID_KEYS = ("epgId", "epg_id", "id", "serviceId")
+_NUMBER_KEYS = ("number", "lcn", "zappingNumber", "channelNumber", "index")
+_NAME_KEYS = ("name", "title", "label")
+
+
+class HttpSource(object):
+    """Fetch the lineup from the Orange API, with ETag revalidation"""
+
+    def __init__(self, url=ORANGE_API_URL, session=None, timeout=10):
+        self.url = url
+        self.session = session
+        self.timeout = timeout
+
+    def __call__(self, etag=None):
+        """Return (payload, etag), payload is None when not modified"""
+        session = self.session
+        if session is None:
+            import requests as session
+
+        headers = {"If-None-Match": etag} if etag else {}
+        resp = session.get(self.url, headers=headers, timeout=self.timeout)
+        if resp.status_code == 304:
+            return None, etag
+        resp.raise_for_status()
+        return resp.json(), resp.headers.get("ETag")
+
+
+class FileSource(object):
+    """Read a saved API payload, eg. for offline use or tests"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, etag=None):
+        mtime = str(os.path.getmtime(self.path))
+        if etag == mtime:
+            return None, etag
+        with open(self.path) as fp:
+            return json.load(fp), mtime
+
+
+def _first(data, keys):
+    for key in keys:
+        value = data.get(key)
+        if value not in (None, ""):
+            return str(value)
+
+
+def _find_channels(payload):
+    """Locate the list of channel objects in the API payload"""
+    if isinstance(payload, list):
+        return payload
+    if not isinstance(payload, dict):
+        return []
+    for key in ("channels", "channel", "data", "result"):
+        if key in payload:
+            found = _find_channels(payload[key])
+            if found:
+                return found
+    return []
+
+
+def parse_lineup(payload, reference=REGISTRY):
+    """
+    Turn an API payload into channel dicts (CHANNELS format). The wiki page,
+    max image size and aliases are carried over from the reference lineup.
+    """
+    channels = [
+        {"epg_id": None, "index": "-1", "name": "N/A", "wiki_page": None},
+    ]
+    for item in _find_channels(payload):
+        if not isinstance(item, dict):
+            continue
+        epg_id = _first(item, _EPG_ID_KEYS)
+        name = _first(item, _NAME_KEYS)
+        if epg_id is None or name is None:
+            continue
+        known = reference.by_epg_id(epg_id) or reference.by_name(name)
+        channel = {
+            "epg_id": epg_id,
+            "index": _first(item, _NUMBER_KEYS) or (known.index if known else ""),
+            "name": name,
+            "wiki_page": known.wiki_page if known else name,
+        }
+        if known is not None:
+            if known.max_img_size:
+                channel["max_img_size"] = known.max_img_size
+            aliases = set(known.aliases)
+            if known.name != name:
+                # Renamed channel: the former name remains an alias
+                aliases.add(known.name)
+            if aliases:
+                channel["aliases"] = sorted(aliases)
+        channels.append(channel)
+    return channels
+
+
+def diff_lineup(old, new):
+    """Compare two lineups (Channel records or dicts), keyed by EPG ID"""
+    old = {c.epg_id: c for c in map(make_channel, old)}
+    new = {c.epg_id: c for c in map(make_channel, new)}
+    return LineupDiff(
+        added=[new[k] for k in new if k not in old],
+        removed=[old[k] for k in old if k not in new],
+        changed=[
+            (old[k], new[k])
+            for k in new
+            if k in old and (old[k].name, old[k].index) != (new[k].name, new[k].index)
+        ],
+    )
+
+
+def save_compiled(path, channels, etag=None, fetched=None):
+    data = {
+        "version": CACHE_VERSION,
+        "etag": etag,
+        "fetched": fetched if fetched is not None else time.time(),
+        "channels": tuple(tuple(make_channel(c)) for c in channels),
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fp:
+        fp.write(marshal.dumps(data))
+    os.replace(tmp, path)
+
+
+def get_lineup_path():
+    return os.path.join(get_cache_dir(), "lineup.marshal")
+
+
+def load_cached_lineup(path=None):
+    """Channels of the last sync, from the compiled cache, or None"""
+    try:
+        cached = load_compiled(path or get_lineup_path())
+    except OSError as exc:
+        # eg. no cache directory
+        _LOGGER.debug("No lineup cache: %s", exc)
+        return
+    if cached is not None:
+        return cached[0]
+
+
+def load_compiled(path):
+    """Return the cached (channels, etag, fetched time), or None"""
+    try:
+        # marshal.loads() on the whole file is much faster than marshal.load()
+        with open(path, "rb") as fp:
+            data = marshal.loads(fp.read())
+    except (IOError, EOFError, ValueError, TypeError):
+        return
+    if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+        return
+    channels = [Channel._make(c) for c in data["channels"]]
+    return channels, data.get("etag"), data.get("fetched", 0)
+
+
+class LineupSync(object):
+    """Keep a channel registry in sync with the Orange lineup"""
+
+    def __init__(self, registry=REGISTRY, source=None, path=None, max_age=24 * 3600):
+        self.registry = registry
+        self.source = source if source is not None else HttpSource()
+        self.path = path or get_lineup_path()
+        self.max_age = max_age
+        self.etag = None
+        self.fetched = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def age(self):
+        return time.time() - self.fetched
+
+    def load(self):
+        """Load the compiled cache into the registry, if there is one"""
+        cached = load_compiled(self.path)
+        if cached is None:
+            return False
+        channels, self.etag, self.fetched = cached
+        self.registry.load(channels)
+        _LOGGER.debug("Loaded %s channels from %s", len(channels), self.path)
+        return True
+
+    def sync(self, force=False, source=None):
+        """
+        Fetch the lineup (from source, self.source by default) if the cache
+        is older than max_age (or forced) and load it into the registry.
+        Returns a LineupDiff, or None when nothing was fetched.
+        """
+        if not force and self.age < self.max_age:
+            return
+        source = self.source if source is None else source
+        payload, etag = source(None if force else self.etag)
+        self.fetched = time.time()
+        if payload is None:
+            _LOGGER.debug("Lineup not modified")
+            save_compiled(self.path, self.registry, self.etag, self.fetched)
+            return LineupDiff([], [], [])
+        channels = parse_lineup(payload, self.registry)
+        if len(channels) <= 1:
+            _LOGGER.warning("No channels found in the lineup payload, ignoring it")
+            return
+        diff = diff_lineup(self.registry, channels)
+        _LOGGER.info(
+            "Lineup sync: %s added, %s removed, %s changed",
+            len(diff.added),
+            len(diff.removed),
+            len(diff.changed),
+        )
+        self.registry.load(channels)
+        self.etag = etag
+        save_compiled(self.path, self.registry, etag, self.fetched)
+        return diff
+
+    def start(self, interval=3600):
+        """Sync from a background thread, whenever the cache gets too old"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.sync()
+                except Exception:
+                    _LOGGER.exception("Lineup sync failed")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(
+            target=run, name="liveboxplaytv-lineup", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+_SYNCS = weakref.WeakKeyDictionary()
+_SYNCS_LOCK = threading.Lock()
+
+
+def get_lineup_sync(registry=REGISTRY):
+    """
+    The LineupSync of a registry, loaded from the cache on first use, so
+    that its ETag and fetch time are kept from one sync to the next.
+    """
+    with _SYNCS_LOCK:
+        sync = _SYNCS.get(registry)
+        if sync is None:
+            sync = _SYNCS[registry] = LineupSync(registry)
+            sync.load()
+        return sync
@@ -3,37 +3,248 @@
 
 
 from collections import OrderedDict
-import asyncio
+from contextlib import contextmanager
 import json
 import logging
-import requests
+import threading
 import time
 
-from fuzzywuzzy import process
-
-from .channels import CHANNELS
+from .exceptions import (
+    CommandTimeoutError,
+    HostUnavailableError,
+    LiveboxPlayTvError,
+)
+from .health import CLOSED, OPEN, CircuitBreaker
 from .keys import KEYS
+from .metrics import OBSERVERS, Histogram, emit
+from .registry import REGISTRY
+from .resolver import ChannelResolver, RESOLVER
+from .state import LiveboxState
 
 
 _LOGGER = logging.getLogger(__name__)
 
+# Per operation timeouts, a (connect, read) tuple or a read timeout.
+# The notifyEvent long polling has no read timeout, circuit probes are short.
+DEFAULT_TIMEOUTS = {"notify": None, "probe": 1}
+
+
+def max_request_time(timeout=3, connect_timeout=None, retries=2, backoff_factor=0.1):
+    """
+    Worst case duration of a request with these client settings: every
+    connection attempt times out, with the retry backoff in between, then
+    the read times out.
+    """
+    connect = timeout if connect_timeout is None else connect_timeout
+    backoff = backoff_factor * (2**retries - 1)
+    return (retries + 1) * connect + backoff + timeout
+
 
 class LiveboxPlayTv(object):
-    def __init__(self, hostname, port=8080, timeout=3, refresh_frequency=60):
+    def __init__(
+        self,
+        hostname,
+        port=8080,
+        timeout=3,
+        connect_timeout=None,
+        timeouts=None,
+        refresh_frequency=60,
+        pool_size=4,
+        retries=2,
+        backoff_factor=0.1,
+        registry=None,
+        image_cache=None,
+        guide=None,
+        observers=None,
+        breaker=None,
+        failure_threshold=3,
+        reset_timeout=30,
+        stale_info=True,
+        transport="requests",
+        mac_cache=None,
+        lazy=False,
+    ):
         from datetime import timedelta
 
         self.hostname = hostname
         self.port = port
         self.timeout = timeout
-        assert isinstance(self.info, dict), "Failed to retrive info from {}".format(
-            self.hostname
+        self.connect_timeout = connect_timeout
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._session = None
+        # "raw": prebuilt requests on persistent sockets for the info, key
+        # and tune operations, see liveboxplaytv.transport
+        assert transport in ("requests", "raw"), "Unknown transport: {}".format(
+            transport
         )
-        self._cache_channel_img = {}
+        self._transport = None
+        # Guards dropping the transport, read it once into a local otherwise
+        self._transport_lock = threading.Lock()
+        if transport == "raw":
+            from .transport import RawTransport
+
+            self._transport = RawTransport(
+                hostname, port, retries, backoff_factor, pool_size
+            )
+        if registry is None or registry is REGISTRY:
+            self.registry = REGISTRY
+            self.resolver = RESOLVER
+        else:
+            self.registry = registry
+            self.resolver = ChannelResolver(registry)
         self.refresh_frequency = timedelta(seconds=refresh_frequency)
+        self.image_cache = image_cache
+        self._guide = guide
+        # Instrumentation hooks of this client, see liveboxplaytv.metrics
+        self.observers = list(observers or [])
+        # Measured times of the confirmed commands: {"zap": Histogram, ...}
+        self.timings = {}
+        if breaker is None:
+            breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        if breaker.on_change is None:
+            breaker.on_change = self._on_circuit_change
+        self.breaker = breaker
+        # Serve the last known state while the box is unavailable
+        self.stale_info = stale_info
+        # Where the MAC address of the box is saved for Wake-on-LAN, so that
+        # it is known in later runs: None to keep it in memory only, True
+        # for the shared discovery cache, or a DiscoveryCache
+        self.mac_cache = mac_cache
+        self._mac = None
+        self._info = None
+        # LiveboxState decoded from _info, see status
+        self._state = None
+        self._info_timestamp = None
+        self._info_pinned = 0
+        self.last_command = None
+        self._command_callbacks = []
+        self._commands = None
+        self._dispatcher = None
+        self._commands_lock = threading.Lock()
+        # Lazy clients do no I/O here, call connect() or just use them
+        if not lazy:
+            self.connect()
+
+    def connect(self):
+        """Fetch the box info, fails if the host is not a Livebox Play"""
+        info = self.refresh()
+        assert isinstance(info, dict), "Failed to retrive info from {}".format(
+            self.hostname
+        )
+        return info
+
+    def ping(self, timeout=None):
+        """Check whether the box answers, without raising"""
+        import requests
+
+        try:
+            self.rq(10, timeout=timeout)
+            return True
+        except (requests.RequestException, LiveboxPlayTvError, ValueError, KeyError):
+            return False
+
+    @property
+    def address(self):
+        return "{}:{}".format(self.hostname, self.port)
+
+    @property
+    def health(self):
+        """Circuit breaker state of the box, see liveboxplaytv.health"""
+        return dict(self.breaker.health(), host=self.address)
+
+    def _on_circuit_change(self, old, new):
+        if new == OPEN:
+            _LOGGER.warning("%s is unavailable, opening its circuit", self.address)
+        else:
+            _LOGGER.info("Circuit of %s is %s", self.address, new)
+        emit("on_circuit", self.address, old, new, observers=self.observers)
+
+    def get_timeout(self, operation, timeout=None):
+        """(connect, read) timeout of an operation"""
+        if timeout is None:
+            timeout = self.timeouts.get(str(operation), self.timeout)
+        if isinstance(timeout, tuple):
+            return timeout
+        connect = self.connect_timeout
+        return (self.timeout if connect is None else connect, timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def session(self):
+        """Keep-alive HTTP session, with a connection pool for the box"""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            # Only retry failed connection attempts: a command that reached
+            # the box must not be sent twice
+            retry = Retry(
+                total=self.retries,
+                connect=self.retries,
+                read=False,
+                status=0,
+                backoff_factor=self.backoff_factor,
+            )
+            adapter = HTTPAdapter(pool_maxsize=self.pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            self._session = session
+        return self._session
+
+    @property
+    def commands(self):
+        """
+        Serialized command queue of the box, which coalesces superseded
+        tunes and volume steps, see liveboxplaytv.commands
+        """
+        with self._commands_lock:
+            if self._commands is None:
+                from .commands import CommandQueue
+
+                self._commands = CommandQueue(self)
+            return self._commands
+
+    @property
+    def nowait(self):
+        """
+        Fire-and-forget commands returning futures, eg.
+        box.nowait.press_key("OK"), see liveboxplaytv.dispatch
+        """
+        with self._commands_lock:
+            if self._dispatcher is None:
+                from .dispatch import Dispatcher
+
+                self._dispatcher = Dispatcher(self)
+            return self._dispatcher
+
+    def close(self):
+        # Recreated on next use, like the session
+        with self._commands_lock:
+            dispatcher, self._dispatcher = self._dispatcher, None
+            commands, self._commands = self._commands, None
+        if dispatcher is not None:
+            dispatcher.close()
+        if commands is not None:
+            commands.close(timeout=self.timeout)
+        transport = self._transport
+        if transport is not None:
+            transport.close()
+        if self._session is not None:
+            self._session.close()
+            self._session = None
 
     @property
     def standby_state(self):
-        return self.info.get("activeStandbyState") == "0"
+        return self.status.is_on
 
     @property
     def channel(self):
@@ -49,7 +260,7 @@ class LiveboxPlayTv(object):
 
     @property
     def epg_id(self):
-        return self.info.get("playedMediaId")
+        return self.status.epg_id
 
     @epg_id.setter
     def epg_id(self, value):
@@ -65,35 +276,35 @@ class LiveboxPlayTv(object):
 
     @property
     def osd_context(self):
-        return self.info.get("osdContext")
+        return self.status.osd_context
 
     @property
     def media_state(self):
-        return self.info.get("playedMediaState")
+        return self.status.media_state
 
     @property
     def media_position(self):
-        return self.info.get("playedMediaPosition")
+        return self.status.media_position
 
     @property
     def media_type(self):
-        return self.info.get("playedMediaType")
+        return self.status.media_type
 
     @property
     def timeshift_state(self):
-        return self.info.get("timeShiftingState")
+        return self.status.timeshift
 
     @property
     def mac_address(self):
-        return self.info.get("macAddress")
+        return self.status.mac_address
 
     @property
     def name(self):
-        return self.info.get("friendlyName")
+        return self.status.friendly_name
 
     @property
     def wol_support(self):
-        return self.info.get("wolSupport") == "0"
+        return self.status.wol_support
 
     @property
     def is_on(self):
@@ -101,22 +312,301 @@ class LiveboxPlayTv(object):
 
     @property
     def info(self):
-        return self.get_info()
+        if self._info is None or (not self._info_pinned and self.info_expired):
+            if self.observers or OBSERVERS:
+                emit("on_cache", "info", False, observers=self.observers)
+            try:
+                return self.refresh()
+            except HostUnavailableError:
+                if self._info is None or not self.stale_info:
+                    raise
+                _LOGGER.debug("%s is unavailable, using its last state", self.address)
+                return self._info
+        _LOGGER.debug("Info cache hit for %s", self.hostname)
+        if self.observers or OBSERVERS:
+            emit("on_cache", "info", True, observers=self.observers)
+        return self._info
+
+    @property
+    def status(self):
+        """The info decoded as a LiveboxState, once per snapshot"""
+        return self._decode(self.info)
+
+    @property
+    def cached_status(self):
+        """LiveboxState of the cached info, None if there is none. No I/O."""
+        info = self._info
+        if info is not None:
+            return self._decode(info)
+
+    def _decode(self, info):
+        state = self._state
+        if state is None or state.raw is not info:
+            state = self._state = LiveboxState.from_info(info, self.registry)
+        return state
+
+    @property
+    def info_expired(self):
+        if self._info_timestamp is None:
+            return True
+        age = time.monotonic() - self._info_timestamp
+        return age >= self.refresh_frequency.total_seconds()
+
+    def refresh(self):
+        """Fetch a fresh state snapshot from the box and cache it"""
+        self._info = self.get_info()
+        self._info_timestamp = time.monotonic()
+        if self._info.get("macAddress") != self._mac:
+            self._save_mac(self._info)
+        return self._info
+
+    def _get_mac_cache(self):
+        if self.mac_cache is True:
+            from .discovery import get_discovery_cache
+
+            try:
+                return get_discovery_cache()
+            except (IOError, OSError) as exc:
+                # eg. read-only home
+                _LOGGER.debug("No discovery cache: %s", exc)
+                return
+        if self.mac_cache not in (None, False):
+            return self.mac_cache
+
+    def _save_mac(self, info):
+        """Remember the MAC address of the box, to wake it up later"""
+        from .discovery import DiscoveredBox
+
+        self._mac = info.get("macAddress")
+        cache = self._get_mac_cache() if self._mac else None
+        if cache is None:
+            return
+        known = cache.get(self._mac)
+        if known is not None and (known.host, known.port) == (self.hostname, self.port):
+            return
+        box = DiscoveredBox(
+            mac=self._mac.lower(),
+            host=self.hostname,
+            port=self.port,
+            name=info.get("friendlyName"),
+            source="client",
+            seen=time.time(),
+            info=None,
+        )
+        try:
+            cache.update(box)
+        except (IOError, OSError) as exc:
+            _LOGGER.debug("Could not save the MAC address of %s: %s", self.address, exc)
+
+    @property
+    def known_mac(self):
+        """MAC address of the box, from its last info or from the cache"""
+        if self._mac:
+            return self._mac
+        cache = self._get_mac_cache()
+        box = cache.find(self.hostname, self.port) if cache is not None else None
+        return box.mac if box is not None else None
+
+    def invalidate(self):
+        """Drop the cached state snapshot, the next read will hit the box"""
+        self._info_timestamp = None
+
+    def notify_command(self):
+        """Record that a command was sent to the box: drops the cached state"""
+        self.last_command = time.monotonic()
+        self.invalidate()
+        for callback in list(self._command_callbacks):
+            callback(self)
+
+    def on_command(self, callback):
+        """
+        Register callback(client), called after each command. Returns a
+        function to unregister it.
+        """
+        self._command_callbacks.append(callback)
+
+        def remove():
+            if callback in self._command_callbacks:
+                self._command_callbacks.remove(callback)
+
+        return remove
+
+    def update_info(self, data):
+        """Merge a partial state update (eg. from an event) into the cache"""
+        info = dict(self._info or {})
+        info.update(data)
+        # Replace the dict rather than mutating it: snapshots handed out
+        # earlier stay consistent
+        self._info = info
+        self._info_timestamp = time.monotonic()
+        return info
+
+    def watch(self, callback=None, **kwargs):
+        """Start a StateWatcher on this box, see liveboxplaytv.watcher"""
+        from .watcher import StateWatcher
+
+        watcher = StateWatcher(self, **kwargs)
+        if callback is not None:
+            watcher.subscribe(callback)
+        watcher.start()
+        return watcher
+
+    @contextmanager
+    def snapshot(self, refresh=False):
+        """
+        Read every property from one consistent state snapshot:
+
+            with box.snapshot():
+                box.channel, box.media_state, box.media_position
+
+        The cached info is neither expired nor invalidated within the block.
+        """
+        if refresh:
+            self.refresh()
+        self._info_pinned += 1
+        try:
+            yield self.info
+        finally:
+            self._info_pinned -= 1
 
-    # TODO
     @staticmethod
-    def discover():
-        pass
+    def discover(**kwargs):
+        """Find the boxes of the LAN, see liveboxplaytv.discovery.discover"""
+        from .discovery import discover
+
+        return discover(**kwargs)
+
+    def _check_circuit(self):
+        """Fail fast while the circuit is open, probe the box when half-open"""
+        import requests
+
+        state = self.breaker.acquire()
+        if state == CLOSED:
+            return
+        if state is not None:
+            url = "http://{}:{}/remoteControl/cmd".format(self.hostname, self.port)
+            try:
+                self._send(
+                    "probe",
+                    url,
+                    raw=self._prebuilt(10),
+                    params={"operation": "10"},
+                    timeout=self.get_timeout("probe"),
+                )
+            except requests.RequestException as exc:
+                self.breaker.record_failure(exc)
+            else:
+                self.breaker.record_success()
+                return
+        raise HostUnavailableError(
+            self.address, self.breaker.retry_in, self.breaker.last_error
+        )
+
+    def _request(self, operation, url, raw=None, **kwargs):
+        """GET url through the circuit breaker"""
+        import requests
+
+        self._check_circuit()
+        try:
+            resp = self._send(operation, url, raw, **kwargs)
+        except requests.ReadTimeout as exc:
+            if operation == "notify":
+                # No event within the long polling timeout
+                raise
+            self.breaker.record_failure(exc)
+            raise
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            self.breaker.record_failure(exc)
+            raise
+        self.breaker.record_success()
+        return resp
+
+    def _prebuilt(self, operation, params=None):
+        """Prebuilt request of the raw transport, None without one"""
+        transport = self._transport
+        if transport is not None:
+            return transport.prebuilt(operation, params)
+
+    def _get(self, operation, url, raw, kwargs):
+        """GET url, with the prebuilt raw request if there is one"""
+        transport = self._transport
+        if raw is None or transport is None:
+            return self.session.get(url, **kwargs)
+        from .transport import UnsupportedResponse
 
-    def rq(self, operation, params=None):
+        try:
+            return transport.send(raw, kwargs.get("timeout"))
+        except UnsupportedResponse as exc:
+            import requests
+
+            with self._transport_lock:
+                dropped = self._transport is transport
+                if dropped:
+                    self._transport = None
+            if dropped:
+                _LOGGER.warning(
+                    "Unexpected answer from %s, using requests from now on: %s",
+                    self.address,
+                    exc,
+                )
+                transport.close()
+            if operation not in ("10", "probe"):
+                # The command was sent, sending it again could repeat it
+                raise requests.ConnectionError(exc)
+            return self.session.get(url, **kwargs)
+
+    def _send(self, operation, url, raw=None, **kwargs):
+        """GET url, reporting the latency and outcome to the observers"""
+        if not (self.observers or OBSERVERS):
+            return self._get(operation, url, raw, kwargs)
+        import requests
+
+        error, timeout, retries, size = None, False, 0, 0
+        start = time.perf_counter()
+        try:
+            resp = self._get(operation, url, raw, kwargs)
+        except requests.RequestException as exc:
+            error = exc
+            timeout = isinstance(exc, requests.Timeout)
+            if isinstance(exc, requests.ConnectionError) and exc.args:
+                # Retries were exhausted (urllib3 MaxRetryError)
+                retries = self.retries if hasattr(exc.args[0], "reason") else 0
+            raise
+        else:
+            size = len(resp.content)
+            history = getattr(getattr(resp.raw, "retries", None), "history", ())
+            retries = len(history or ())
+            if resp.status_code >= 400:
+                error = resp.status_code
+            return resp
+        finally:
+            emit(
+                "on_request",
+                self.address,
+                str(operation),
+                time.perf_counter() - start,
+                error=error,
+                timeout=timeout,
+                retries=retries,
+                size=size,
+                observers=self.observers,
+            )
+
+    def rq(self, operation, params=None, timeout=None, decode=True):
         url = "http://{}:{}/remoteControl/cmd".format(self.hostname, self.port)
         get_params = OrderedDict({"operation": operation})
         if params:
             get_params.update(params)
         _LOGGER.debug("GET parameters: %s", get_params)
-        resp = requests.get(url, params=get_params, timeout=self.timeout)
+        resp = self._request(
+            str(operation),
+            url,
+            raw=self._prebuilt(operation, params),
+            params=get_params,
+            timeout=self.get_timeout(operation, timeout),
+        )
         resp.raise_for_status()
-        return resp.json()
+        return resp.json() if decode else resp
 
     def get_info(self):
         return self.rq(10)["result"]["data"]
@@ -126,6 +616,7 @@ class LiveboxPlayTv(object):
 
     def turn_on(self):
         if not self.standby_state:
+            # Not a macro: errors must reach the caller
             self.press_key(key=KEYS["POWER"])
             time.sleep(0.8)
             self.press_key(key=KEYS["OK"])
@@ -134,36 +625,262 @@ class LiveboxPlayTv(object):
         if self.standby_state:
             return self.press_key(key=KEYS["POWER"])
 
-    @asyncio.coroutine
-    def async_get_current_program(self):
-        from pyteleloisirs import async_get_current_program as async_get_cprg
+    def wait_for(
+        self,
+        predicate,
+        timeout=10,
+        interval=0.02,
+        max_interval=0.25,
+        start=None,
+        expected=None,
+    ):
+        """
+        Poll the box until predicate(status) is true, sleeping interval
+        seconds at first then backing off up to max_interval. Polling starts
+        expected seconds after start, when given. Returns the time elapsed
+        since start (default: now), raises CommandTimeoutError after timeout
+        seconds.
+        """
+        import requests
+
+        last = [None]
+
+        def check():
+            try:
+                self.refresh()
+                last[0] = self.status
+            except (requests.RequestException, HostUnavailableError) as exc:
+                # eg. a box waking up does not answer yet
+                _LOGGER.debug("Poll of %s failed: %s", self.address, exc)
+                return False
+            return predicate(last[0])
+
+        elapsed = self._poll(check, timeout, interval, max_interval, start, expected)
+        if elapsed is None:
+            raise CommandTimeoutError(
+                self.address, getattr(predicate, "__name__", "wait"), timeout, last[0]
+            )
+        return elapsed
+
+    def wait_ready(
+        self, timeout=30, interval=0.1, max_interval=1, start=None, expected=None
+    ):
+        """
+        Wait until the box answers (eg. after a Wake-on-LAN), probing it
+        outside of the circuit breaker, which is reset once it answers.
+        Returns the elapsed time like wait_for.
+        """
+        import requests
+
+        url = "http://{}:{}/remoteControl/cmd".format(self.hostname, self.port)
+        probe = self.get_timeout("probe")[1]
+
+        def check():
+            try:
+                resp = self._send(
+                    "probe",
+                    url,
+                    raw=self._prebuilt(10),
+                    params={"operation": "10"},
+                    timeout=(probe, probe),
+                )
+                resp.raise_for_status()
+                info = resp.json()["result"]["data"]
+            except (requests.RequestException, ValueError, KeyError) as exc:
+                _LOGGER.debug("%s is not ready: %s", self.address, exc)
+                return False
+            self.breaker.reset()
+            self._info = info
+            self._info_timestamp = time.monotonic()
+            return True
+
+        elapsed = self._poll(check, timeout, interval, max_interval, start, expected)
+        if elapsed is None:
+            raise CommandTimeoutError(self.address, "ready", timeout)
+        return elapsed
+
+    @staticmethod
+    def _poll(check, timeout, interval, max_interval, start, expected):
+        """
+        Call check() until it returns True, sleeping interval seconds at
+        first then backing off up to max_interval. Returns the time elapsed
+        since start, None after timeout seconds.
+        """
+        if start is None:
+            start = time.monotonic()
+        deadline = start + timeout
+        if expected:
+            # The box cannot be done before, do not poll it
+            delay = min(start + expected, deadline) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        while True:
+            if check():
+                return time.monotonic() - start
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 1.5, max_interval)
+
+    def record_timing(self, name, value):
+        """Record a measured time in self.timings and report it to the observers"""
+        histogram = self.timings.get(name)
+        if histogram is None:
+            histogram = self.timings[name] = Histogram(window=256)
+        histogram.observe(value)
+        if self.observers or OBSERVERS:
+            emit("on_timing", self.address, name, value, observers=self.observers)
+
+    def _expected_time(self, name):
+        """Lower bound of the recent times of a confirmed command"""
+        histogram = self.timings.get(name)
+        if histogram is not None and histogram.count >= 3:
+            return 0.8 * histogram.percentile(10)
+
+    def set_epg_id_confirmed(self, epg_id, timeout=10):
+        """
+        Tune to epg_id and return once the box plays it. Returns the zap
+        time in seconds, also recorded as "zap" (see record_timing).
+        """
+        start = time.monotonic()
+        self.set_epg_id(epg_id)
+        epg_id = str(epg_id)
 
-        if self.channel and self.channel != "N/A":
-            return (yield from async_get_cprg(self.channel))
+        def zap(state):
+            return state.epg_id == epg_id
 
-    @asyncio.coroutine
-    def async_get_current_program_name(self):
-        res = yield from self.async_get_current_program()
+        elapsed = self.wait_for(
+            zap, timeout, start=start, expected=self._expected_time("zap")
+        )
+        self.record_timing("zap", elapsed)
+        return elapsed
+
+    def set_channel_confirmed(self, channel, timeout=10):
+        return self.set_epg_id_confirmed(self.get_channel_epg_id(channel), timeout)
+
+    def turn_on_confirmed(self, timeout=30):
+        """
+        Like turn_on, but waits until the box reports it is on rather than
+        for a fixed delay. Returns the wake-up time in seconds (0 if the
+        box was already on), also recorded as "wake".
+        """
+        if self.standby_state:
+            return 0.0
+        start = time.monotonic()
+        self.press_key("POWER")
+
+        def wake(state):
+            return state.is_on
+
+        elapsed = self.wait_for(
+            wake, timeout, start=start, expected=self._expected_time("wake")
+        )
+        self.record_timing("wake", elapsed)
+        self.press_key("OK")
+        return elapsed
+
+    def wake_on_lan(self, address=None, port=None):
+        """
+        Send a Wake-on-LAN magic packet to the box, to the broadcast address
+        of its /24 and to 255.255.255.255 unless address is given
+        """
+        from .wol import WOL_PORT, directed_broadcasts, send_magic_packet
+
+        mac = self.known_mac
+        if mac is None:
+            raise LiveboxPlayTvError(
+                "The MAC address of {} is unknown".format(self.address)
+            )
+        if address is None:
+            address = directed_broadcasts(self.hostname)
+        return send_magic_packet(mac, address, port or WOL_PORT)
+
+    def power_on(self, timeout=60, wol=True, wol_address=None, wol_port=None):
+        """
+        Turn the box on, even from deep standby: if it does not answer, wake
+        it up with Wake-on-LAN (when its MAC address is known) and wait
+        until it does, then press POWER if it is still in standby. Returns
+        the time it took, the Wake-on-LAN part is recorded as "wol".
+        """
+        start = time.monotonic()
+        if wol and not self.ping(timeout=self.get_timeout("probe")):
+            # From the last known info, "0" means supported
+            if self._info is not None and self._info.get("wolSupport", "0") != "0":
+                _LOGGER.warning("%s does not support Wake-on-LAN", self.address)
+            elif self.known_mac is None:
+                _LOGGER.warning(
+                    "%s does not answer and its MAC address is unknown", self.address
+                )
+            else:
+                self.wake_on_lan(wol_address, wol_port)
+                try:
+                    elapsed = self.wait_ready(
+                        timeout, start=start, expected=self._expected_time("wol")
+                    )
+                except CommandTimeoutError as exc:
+                    _LOGGER.warning("%s, trying the remote keys", exc)
+                else:
+                    self.record_timing("wol", elapsed)
+        # Fresh state, not the stale one of an unavailable box
+        self.refresh()
+        remaining = timeout - (time.monotonic() - start)
+        self.turn_on_confirmed(max(remaining, self.timeout))
+        return time.monotonic() - start
+
+    async def async_get_current_program(self):
+        """Current program as a pyteleloisirs dict, see get_program for more"""
+        import asyncio
+
+        from .guide import program_to_dict
+
+        # Reading the channel may hit the network, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        channel = await loop.run_in_executor(None, self.get_current_channel)
+        if channel is None or channel.epg_id is None:
+            return
+        # Only fetches the schedule when it is missing or stale
+        await self.guide.async_refresh([channel])
+        program = self.guide.get_program(channel, fetch=False)
+        if program:
+            return program_to_dict(program)
+
+    async def async_get_current_program_name(self):
+        res = await self.async_get_current_program()
         if res:
             return res.get("name")
 
-    @asyncio.coroutine
-    def async_get_current_program_image(self, img_size=300):
+    async def async_get_current_program_image(self, img_size=300):
         from pyteleloisirs import resize_program_image
 
-        res = yield from self.async_get_current_program()
+        res = await self.async_get_current_program()
         if res:
             return resize_program_image(res.get("img"), img_size)
 
+    @property
+    def guide(self):
+        if self._guide is None:
+            from .guide import get_program_guide
+
+            self._guide = get_program_guide()
+        return self._guide
+
+    def get_program(self, channel=None, at=None):
+        """Program on a channel (the current one by default) at a given time"""
+        if channel is None:
+            channel = self.get_current_channel()
+            if channel is None or channel.epg_id is None:
+                return
+        return self.guide.get_program(channel, at=at)
+
     def get_current_channel(self):
-        epg_id = self.info.get("playedMediaId")
-        return self.get_channel_from_epg_id(epg_id)
+        return self.status.channel
 
     def get_current_channel_name(self):
         channel = self.get_current_channel()
         if channel is None:
             return
-        channel_name = channel["name"]
+        channel_name = channel.name
         if channel_name == "N/A":
             # Unable to determine current channel, let's try something else to
             # get a string representing what's on screen
@@ -177,101 +894,65 @@ class LiveboxPlayTv(object):
 
     def get_current_channel_image(self, img_size=300):
         channel = self.channel
-        if self.channel == "N/A":
+        if channel == "N/A":
             return
         return self.get_channel_image(channel=channel, img_size=img_size)
 
     def get_channel_image(self, channel, img_size=300, skip_cache=False):
         """Get the logo for a channel"""
-        from bs4 import BeautifulSoup
-        from wikipedia.exceptions import PageError
-        import re
-        import wikipedia
-
-        wikipedia.set_lang("fr")
+        from .images import get_channel_image
 
         if not channel:
             _LOGGER.error("Channel is not set. Could not retrieve image.")
             return
+        return get_channel_image(
+            self.get_channel_info(channel),
+            img_size=img_size,
+            skip_cache=skip_cache,
+            cache=self.image_cache,
+        )
 
-        # Check if the image is in cache
-        if channel in self._cache_channel_img and not skip_cache:
-            img = self._cache_channel_img[channel]
-            _LOGGER.debug("Cache hit: %s -> %s", channel, img)
-            return img
+    def prefetch_channel_images(self, img_size=300, max_workers=8):
+        """Warm the logo cache for the whole channel lineup"""
+        from .images import prefetch_channel_images
 
-        channel_info = self.get_channel_info(channel)
-        query = channel_info["wiki_page"]
-        if not query:
-            _LOGGER.debug("Wiki page is not set for channel %s", channel)
-            return
-        _LOGGER.debug("Query: %s", query)
-        # If there is a max image size defined use it.
-        if "max_img_size" in channel_info:
-            if img_size > channel_info["max_img_size"]:
-                _LOGGER.info(
-                    "Requested image size is bigger than the max, " "setting it to %s",
-                    channel_info["max_img_size"],
-                )
-                img_size = channel_info["max_img_size"]
-        try:
-            page = wikipedia.page(query)
-            _LOGGER.debug("Wikipedia article title: %s", page.title)
-            soup = BeautifulSoup(page.html(), "html.parser")
-            images = soup.find_all("img")
-            img_src = None
-            for i in images:
-                if i["alt"].startswith("Image illustrative"):
-                    img_src = re.sub(r"\d+px", "{}px".format(img_size), i["src"])
-            img = "https:{}".format(img_src) if img_src else None
-            # Cache result
-            self._cache_channel_img[channel] = img
-            return img
-        except PageError:
-            _LOGGER.error("Could not fetch channel image for %s", channel)
+        return prefetch_channel_images(
+            self.registry, img_size, max_workers=max_workers, cache=self.image_cache
+        )
 
     def get_channels(self):
-        return CHANNELS
+        return self.registry.channels
 
-    def __update(self):
-        _LOGGER.info("Refresh Orange API data")
-        url = "http://lsm-rendezvous040413.orange.fr/API/?output=json&withChannels=1"
-        resp = requests.get(url)
-        resp.raise_for_status()
-        return resp.json()
+    def update_lineup(self, force=False, source=None):
+        """
+        Sync the channel registry with the Orange API, see
+        liveboxplaytv.lineup. Returns a LineupDiff.
+        """
+        from .lineup import HttpSource, get_lineup_sync
+
+        if source is None:
+            source = HttpSource(session=self.session, timeout=self.timeout)
+        return get_lineup_sync(self.registry).sync(force=force, source=source)
 
     def get_channel_names(self, json_output=False):
-        channels = [x["name"] for x in CHANNELS]
+        channels = self.registry.names()
         return json.dumps(channels) if json_output else channels
 
     def get_channel_info(self, channel):
-        # If the channel start with '#' search by channel number
-        channel_index = None
-        if channel.startswith("#"):
-            channel_index = channel.split("#")[1]
-        # Look for an exact match first
-        for chan in CHANNELS:
-            if channel_index:
-                if chan["index"] == channel_index:
-                    return chan
-            else:
-                if chan["name"].lower() == channel.lower():
-                    return chan
-        # Try fuzzy matching it that did not give any result
-        chan = process.extractOne(channel, CHANNELS)[0]
-        return chan
+        # Raises ChannelNotFoundError rather than tuning to a poor match
+        return self.resolver.resolve(channel)
 
     def get_channel_epg_id(self, channel):
-        return self.get_channel_info(channel)["epg_id"]
+        return self.get_channel_info(channel).epg_id
 
     def get_channel_from_epg_id(self, epg_id):
-        res = [c for c in CHANNELS if c["epg_id"] == epg_id]
-        return res[0] if res else None
+        return self.registry.by_epg_id(epg_id)
 
-    def set_epg_id(self, epg_id):
+    def set_epg_id(self, epg_id, decode=True):
         # The EPG ID needs to be 10 chars long, padded with '*' chars
         epg_id_str = str(epg_id).rjust(10, "*")
-        _LOGGER.info("Tune to %s", self.get_channel_from_epg_id(epg_id)["name"])
+        channel = self.get_channel_from_epg_id(epg_id)
+        _LOGGER.info("Tune to %s", channel.name if channel else epg_id)
         _LOGGER.debug("EPG ID string: %s", epg_id_str)
         # FIXME We cannot use rq here since requests automatically urlencodes
         # the '*' characters
@@ -279,9 +960,16 @@ class LiveboxPlayTv(object):
         url = "http://{}:{}/remoteControl/cmd?operation=09&epg_id={}&uui=1".format(
             self.hostname, self.port, epg_id_str
         )
-        resp = requests.get(url, timeout=self.timeout)
+        transport = self._transport
+        resp = self._request(
+            "09",
+            url,
+            raw=transport and transport.tune(epg_id_str),
+            timeout=self.get_timeout("09"),
+        )
+        self.notify_command()
         resp.raise_for_status()
-        return resp.json()
+        return resp.json() if decode else resp
 
     def set_channel(self, channel):
         epg_id = self.get_channel_epg_id(channel)
@@ -292,7 +980,7 @@ class LiveboxPlayTv(object):
             if k_id == key_id:
                 return key_name
 
-    def press_key(self, key, mode=0):
+    def press_key(self, key, mode=0, decode=True):
         """
         modes:
             0 -> simple press
@@ -303,7 +991,26 @@ class LiveboxPlayTv(object):
             assert key in KEYS, "No such key: {}".format(key)
             key = KEYS[key]
         _LOGGER.info("Press key %s", self.__get_key_name(key))
-        return self.rq("01", OrderedDict([("key", key), ("mode", mode)]))
+        try:
+            return self.rq(
+                "01", OrderedDict([("key", key), ("mode", mode)]), decode=decode
+            )
+        finally:
+            self.notify_command()
+
+    def press_keys(self, macro, pace=None, stop_on_error=True):
+        """
+        Send a sequence of keys, eg. "1 2 OK" or ["VOL+"] * 5.
+        See liveboxplaytv.macros for the syntax.
+        """
+        from .macros import DEFAULT_PACE, run_macro
+
+        return run_macro(
+            self,
+            macro,
+            pace=DEFAULT_PACE if pace is None else pace,
+            stop_on_error=stop_on_error,
+        )
 
     def volume_up(self):
         return self.press_key(key=KEYS["VOL+"])
@@ -333,9 +1040,10 @@ class LiveboxPlayTv(object):
             return self.play_pause()
         _LOGGER.debug("Media is already paused.")
 
-    def event_notify(self):
+    def event_notify(self, timeout=None):
         # https://www.domotique-fibaro.fr/topic/4444-tv-commande-decodeur-livebox-play-et-gestion-d%C3%A3%C2%A9tat-temps-r%C3%A3%C2%A9el/
+        # Long polling request: no timeout unless explicitly requested
         url = "http://{}:{}/remoteControl/notifyEvent".format(self.hostname, self.port)
-        resp = requests.get(url)
+        resp = self._request("notify", url, timeout=self.get_timeout("notify", timeout))
         resp.raise_for_status()
         return resp.json()
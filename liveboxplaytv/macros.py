@@ -0,0 +1,129 @@
+# coding: utf-8
+"""
+Key sequences ("macros") sent to the box in one go.
+
+A macro is either a list of key names / key codes or a string of
+whitespace or comma separated steps:
+
+    1 2 OK              press 1, 2 then OK
+    12 OK               same thing, numbers are typed digit by digit
+    VOL+*5              press VOL+ five times
+    wait:0.5            pause for half a second
+    long:OK release:OK  long press on OK, then release it
+"""
+
+from collections import OrderedDict, namedtuple
+import logging
+import re
+import time
+
+from .exceptions import HostUnavailableError
+from .keys import KEYS
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Simple press, long press and release after a long press (see press_key)
+PRESS = 0
+LONG_PRESS = 1
+RELEASE = 2
+
+MODES = {"press": PRESS, "long": LONG_PRESS, "release": RELEASE}
+
+# Minimum delay between two keys, the box drops keys sent faster than this
+DEFAULT_PACE = 0.15
+
+Step = namedtuple("Step", ["key", "mode", "wait"])
+MacroResult = namedtuple("MacroResult", ["sent", "errors", "elapsed"])
+
+_SEPARATORS_RE = re.compile(r"[\s,]+")
+
+
+def parse_key(key):
+    if isinstance(key, int):
+        return key
+    if key in KEYS:
+        return KEYS[key]
+    if key.upper() in KEYS:
+        return KEYS[key.upper()]
+    raise ValueError("No such key: {}".format(key))
+
+
+def parse_step(token):
+    if isinstance(token, int):
+        return [Step(token, PRESS, None)]
+    token = token.strip()
+    name, sep, value = token.partition(":")
+    name = name.lower()
+    if sep and name in ("wait", "sleep"):
+        return [Step(None, None, float(value))]
+    if sep and name in MODES:
+        mode, token = MODES[name], value
+    else:
+        mode = PRESS
+    count = 1
+    # Repeated key: VOL+*5
+    if "*" in token:
+        token, _, count = token.rpartition("*")
+        count = int(count)
+    if token.isdigit():
+        keys = [KEYS[digit] for digit in token]
+    else:
+        keys = [parse_key(token)]
+    return [Step(key, mode, None) for key in keys] * count
+
+
+def parse_macro(macro):
+    """Turn a macro (string or list) into a list of Steps"""
+    if isinstance(macro, str):
+        macro = [t for t in _SEPARATORS_RE.split(macro) if t]
+    steps = []
+    for token in macro:
+        if isinstance(token, Step):
+            steps.append(token)
+        else:
+            steps.extend(parse_step(token))
+    return steps
+
+
+def run_macro(client, macro, pace=DEFAULT_PACE, stop_on_error=True):
+    """
+    Send a macro to a LiveboxPlayTv client over its keep-alive session.
+
+    Keys are sent at least `pace` seconds apart, their responses are not
+    decoded. Returns a MacroResult with the number of keys sent, the
+    (step, exception) errors and the elapsed time.
+    """
+    import requests
+
+    steps = parse_macro(macro)
+    sent = 0
+    errors = []
+    last_sent = None
+    start = time.monotonic()
+    try:
+        for step in steps:
+            if step.key is None:
+                time.sleep(step.wait)
+                continue
+            if last_sent is not None:
+                delay = pace - (time.monotonic() - last_sent)
+                if delay > 0:
+                    time.sleep(delay)
+            last_sent = time.monotonic()
+            _LOGGER.debug("Macro key %s (mode %s)", step.key, step.mode)
+            try:
+                client.rq(
+                    "01",
+                    OrderedDict([("key", step.key), ("mode", step.mode)]),
+                    decode=False,
+                )
+                sent += 1
+            except (requests.RequestException, HostUnavailableError) as exc:
+                _LOGGER.warning("Macro key %s failed: %s", step.key, exc)
+                errors.append((step, exc))
+                if stop_on_error:
+                    break
+    finally:
+        client.notify_command()
+    return MacroResult(sent, errors, time.monotonic() - start)
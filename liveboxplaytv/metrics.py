@@ -0,0 +1,258 @@
+# coding: utf-8
+"""
+Instrumentation hooks.
+
+Observers receive an event for every request sent to a box, for every
+cache lookup (info snapshots, channel logos, channel lookups), for every
+circuit breaker state change and for every confirmed command (zap and
+wake-up times). Register them globally with add_observer()
+or per client (observers=[...]). MetricsCollector is a built-in observer
+which keeps latency histograms and counters in memory:
+
+    collector = MetricsCollector()
+    add_observer(collector)
+    ...
+    collector.summary()
+    collector.to_prometheus()
+"""
+
+from bisect import bisect_left
+from collections import deque
+import logging
+import threading
+
+from .health import OPEN
+
+
+_LOGGER = logging.getLogger(__name__)
+
+OBSERVERS = []
+
+# Histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Observer(object):
+    """Base class of the instrumentation hooks, all of them are no-ops"""
+
+    def on_request(
+        self, host, operation, latency, error=None, timeout=False, retries=0, size=0
+    ):
+        pass
+
+    def on_cache(self, cache, hit):
+        pass
+
+    def on_circuit(self, host, old_state, new_state):
+        pass
+
+    def on_timing(self, host, name, value):
+        pass
+
+
+def add_observer(observer):
+    OBSERVERS.append(observer)
+    return observer
+
+
+def remove_observer(observer):
+    if observer in OBSERVERS:
+        OBSERVERS.remove(observer)
+
+
+def emit(event, *args, **kwargs):
+    """
+    Call the event method (on_request, on_cache) of the global observers
+    and of the extra observers passed as observers=[...]
+    """
+    observers = kwargs.pop("observers", ())
+    for observer in tuple(observers) + tuple(OBSERVERS):
+        try:
+            getattr(observer, event)(*args, **kwargs)
+        except Exception:
+            _LOGGER.exception("Error in observer %s", observer)
+
+
+class Histogram(object):
+    """Bucketed histogram, plus a window of recent samples for percentiles"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=1024):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def percentile(self, pct):
+        if not self.samples:
+            return None
+        samples = sorted(self.samples)
+        index = int(round(pct / 100.0 * (len(samples) - 1)))
+        return samples[index]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": max(self.samples) if self.samples else None,
+        }
+
+
+class _RequestStats(object):
+    __slots__ = ("latency", "errors", "timeouts", "retries", "bytes")
+
+    def __init__(self, buckets):
+        self.latency = Histogram(buckets)
+        self.errors = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.bytes = 0
+
+
+class MetricsCollector(Observer):
+    """In-memory metrics, per host and operation"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.requests = {}
+        self.caches = {}
+        self.histograms = {}
+        # {host: [state, times opened]}
+        self.circuits = {}
+        self._lock = threading.Lock()
+
+    def on_request(
+        self, host, operation, latency, error=None, timeout=False, retries=0, size=0
+    ):
+        with self._lock:
+            stats = self.requests.get((host, operation))
+            if stats is None:
+                stats = self.requests[(host, operation)] = _RequestStats(self.buckets)
+            stats.latency.observe(latency)
+            stats.errors += error is not None
+            stats.timeouts += bool(timeout)
+            stats.retries += retries
+            stats.bytes += size
+
+    def on_cache(self, cache, hit):
+        with self._lock:
+            counts = self.caches.setdefault(cache, [0, 0])
+            counts[0 if hit else 1] += 1
+
+    def on_circuit(self, host, old_state, new_state):
+        with self._lock:
+            circuit = self.circuits.setdefault(host, [new_state, 0])
+            circuit[0] = new_state
+            circuit[1] += new_state == OPEN
+
+    def on_timing(self, host, name, value):
+        self.observe(name, value, host)
+
+    def observe(self, name, value, host=None):
+        """Record a value in a named histogram (eg. zap times)"""
+        with self._lock:
+            histogram = self.histograms.get((name, host))
+            if histogram is None:
+                histogram = self.histograms[(name, host)] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self.caches.clear()
+            self.histograms.clear()
+            self.circuits.clear()
+
+    def summary(self):
+        with self._lock:
+            requests = {}
+            for (host, operation), stats in self.requests.items():
+                entry = stats.latency.summary()
+                entry.update(
+                    errors=stats.errors,
+                    timeouts=stats.timeouts,
+                    retries=stats.retries,
+                    bytes=stats.bytes,
+                )
+                requests.setdefault(host, {})[operation] = entry
+            caches = {
+                cache: {
+                    "hits": hits,
+                    "misses": misses,
+                    "ratio": float(hits) / (hits + misses) if hits + misses else None,
+                }
+                for cache, (hits, misses) in self.caches.items()
+            }
+            histograms = {}
+            for (name, host), histogram in self.histograms.items():
+                histograms.setdefault(name, {})[host] = histogram.summary()
+            circuits = {
+                host: {"state": state, "opened": opened}
+                for host, (state, opened) in self.circuits.items()
+            }
+            return {
+                "requests": requests,
+                "caches": caches,
+                "histograms": histograms,
+                "circuits": circuits,
+            }
+
+    def to_prometheus(self, prefix="liveboxplaytv"):
+        """Prometheus text exposition format"""
+        lines = []
+
+        def histogram_lines(name, labels, histogram):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(
+                    '{}_bucket{{{},le="{}"}} {}'.format(name, labels, bound, cumulative)
+                )
+            lines.append("{}_sum{{{}}} {}".format(name, labels, histogram.sum))
+            lines.append("{}_count{{{}}} {}".format(name, labels, histogram.count))
+
+        with self._lock:
+            name = "{}_request_duration_seconds".format(prefix)
+            lines.append("# TYPE {} histogram".format(name))
+            for (host, operation), stats in sorted(self.requests.items()):
+                labels = 'host="{}",operation="{}"'.format(host, operation)
+                histogram_lines(name, labels, stats.latency)
+            for metric in ("errors", "timeouts", "retries", "bytes"):
+                name = "{}_request_{}_total".format(prefix, metric)
+                lines.append("# TYPE {} counter".format(name))
+                for (host, operation), stats in sorted(self.requests.items()):
+                    lines.append(
+                        '{}{{host="{}",operation="{}"}} {}'.format(
+                            name, host, operation, getattr(stats, metric)
+                        )
+                    )
+            for index, metric in enumerate(("hits", "misses")):
+                name = "{}_cache_{}_total".format(prefix, metric)
+                lines.append("# TYPE {} counter".format(name))
+                for cache, counts in sorted(self.caches.items()):
+                    lines.append(
+                        '{}{{cache="{}"}} {}'.format(name, cache, counts[index])
+                    )
+            name = "{}_circuit_open_total".format(prefix)
+            lines.append("# TYPE {} counter".format(name))
+            for host, (state, opened) in sorted(self.circuits.items()):
+                lines.append('{}{{host="{}"}} {}'.format(name, host, opened))
+            previous = None
+            for (hist_name, host), histogram in sorted(
+                self.histograms.items(), key=lambda item: (item[0][0], str(item[0][1]))
+            ):
+                name = "{}_{}_seconds".format(prefix, hist_name)
+                if name != previous:
+                    lines.append("# TYPE {} histogram".format(name))
+                    previous = name
+                histogram_lines(name, 'host="{}"'.format(host or ""), histogram)
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,124 @@
+# coding: utf-8
+
+
+from collections import namedtuple
+import logging
+import threading
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+Channel = namedtuple(
+    "Channel", ["epg_id", "index", "name", "wiki_page", "max_img_size", "aliases"]
+)
+Channel.__new__.__defaults__ = (None, None, ())
+
+
+def make_channel(data):
+    """Build a Channel record from one of the dicts of the CHANNELS list"""
+    if isinstance(data, Channel):
+        return data
+    return Channel(
+        epg_id=data["epg_id"],
+        index=data["index"],
+        name=data["name"],
+        wiki_page=data.get("wiki_page"),
+        max_img_size=data.get("max_img_size"),
+        aliases=tuple(data.get("aliases", ())),
+    )
+
+
+def normalize_name(name):
+    return " ".join(name.casefold().split())
+
+
+def bundled_lineup():
+    """The CHANNELS list shipped with the package"""
+    from .channels import CHANNELS
+
+    return CHANNELS
+
+
+def default_lineup():
+    """The lineup of the last sync (compiled cache) if any, else the bundled one"""
+    from .lineup import load_cached_lineup
+
+    channels = load_cached_lineup()
+    return channels if channels is not None else bundled_lineup()
+
+
+class ChannelRegistry(object):
+    """
+    Channel lineup with constant time lookups by EPG ID, channel number,
+    name and aliases. Use load() to swap in a new lineup at runtime.
+
+    Without channels, loader() (the bundled lineup by default) provides
+    them on first use.
+    """
+
+    def __init__(self, channels=None, loader=bundled_lineup):
+        self._indexes = None
+        self._loader = loader
+        self._lock = threading.Lock()
+        if channels is not None:
+            self.load(channels)
+
+    def _get_indexes(self):
+        indexes = self._indexes
+        if indexes is None:
+            with self._lock:
+                if self._indexes is None:
+                    self.load(self._loader())
+                indexes = self._indexes
+        return indexes
+
+    def load(self, channels):
+        channels = tuple(make_channel(c) for c in channels)
+        by_epg_id = {}
+        by_index = {}
+        by_name = {}
+        # The first entry wins on duplicates, like the former linear scans
+        for chan in channels:
+            by_epg_id.setdefault(chan.epg_id, chan)
+            by_index.setdefault(chan.index, chan)
+            for name in (chan.name,) + chan.aliases:
+                by_name.setdefault(normalize_name(name), chan)
+        # Swap all the indexes at once so that concurrent readers never see a
+        # partially built registry
+        self._indexes = (channels, by_epg_id, by_index, by_name)
+        _LOGGER.debug("Loaded %s channels", len(channels))
+
+    @property
+    def channels(self):
+        return self._get_indexes()[0]
+
+    def __iter__(self):
+        return iter(self._get_indexes()[0])
+
+    def __len__(self):
+        return len(self._get_indexes()[0])
+
+    def names(self):
+        return [c.name for c in self._get_indexes()[0]]
+
+    def by_epg_id(self, epg_id):
+        if epg_id is not None:
+            epg_id = str(epg_id)
+        return self._get_indexes()[1].get(epg_id)
+
+    def by_index(self, index):
+        return self._get_indexes()[2].get(str(index).lstrip("#"))
+
+    def by_name(self, name):
+        return self._get_indexes()[3].get(normalize_name(name))
+
+    def get(self, channel):
+        """Exact lookup of a channel name, alias or number ('#N')"""
+        if channel.startswith("#"):
+            return self.by_index(channel)
+        return self.by_name(channel)
+
+
+# Loaded on first use, from the lineup cache of LineupSync when there is one
+REGISTRY = ChannelRegistry(loader=default_lineup)
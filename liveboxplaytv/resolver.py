@@ -0,0 +1,149 @@
+# coding: utf-8
+
+
+from functools import lru_cache
+import logging
+import re
+import unicodedata
+
+from .exceptions import ChannelNotFoundError
+from .metrics import OBSERVERS, emit
+from .registry import REGISTRY
+
+
+_LOGGER = logging.getLogger(__name__)
+
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(name):
+    """'Canal+ Décalé' -> 'canal plus decale'"""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    name = name.casefold().replace("+", " plus ")
+    return _NON_ALNUM_RE.sub(" ", name).strip()
+
+
+def trigrams(text):
+    padded = "  {} ".format(text)
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def levenshtein(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (ca != cb),
+                )
+            )
+        previous = current
+    return previous[-1]
+
+
+def similarity(a, b):
+    if not a and not b:
+        return 1.0
+    return 1.0 - float(levenshtein(a, b)) / max(len(a), len(b))
+
+
+def score(query, name, prefix_weight=0.9):
+    """Edit distance similarity, with some credit for prefixes of long names"""
+    result = similarity(query, name)
+    if 3 <= len(query) < len(name):
+        result = max(result, prefix_weight * similarity(query, name[: len(query)]))
+    return result
+
+
+class ChannelResolver(object):
+    """
+    Resolve free-form channel queries against a ChannelRegistry.
+
+    Exact names, aliases and channel numbers are looked up in the registry.
+    Anything else goes through a trigram prefilter and an edit distance
+    scoring of the short list. Results are kept in an LRU cache, which is
+    dropped whenever the registry loads a new lineup.
+    """
+
+    def __init__(self, registry=REGISTRY, threshold=0.6, shortlist=8, cache_size=512):
+        self.registry = registry
+        self.threshold = threshold
+        self.shortlist = shortlist
+        self._channels = None
+        self._fuzzy = lru_cache(maxsize=cache_size)(self._fuzzy_match)
+
+    def _build(self):
+        channels = self.registry.channels
+        entries = []
+        index = {}
+        for chan in channels:
+            if chan.epg_id is None:
+                # Never fuzzy match the 'N/A' placeholder
+                continue
+            for name in (chan.name,) + chan.aliases:
+                norm = normalize(name)
+                entry_id = len(entries)
+                entries.append((norm, chan))
+                for gram in trigrams(norm):
+                    index.setdefault(gram, []).append(entry_id)
+        self._entries = entries
+        self._trigram_index = index
+        self._fuzzy.cache_clear()
+        self._channels = channels
+
+    def _ensure_built(self):
+        # The registry swaps its channels tuple on reload
+        if self._channels is not self.registry.channels:
+            self._build()
+
+    def _fuzzy_match(self, query):
+        norm = normalize(query)
+        counts = {}
+        for gram in trigrams(norm):
+            for entry_id in self._trigram_index.get(gram, ()):
+                counts[entry_id] = counts.get(entry_id, 0) + 1
+        candidates = sorted(counts, key=counts.get, reverse=True)[: self.shortlist]
+        best, best_score = None, 0.0
+        for entry_id in candidates:
+            name, chan = self._entries[entry_id]
+            entry_score = score(norm, name)
+            if entry_score > best_score:
+                best, best_score = chan, entry_score
+        return best, best_score
+
+    def match(self, query):
+        """Return a (channel, score) tuple, without applying the threshold"""
+        chan = self.registry.get(query)
+        if chan is not None:
+            if OBSERVERS:
+                emit("on_cache", "channels", True)
+            return chan, 1.0
+        if query.startswith("#"):
+            # No fuzzy matching on channel numbers
+            return None, 0.0
+        self._ensure_built()
+        if not OBSERVERS:
+            return self._fuzzy(query)
+        hits = self._fuzzy.cache_info().hits
+        result = self._fuzzy(query)
+        emit("on_cache", "channels", self._fuzzy.cache_info().hits > hits)
+        return result
+
+    def resolve(self, query, threshold=None):
+        chan, score = self.match(query)
+        if threshold is None:
+            threshold = self.threshold
+        if chan is None or score < threshold:
+            raise ChannelNotFoundError(query, chan, score)
+        if score < 1.0:
+            _LOGGER.debug("Fuzzy match: %s -> %s (%.2f)", query, chan.name, score)
+        return chan
+
+
+RESOLVER = ChannelResolver()
@@ -0,0 +1,175 @@
+# coding: utf-8
+
+
+import logging
+import threading
+import time
+
+from .state import LiveboxState, MediaState
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class _Flight(object):
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class PollScheduler(object):
+    """
+    Poll the state of a box from a background thread, at a rate adapted to
+    what the box is doing:
+
+    - command_interval for command_window seconds after a command
+    - playback_interval while something (live TV, VOD, replay, recording)
+      is played or paused
+    - standby_interval while the box is off
+    - interval otherwise (the client refresh_frequency by default)
+
+    Failed polls back off exponentially up to max_backoff. Concurrent calls
+    to refresh() share a single request. Listeners get every new info
+    snapshot.
+    """
+
+    def __init__(
+        self,
+        client,
+        interval=None,
+        standby_interval=300,
+        playback_interval=5,
+        command_interval=1,
+        command_window=10,
+        max_backoff=300,
+    ):
+        self.client = client
+        if interval is None:
+            interval = client.refresh_frequency.total_seconds()
+        self.interval = interval
+        self.standby_interval = standby_interval
+        self.playback_interval = playback_interval
+        self.command_interval = command_interval
+        self.command_window = command_window
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._flight = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._remove_command_callback = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_listener(self, callback):
+        """Register callback(info), called with each new snapshot"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        if self._remove_command_callback is None:
+            self._remove_command_callback = self.client.on_command(
+                lambda _: self.poke()
+            )
+        self._thread = threading.Thread(
+            target=self._run,
+            name="liveboxplaytv-scheduler-{}".format(self.client.hostname),
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        # The client must not keep the scheduler alive
+        if self._remove_command_callback is not None:
+            self._remove_command_callback()
+            self._remove_command_callback = None
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def poke(self):
+        """Poll as soon as possible (eg. right after a command)"""
+        self._wake.set()
+
+    def next_interval(self, state=None):
+        """Delay before the next poll, state is a LiveboxState (or info dict)"""
+        if self.failures:
+            return min(self.interval * 2**self.failures, self.max_backoff)
+        last_command = self.client.last_command
+        if last_command and time.monotonic() - last_command < self.command_window:
+            return self.command_interval
+        if isinstance(state, dict):
+            state = LiveboxState.from_info(state, self.client.registry)
+        if state is None or not state.is_on:
+            return self.standby_interval
+        if state.media_state in (MediaState.PLAY, MediaState.PAUSE):
+            return self.playback_interval
+        return self.interval
+
+    def refresh(self):
+        """
+        Refresh the client state and publish it. If a refresh is already in
+        flight, wait for it and share its result instead of sending another
+        request.
+        """
+        with self._lock:
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = self.client.refresh()
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._flight = None
+            flight.done.set()
+        self._publish(flight.result)
+        return flight.result
+
+    def _publish(self, info):
+        for callback in list(self._listeners):
+            try:
+                callback(info)
+            except Exception:
+                _LOGGER.exception("Error in poll listener")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                self.refresh()
+                self.failures = 0
+            except Exception as exc:
+                self.failures += 1
+                _LOGGER.warning(
+                    "Polling %s failed (%s in a row): %s",
+                    self.client.hostname,
+                    self.failures,
+                    exc,
+                )
+            # The last known state, decoded once per snapshot
+            interval = self.next_interval(self.client.cached_status)
+            _LOGGER.debug("Next poll of %s in %ss", self.client.hostname, interval)
+            self._wake.wait(interval)
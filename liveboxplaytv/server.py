@@ -0,0 +1,426 @@
+# coding: utf-8
+"""
+Long running gateway to one or more boxes:
+
+    liveboxplaytv -H 192.168.1.3 serve
+
+It keeps a warm client per box (pooled connections, cached state kept up
+to date by a StateWatcher) and exposes them with a small local HTTP/JSON
+API. The CLI uses it when it is running.
+
+Only the boxes given upfront are served (any_host=True to serve the ones
+the requests name) and anyone who can reach the API controls them, so it
+listens on a loopback address unless allow_remote=True.
+
+Loopback does not keep web pages out: a browser lets any page send
+requests to 127.0.0.1. Every request must therefore carry the token of
+the daemon in an X-Liveboxplaytv-Token header (a header pages cannot set
+cross-origin without the CORS preflight the daemon never grants), and
+bodies must be application/json. The token is written to
+daemon-<port>.token in the cache directory, readable by the user only.
+
+    GET  /hosts                          health of the boxes
+    GET  /stats                          metrics of the served boxes, as a
+                                         MetricsCollector summary and in the
+                                         Prometheus text format
+    GET  /info, /status, /state, /channel   {"host": "192.168.1.3"}
+    GET  /queue                          command queue depth and counters
+    POST /channel {"channel": "Arte"}     "confirm": true waits for the zap
+    POST /key {"key": "OK", "mode": 0}
+    POST /keys {"sequence": "1 2 OK", "pace": 0.2}
+    POST /vol {"action": "up", "steps": 1}
+    POST /on, /off                       "confirm": true waits for the box,
+                                         "wol": true also wakes it from deep
+                                         standby
+
+Parameters are read from the JSON body (GET requests also accept them in
+the query string). Replies are {"result": ...} or {"error": "..."}, 401
+without the token, 403 for a box which is not served.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import secrets
+import socket
+import threading
+
+from .exceptions import (
+    ChannelNotFoundError,
+    CommandTimeoutError,
+    HostUnavailableError,
+    LiveboxPlayTvError,
+)
+from .utils import get_cache_dir
+
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_ADDRESS = ("127.0.0.1", 8765)
+TOKEN_HEADER = "X-Liveboxplaytv-Token"
+
+
+def get_daemon_address():
+    """host:port of the daemon, $LIVEBOXPLAYTV_DAEMON or 127.0.0.1:8765"""
+    value = os.environ.get("LIVEBOXPLAYTV_DAEMON")
+    if not value:
+        return DEFAULT_ADDRESS
+    host, _, port = value.rpartition(":")
+    return host or DEFAULT_ADDRESS[0], int(port)
+
+
+def get_token_path(address):
+    """Where the daemon listening on address keeps its token"""
+    return os.path.join(get_cache_dir(), "daemon-{}.token".format(address[1]))
+
+
+def get_daemon_token(address):
+    """$LIVEBOXPLAYTV_DAEMON_TOKEN, or the token the daemon wrote, or None"""
+    token = os.environ.get("LIVEBOXPLAYTV_DAEMON_TOKEN")
+    if token:
+        return token
+    try:
+        with open(get_token_path(address)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def is_loopback(host):
+    """Whether host (a listen address) is only reachable from this machine"""
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        # "" (all interfaces) lands here too
+        return False
+
+
+def _macro_result(res):
+    if res is None:
+        return
+    return {
+        "sent": res.sent,
+        "errors": [str(exc) for _, exc in res.errors],
+        "elapsed": res.elapsed,
+    }
+
+
+def _flag(params, name):
+    """A boolean parameter, refusing anything but a JSON boolean or 0/1"""
+    value = params.get(name, False)
+    if value in (True, False, 0, 1, None):
+        return bool(value)
+    raise ValueError("{} must be a boolean, not {!r}".format(name, value))
+
+
+def _channel(client, params):
+    if _flag(params, "confirm"):
+        # Returns the zap time
+        return client.set_channel_confirmed(params["channel"])
+    return client.commands.set_channel(params["channel"]).result()
+
+
+def _turn_on(client, params):
+    if _flag(params, "wol"):
+        return client.power_on()
+    if _flag(params, "confirm"):
+        return client.turn_on_confirmed()
+    return client.turn_on()
+
+
+def _keys(client, params):
+    return _macro_result(client.press_keys(params["sequence"], pace=params.get("pace")))
+
+
+def _volume(client, params):
+    action = params.get("action")
+    if action == "mute":
+        return client.commands.press_key("MUTE").result()
+    steps = int(params.get("steps", 1))
+    if action == "up":
+        return _macro_result(client.commands.volume_up(steps).result())
+    if action == "down":
+        return _macro_result(client.commands.volume_down(steps).result())
+    raise ValueError("Unknown volume action: {}".format(action))
+
+
+# (method, path) -> handler(client, params)
+# Commands go through the command queue of the box: concurrent requests
+# are serialized, superseded tunes and volume steps are coalesced.
+ROUTES = {
+    ("GET", "/info"): lambda client, params: client.info,
+    ("GET", "/status"): lambda client, params: client.status.as_dict(),
+    ("GET", "/state"): lambda client, params: "on" if client.state() else "off",
+    ("GET", "/channel"): lambda client, params: client.get_current_channel_name(),
+    ("GET", "/queue"): lambda client, params: client.commands.stats(),
+    ("POST", "/channel"): _channel,
+    ("POST", "/key"): lambda client, params: client.commands.press_key(
+        params["key"], int(params.get("mode", 0))
+    ).result(),
+    ("POST", "/keys"): _keys,
+    ("POST", "/vol"): _volume,
+    ("POST", "/on"): _turn_on,
+    ("POST", "/off"): lambda client, params: client.turn_off(),
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        _LOGGER.debug("%s - %s", self.address_string(), fmt % args)
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        # Read the body first, the connection is kept alive
+        body = self.rfile.read(length) if length else None
+        token = (self.headers.get(TOKEN_HEADER) or "").encode("latin-1")
+        if not hmac.compare_digest(token, self.server.gateway.token.encode("utf-8")):
+            return self.reply(401, {"error": "Missing or invalid token"})
+        # Commands only take their parameters from a JSON body, which
+        # pages cannot send cross-origin without a preflight
+        params = dict(parse_qsl(url.query)) if method == "GET" else {}
+        if body:
+            content_type = self.headers.get("Content-Type", "")
+            if content_type.split(";")[0].strip().lower() != "application/json":
+                return self.reply(415, {"error": "Body must be application/json"})
+            try:
+                payload = json.loads(body.decode("utf-8"))
+            except ValueError:
+                return self.reply(400, {"error": "Invalid JSON body"})
+            if not isinstance(payload, dict):
+                return self.reply(400, {"error": "Body must be a JSON object"})
+            params.update(payload)
+        try:
+            status, payload = self.server.gateway.handle(method, url.path, params)
+        except Exception as exc:
+            _LOGGER.exception("Error handling %s %s", method, self.path)
+            status, payload = 500, {"error": str(exc)}
+        self.reply(status, payload)
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        head = (
+            "HTTP/1.1 {} {}\r\n"
+            "Content-Type: application/json\r\n"
+            "Content-Length: {}\r\n\r\n".format(
+                status, self.responses.get(status, ("",))[0], len(body)
+            )
+        )
+        self.wfile.write(head.encode("latin-1") + body)
+
+
+class UnknownHostError(LiveboxPlayTvError):
+    """The host is not one the server was configured to serve"""
+
+
+class LiveboxServer(object):
+    """
+    Serve the boxes of a LiveboxFleet over HTTP. Boxes which were not
+    given upfront are refused, unless any_host is set: then they are
+    added on first request.
+
+    Requests must carry token (by default $LIVEBOXPLAYTV_DAEMON_TOKEN or
+    a random one), which is written to get_token_path(address) for the
+    clients on this machine.
+    """
+
+    def __init__(
+        self,
+        hosts=(),
+        address=DEFAULT_ADDRESS,
+        watch=True,
+        any_host=False,
+        allow_remote=False,
+        token=None,
+        **client_kwargs
+    ):
+        from .fleet import LiveboxFleet
+        from .metrics import MetricsCollector
+
+        if not allow_remote and not is_loopback(address[0]):
+            raise ValueError(
+                "Refusing to listen on {}, which is not a loopback address: "
+                "anyone reaching it could control the boxes".format(
+                    address[0] or "all interfaces"
+                )
+            )
+        # Metrics of the requests of the served boxes, see /stats
+        self.metrics = MetricsCollector()
+        client_kwargs["observers"] = list(client_kwargs.get("observers") or ()) + [
+            self.metrics
+        ]
+        self.fleet = LiveboxFleet(hosts, **client_kwargs)
+        self.any_host = any_host
+        self.watch = watch
+        self._watchers = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(tuple(address), _Handler)
+        self._server.daemon_threads = True
+        self._server.gateway = self
+        self._thread = None
+        self._serving = False
+        self.token = (
+            token
+            or os.environ.get("LIVEBOXPLAYTV_DAEMON_TOKEN")
+            or secrets.token_urlsafe(24)
+        )
+        self.token_path = get_token_path(self.address)
+        fd = os.open(self.token_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(self.token)
+
+    @property
+    def address(self):
+        return self._server.server_address[:2]
+
+    def client(self, host=None, lazy=False):
+        if host is None:
+            if not self.fleet.hosts:
+                raise ValueError("No host given")
+            host = self.fleet.hosts[0]
+        elif host not in self.fleet.hosts:
+            if not self.any_host:
+                raise UnknownHostError("Not a served host: {}".format(host))
+            with self._lock:
+                if host not in self.fleet.hosts:
+                    self.fleet.hosts.append(host)
+        client = self.fleet.client(host, lazy)
+        if self.watch and host not in self._watchers:
+            with self._lock:
+                if host not in self._watchers:
+                    self._watchers[host] = client.watch()
+        return client
+
+    def handle(self, method, path, params):
+        """Returns the (HTTP status, payload) of a request"""
+        import requests
+
+        if path == "/hosts":
+            return 200, {"result": self.fleet.health()}
+        if path == "/stats":
+            return 200, {"result": self.stats()}
+        handler = ROUTES.get((method, path))
+        if handler is None:
+            return 404, {"error": "No such endpoint: {} {}".format(method, path)}
+        try:
+            # Boxes to wake up may not answer yet: do not connect to them
+            lazy = path == "/on" and _flag(params, "wol")
+            client = self.client(params.get("host"), lazy)
+            return 200, {"result": handler(client, params)}
+        except UnknownHostError as exc:
+            return 403, {"error": str(exc)}
+        except ChannelNotFoundError as exc:
+            return 404, {"error": str(exc)}
+        except HostUnavailableError as exc:
+            return 503, {"error": str(exc)}
+        except CommandTimeoutError as exc:
+            return 504, {"error": str(exc)}
+        except (KeyError, ValueError, AssertionError) as exc:
+            return 400, {"error": "Bad request: {}".format(exc)}
+        except requests.RequestException as exc:
+            return 502, {"error": str(exc)}
+
+    def stats(self):
+        return {
+            "summary": self.metrics.summary(),
+            "prometheus": self.metrics.to_prometheus(),
+        }
+
+    def warm_up(self):
+        """Connect to every box and start watching them"""
+        for host, res in self.fleet.connect().items():
+            if res.error is None:
+                self.client(host)
+            else:
+                _LOGGER.warning("Could not connect to %s: %s", host, res.error)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="liveboxplaytv-server", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        _LOGGER.info("Serving on http://%s:%s", *self.address)
+        self._serving = True
+        self._server.serve_forever()
+
+    def stop(self):
+        if self._serving:
+            # Blocks forever if serve_forever() never ran
+            self._server.shutdown()
+        self._server.server_close()
+        try:
+            os.remove(self.token_path)
+        except OSError:
+            pass
+        for watcher in self._watchers.values():
+            # Watcher threads are daemons, do not wait for their long polls
+            watcher.stop(timeout=1)
+        self.fleet.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class DaemonError(LiveboxPlayTvError):
+    def __init__(self, status, message):
+        self.status = status
+        super(DaemonError, self).__init__(message)
+
+
+class DaemonClient(object):
+    """Minimal client of the daemon API (http.client only, for a fast CLI)"""
+
+    def __init__(self, address=None, timeout=10, token=None):
+        self.address = address or get_daemon_address()
+        self.timeout = timeout
+        self.token = token or get_daemon_token(self.address)
+        self._conn = None
+
+    def is_running(self, timeout=0.2):
+        import socket
+
+        try:
+            socket.create_connection(self.address, timeout).close()
+            return True
+        except OSError:
+            return False
+
+    def call(self, method, path, host=None, **params):
+        from http.client import HTTPConnection
+
+        if host is not None:
+            params["host"] = host
+        if self._conn is None:
+            self._conn = HTTPConnection(*self.address, timeout=self.timeout)
+        headers = {"Content-Type": "application/json"}
+        if self.token is not None:
+            headers[TOKEN_HEADER] = self.token
+        self._conn.request(method, path, body=json.dumps(params), headers=headers)
+        resp = self._conn.getresponse()
+        payload = json.loads(resp.read().decode("utf-8"))
+        if resp.status != 200:
+            raise DaemonError(resp.status, payload.get("error"))
+        return payload["result"]
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,360 @@
+# coding: utf-8
+"""
+Local stand-in for the HTTP server of a Livebox Play decoder, for tests and
+benchmarks:
+
+    python -m liveboxplaytv.simulator --port 8080 --latency 0.01
+
+It implements the remoteControl operations 10 (info), 01 (key press) and
+09 (tune to an EPG ID) as well as the notifyEvent long polling endpoint,
+with configurable latency, jitter, failure injection and zap and wake-up
+times. It can also answer SSDP searches (on a unicast port) to test
+discovery, and simulate a deep standby, left on Wake-on-LAN magic packets
+(received on a unicast port as well).
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+import argparse
+import json
+import logging
+import random
+import socket
+import threading
+import time
+
+from .keys import KEYS
+from .registry import REGISTRY
+
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_INFO = {
+    "timeShiftingState": "0",
+    "playedMediaType": "LIVE",
+    "playedMediaState": "PLAY",
+    "playedMediaId": "192",
+    "playedMediaContextId": "1",
+    "playedMediaPosition": "NA",
+    "osdContext": "LIVE",
+    "macAddress": "a4:3e:51:00:00:01",
+    "wolSupport": "0",
+    "friendlyName": "décodeur TV d'Orange",
+    "activeStandbyState": "0",
+    "npvrSupport": "0",
+}
+
+
+def make_response(data=None, code="0", message="ok"):
+    return {"result": {"responseCode": code, "message": message, "data": data or {}}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        _LOGGER.debug("%s - %s", self.address_string(), fmt % args)
+
+    def do_GET(self):
+        sim = self.server.simulator
+        url = urlsplit(self.path)
+        # Keep the '*' padding of EPG IDs as is
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+        sim.requests += 1
+        if sim.deep_standby:
+            self.close_connection = True
+            return
+        sim.delay()
+        if sim.should_fail():
+            if sim.failure_mode == "drop":
+                self.close_connection = True
+                return
+            return self.reply(sim.failure_status, make_response(code="-1"))
+        if url.path == "/remoteControl/cmd":
+            status, payload = sim.handle_command(params)
+        elif url.path == "/remoteControl/notifyEvent":
+            status, payload = sim.wait_event()
+        else:
+            status, payload = 404, make_response(code="-1", message="not found")
+        self.reply(status, payload)
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        head = (
+            "HTTP/1.1 {} {}\r\n"
+            "Content-Type: application/json\r\n"
+            "Content-Length: {}\r\n\r\n".format(
+                status, self.responses.get(status, ("",))[0], len(body)
+            )
+        )
+        # Headers and body in a single write: no Nagle/delayed ACK stalls
+        self.wfile.write(head.encode("latin-1") + body)
+
+
+class LiveboxSimulator(object):
+    """
+    Simulated decoder, run in a background thread:
+
+        with LiveboxSimulator(latency=0.005) as sim:
+            box = LiveboxPlayTv(sim.host, port=sim.port)
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        jitter=0.0,
+        failure_rate=0.0,
+        failure_status=500,
+        failure_mode="status",
+        notify_timeout=30,
+        info=None,
+        seed=None,
+        ssdp=False,
+        zap_time=0.0,
+        wake_time=0.0,
+        wol=False,
+        deep_standby=False,
+    ):
+        self.host = host
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        # "status" replies with failure_status, "drop" closes the connection
+        self.failure_mode = failure_mode
+        self.notify_timeout = notify_timeout
+        # Delays before a tune and a power on take effect
+        self.zap_time = zap_time
+        self.wake_time = wake_time
+        # In deep standby, HTTP connections are dropped without an answer
+        self.deep_standby = deep_standby
+        self.wol_packets = 0
+        self._waking = False
+        self.info = dict(DEFAULT_INFO, **(info or {}))
+        self.requests = 0
+        self.keys = []
+        self._random = random.Random(seed)
+        self._events = []
+        self._cond = threading.Condition()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.simulator = self
+        self._thread = None
+        self._ssdp = None
+        if ssdp:
+            self._ssdp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._ssdp.bind((host, 0))
+        self._wol = None
+        if wol:
+            self._wol = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._wol.bind((host, 0))
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def ssdp_address(self):
+        if self._ssdp is not None:
+            return self._ssdp.getsockname()
+
+    @property
+    def wol_address(self):
+        if self._wol is not None:
+            return self._wol.getsockname()
+
+    @property
+    def url(self):
+        return "http://{}:{}".format(self.host, self.port)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="livebox-simulator", daemon=True
+        )
+        self._thread.start()
+        if self._ssdp is not None:
+            threading.Thread(
+                target=self._serve_ssdp, name="livebox-simulator-ssdp", daemon=True
+            ).start()
+        if self._wol is not None:
+            threading.Thread(
+                target=self._serve_wol, name="livebox-simulator-wol", daemon=True
+            ).start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._cond.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+        if self._ssdp is not None:
+            self._ssdp.close()
+        if self._wol is not None:
+            self._wol.close()
+
+    def _serve_ssdp(self):
+        reply = (
+            "HTTP/1.1 200 OK\r\n"
+            "CACHE-CONTROL: max-age=1800\r\n"
+            "LOCATION: {}/\r\n"
+            "SERVER: Linux UPnP/1.0 liveboxplaytv-simulator\r\n"
+            "ST: urn:schemas-upnp-org:device:MediaRenderer:1\r\n"
+            "USN: uuid:{}::urn:schemas-upnp-org:device:MediaRenderer:1\r\n"
+            "\r\n".format(self.url, self.info["macAddress"])
+        ).encode("ascii")
+        while True:
+            try:
+                data, address = self._ssdp.recvfrom(4096)
+            except OSError:
+                # Closed
+                return
+            if data.startswith(b"M-SEARCH"):
+                self._ssdp.sendto(reply, address)
+
+    def _serve_wol(self):
+        from .wol import magic_packet
+
+        while True:
+            try:
+                data, address = self._wol.recvfrom(1024)
+            except OSError:
+                # Closed
+                return
+            if data != magic_packet(self.info["macAddress"]):
+                continue
+            self.wol_packets += 1
+            if self.deep_standby and not self._waking:
+                self._waking = True
+                timer = threading.Timer(self.wake_time, self._wake_up)
+                timer.daemon = True
+                timer.start()
+
+    def _wake_up(self):
+        self._waking = False
+        self.deep_standby = False
+        self.set_state(activeStandbyState="0")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def delay(self):
+        delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def should_fail(self):
+        return self.failure_rate and self._random.random() < self.failure_rate
+
+    def set_state(self, **changes):
+        """Update the simulated state and queue a notification event"""
+        changes = {k: v for k, v in changes.items() if self.info.get(k) != v}
+        if not changes:
+            return
+        with self._cond:
+            self.info.update(changes)
+            event = dict(changes)
+            if "playedMediaId" in changes:
+                event["eventType"] = "MEDIA_CHANGED"
+            elif "activeStandbyState" in changes:
+                event["eventType"] = "STANDBY_STATE_CHANGED"
+            else:
+                event["eventType"] = "OSD_CONTEXT_CHANGED"
+            self._events.append(event)
+            self._cond.notify_all()
+
+    def set_state_later(self, delay, **changes):
+        if delay <= 0:
+            return self.set_state(**changes)
+        timer = threading.Timer(delay, self.set_state, kwargs=changes)
+        timer.daemon = True
+        timer.start()
+
+    def wait_event(self):
+        with self._cond:
+            if not self._events:
+                self._cond.wait(self.notify_timeout)
+            if not self._events:
+                return 200, make_response(message="no event")
+            event = self._events.pop(0)
+        return 200, make_response(event, message="event notification")
+
+    def handle_command(self, params):
+        operation = params.get("operation")
+        if operation == "10":
+            return 200, make_response(dict(self.info))
+        if operation == "01":
+            try:
+                key = int(params["key"])
+                mode = int(params.get("mode", 0))
+            except (KeyError, ValueError):
+                return 400, make_response(code="-1", message="bad key")
+            self.press_key(key, mode)
+            return 200, make_response()
+        if operation == "09":
+            epg_id = params.get("epg_id", "").lstrip("*")
+            if not epg_id:
+                return 400, make_response(code="-1", message="bad epg_id")
+            self.set_state_later(self.zap_time, playedMediaId=epg_id, osdContext="LIVE")
+            return 200, make_response()
+        return 400, make_response(code="-1", message="unknown operation")
+
+    def press_key(self, key, mode=0):
+        self.keys.append((key, mode))
+        if mode == 2:
+            # Release after a long press
+            return
+        if key == KEYS["POWER"]:
+            if self.info["activeStandbyState"] == "0":
+                self.set_state(activeStandbyState="1")
+            else:
+                self.set_state_later(self.wake_time, activeStandbyState="0")
+        elif key in (KEYS["CH+"], KEYS["CH-"]):
+            channels = [c for c in REGISTRY if c.epg_id not in (None, "0")]
+            current = REGISTRY.by_epg_id(self.info["playedMediaId"])
+            pos = channels.index(current) if current in channels else 0
+            pos += 1 if key == KEYS["CH+"] else -1
+            self.set_state(playedMediaId=channels[pos % len(channels)].epg_id)
+        elif key == KEYS["PLAY/PAUSE"]:
+            state = "PAUSE" if self.info["playedMediaState"] == "PLAY" else "PLAY"
+            self.set_state(playedMediaState=state)
+        elif key == KEYS["MENU"]:
+            self.set_state(osdContext="MAIN_PROCESS")
+        elif key == KEYS["BACK"]:
+            self.set_state(osdContext="LIVE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Livebox Play simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("-p", "--port", type=int, default=8080)
+    parser.add_argument("-l", "--latency", type=float, default=0.0)
+    parser.add_argument("-j", "--jitter", type=float, default=0.0)
+    parser.add_argument("-f", "--failure-rate", type=float, default=0.0)
+    parser.add_argument("-z", "--zap-time", type=float, default=0.0)
+    parser.add_argument("-w", "--wake-time", type=float, default=0.0)
+    parser.add_argument("-d", "--debug", action="store_true", default=False)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    sim = LiveboxSimulator(
+        args.host,
+        args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        zap_time=args.zap_time,
+        wake_time=args.wake_time,
+    )
+    _LOGGER.info("Simulating a Livebox Play on %s", sim.url)
+    try:
+        sim._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
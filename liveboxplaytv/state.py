@@ -0,0 +1,160 @@
+# coding: utf-8
+
+
+from enum import Enum
+
+from .registry import REGISTRY
+
+
+# The enums are str subclasses: they compare equal to the raw values.
+# Values the box reports which are not listed here are kept as plain strings.
+class MediaState(str, Enum):
+    PLAY = "PLAY"
+    PAUSE = "PAUSE"
+
+
+class MediaType(str, Enum):
+    LIVE = "LIVE"
+    VOD = "VOD"
+    PVR = "PVR"
+    REPLAY = "REPLAY"
+
+
+class OsdContext(str, Enum):
+    LIVE = "LIVE"
+    MAIN_PROCESS = "MAIN_PROCESS"
+    HOMEPAGE = "HOMEPAGE"
+    EPG = "EPG"
+    VOD = "VOD"
+
+
+def _enum(enum, value):
+    if value is None:
+        return
+    try:
+        return enum(value)
+    except ValueError:
+        return value
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        # eg. "NA" when nothing is played
+        return
+
+
+def _flag(value):
+    if value is None:
+        return
+    return value == "1"
+
+
+class LiveboxState(object):
+    """
+    Decoded snapshot of the box info (operation 10). The raw dict is kept as
+    raw, the other fields are typed:
+
+        standby, timeshift, wol_support, npvr_support: bool
+        media_position: int (None when not applicable)
+        media_state, media_type, osd_context: enums
+        channel: Channel record of the registry
+    """
+
+    FIELDS = (
+        "standby",
+        "epg_id",
+        "channel",
+        "media_state",
+        "media_type",
+        "media_position",
+        "media_context_id",
+        "osd_context",
+        "timeshift",
+        "mac_address",
+        "friendly_name",
+        "wol_support",
+        "npvr_support",
+    )
+
+    __slots__ = FIELDS + ("raw",)
+
+    def __init__(self, raw=None, **fields):
+        self.raw = raw
+        for name in self.FIELDS:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_info(cls, data, registry=REGISTRY):
+        standby = data.get("activeStandbyState")
+        epg_id = data.get("playedMediaId")
+        wol_support = data.get("wolSupport")
+        return cls(
+            raw=data,
+            standby=None if standby is None else standby != "0",
+            epg_id=epg_id,
+            # No playedMediaId gives the "N/A" channel, as before
+            channel=registry.by_epg_id(epg_id),
+            media_state=_enum(MediaState, data.get("playedMediaState")),
+            media_type=_enum(MediaType, data.get("playedMediaType")),
+            media_position=_int(data.get("playedMediaPosition")),
+            media_context_id=data.get("playedMediaContextId"),
+            osd_context=_enum(OsdContext, data.get("osdContext")),
+            timeshift=_flag(data.get("timeShiftingState")),
+            mac_address=data.get("macAddress"),
+            friendly_name=data.get("friendlyName"),
+            # "0" means supported
+            wol_support=None if wol_support is None else wol_support == "0",
+            npvr_support=_flag(data.get("npvrSupport")),
+        )
+
+    @property
+    def is_on(self):
+        return self.standby is False
+
+    @property
+    def channel_name(self):
+        if self.channel is not None:
+            return self.channel.name
+
+    def diff(self, previous):
+        """
+        Changes since a previous snapshot (or None), as a
+        {field: (old value, new value)} dict
+        """
+        changes = {}
+        for name in self.FIELDS:
+            new = getattr(self, name)
+            old = getattr(previous, name) if previous is not None else None
+            if old != new:
+                changes[name] = (old, new)
+        return changes
+
+    def as_dict(self):
+        """JSON friendly dict of the typed fields"""
+        result = {}
+        for name in self.FIELDS:
+            value = getattr(self, name)
+            if isinstance(value, Enum):
+                value = value.value
+            elif name == "channel":
+                value = self.channel_name
+            result[name] = value
+        return result
+
+    def __eq__(self, other):
+        if not isinstance(other, LiveboxState):
+            return NotImplemented
+        return all(getattr(self, n) == getattr(other, n) for n in self.FIELDS)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "LiveboxState({})".format(
+            ", ".join("{}={!r}".format(k, v) for k, v in self.as_dict().items())
+        )
@@ -0,0 +1,281 @@
+# coding: utf-8
+"""
+Lightweight HTTP transport for the remote control operations.
+
+The requests of the known operations (10, 01 with every key code and mode,
+09 with a padded EPG ID) are prebuilt as bytes and sent on persistent
+sockets, only the status line, the framing headers and the body of the
+answers are parsed. Errors are raised as requests exceptions, anything
+the transport does not handle is left to requests:
+
+    box = LiveboxPlayTv("192.168.1.3", transport="raw")
+"""
+
+from collections import deque
+import json
+import logging
+import socket
+import threading
+import time
+
+import requests
+
+from .keys import KEYS
+
+
+_LOGGER = logging.getLogger(__name__)
+
+CMD_PATH = "/remoteControl/cmd"
+KEY_MODES = (0, 1, 2)
+
+
+class UnsupportedResponse(Exception):
+    """The answer is not one the transport can parse"""
+
+
+class RawResponse(object):
+    """The subset of requests.Response the client uses"""
+
+    __slots__ = ("status_code", "content", "url")
+
+    # No urllib3 response (and retry history) behind it
+    raw = None
+
+    def __init__(self, status_code, content, url):
+        self.status_code = status_code
+        self.content = content
+        self.url = url
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(
+                "{} Error for url: {}".format(self.status_code, self.url),
+                response=self,
+            )
+
+    def __repr__(self):
+        return "<RawResponse [{}]>".format(self.status_code)
+
+
+def _read_response(sock, buf):
+    """Returns (status, body, keep_alive), buf is the start of the answer"""
+    while True:
+        end = buf.find(b"\r\n\r\n")
+        if end >= 0:
+            break
+        chunk = sock.recv(65536)
+        if not chunk:
+            raise ConnectionResetError("Connection closed in the headers")
+        buf += chunk
+    head, body = buf[:end], buf[end + 4 :]
+    lines = head.split(b"\r\n")
+    try:
+        version, status = lines[0].split(None, 2)[:2]
+        status = int(status)
+    except ValueError:
+        raise UnsupportedResponse("Bad status line: {!r}".format(lines[0]))
+    if status < 200:
+        raise UnsupportedResponse("Informational status {}".format(status))
+    length = None
+    chunked = False
+    keep_alive = version == b"HTTP/1.1"
+    for line in lines[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            length = int(value)
+        elif name == b"transfer-encoding":
+            chunked = value.strip().lower() == b"chunked"
+            if not chunked:
+                raise UnsupportedResponse("Transfer-Encoding: {!r}".format(value))
+        elif name == b"connection":
+            keep_alive = value.strip().lower() != b"close"
+    if chunked:
+        body = _read_chunked(sock, body)
+    elif length is not None:
+        while len(body) < length:
+            chunk = sock.recv(max(length - len(body), 65536))
+            if not chunk:
+                raise ConnectionResetError("Connection closed in the body")
+            body += chunk
+    else:
+        # Body delimited by the end of the connection
+        keep_alive = False
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            body += chunk
+    return status, body, keep_alive
+
+
+def _read_chunked(sock, buf):
+    body = b""
+    while True:
+        while b"\r\n" not in buf:
+            chunk = sock.recv(65536)
+            if not chunk:
+                raise ConnectionResetError("Connection closed in a chunk")
+            buf += chunk
+        size_line, _, buf = buf.partition(b"\r\n")
+        try:
+            size = int(size_line.split(b";")[0], 16)
+        except ValueError:
+            raise UnsupportedResponse("Bad chunk size: {!r}".format(size_line))
+        # Chunk data, then CRLF (after the last chunk: trailers, then CRLF)
+        needed = size + 2 if size else 2
+        while len(buf) < needed:
+            chunk = sock.recv(65536)
+            if not chunk:
+                raise ConnectionResetError("Connection closed in a chunk")
+            buf += chunk
+        if not size:
+            return body
+        body += buf[:size]
+        buf = buf[size + 2 :]
+
+
+class RawTransport(object):
+    """Persistent sockets to a box, with prebuilt requests"""
+
+    def __init__(self, hostname, port=8080, retries=2, backoff_factor=0.1, max_idle=4):
+        self.hostname = hostname
+        self.port = port
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.max_idle = max_idle
+        self._base_url = "http://{}:{}".format(hostname, port)
+        self._head = (
+            " HTTP/1.1\r\nHost: {}:{}\r\nAccept: */*\r\n"
+            "Connection: keep-alive\r\n\r\n".format(hostname, port)
+        )
+        self._info = self.build("operation=10")
+        self._keys = {
+            (code, mode): self.build("operation=01&key={}&mode={}".format(code, mode))
+            for code in set(KEYS.values())
+            for mode in KEY_MODES
+        }
+        self._tunes = {}
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    def build(self, query):
+        """(request bytes, URL) of a remoteControl/cmd query"""
+        target = "{}?{}".format(CMD_PATH, query)
+        return ("GET " + target + self._head).encode("ascii"), self._base_url + target
+
+    def prebuilt(self, operation, params=None):
+        """Prebuilt request of an rq() call, None if there is none"""
+        operation = str(operation)
+        if operation == "10" and not params:
+            return self._info
+        if operation == "01" and params and len(params) == 2:
+            try:
+                return self._keys.get((int(params["key"]), int(params["mode"])))
+            except (KeyError, TypeError, ValueError):
+                return
+
+    def tune(self, epg_id_str, uui=1):
+        """Operation 09 request, the '*' padding is sent as is"""
+        key = (epg_id_str, uui)
+        request = self._tunes.get(key)
+        if request is None:
+            request = self.build(
+                "operation=09&epg_id={}&uui={}".format(epg_id_str, uui)
+            )
+            if len(self._tunes) < 4096:
+                self._tunes[key] = request
+        return request
+
+    def _connect(self, connect_timeout):
+        for attempt in range(self.retries + 1):
+            try:
+                sock = socket.create_connection(
+                    (self.hostname, self.port), connect_timeout
+                )
+            except socket.timeout as exc:
+                error = requests.ConnectTimeout(exc)
+            except OSError as exc:
+                error = requests.ConnectionError(exc)
+            else:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                return sock
+            if attempt < self.retries:
+                time.sleep(self.backoff_factor * 2**attempt)
+        raise error
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+
+    def _release(self, sock):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(sock)
+                return
+        sock.close()
+
+    def send(self, request, timeout=None):
+        """
+        Send a prebuilt request, returns a RawResponse. timeout is a
+        (connect, read) tuple or a number.
+        """
+        data, url = request
+        if isinstance(timeout, tuple):
+            connect_timeout, read_timeout = timeout
+        else:
+            connect_timeout = read_timeout = timeout
+        sock = self._acquire()
+        # A reused socket may have been closed by the box in the meantime:
+        # then the request was not processed and can be sent again
+        reused = sock is not None
+        while True:
+            if sock is None:
+                sock = self._connect(connect_timeout)
+            error = "Connection closed without an answer"
+            try:
+                sock.settimeout(read_timeout)
+                sock.sendall(data)
+                first = sock.recv(65536)
+            except socket.timeout as exc:
+                sock.close()
+                raise requests.ReadTimeout(exc)
+            except OSError as exc:
+                first, error = b"", exc
+            if first:
+                break
+            sock.close()
+            sock = None
+            if not reused:
+                raise requests.ConnectionError(error)
+            reused = False
+        try:
+            status, body, keep_alive = _read_response(sock, first)
+        except socket.timeout as exc:
+            sock.close()
+            raise requests.ReadTimeout(exc)
+        except OSError as exc:
+            sock.close()
+            raise requests.ConnectionError(exc)
+        except Exception:
+            sock.close()
+            raise
+        if keep_alive:
+            self._release(sock)
+        else:
+            sock.close()
+        return RawResponse(status, body, url)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for sock in idle:
+            sock.close()
@@ -0,0 +1,17 @@
+# coding: utf-8
+
+
+import os
+
+
+def get_cache_dir(*parts):
+    """Per-user cache directory, $XDG_CACHE_HOME/liveboxplaytv by default"""
+    base = os.environ.get("LIVEBOXPLAYTV_CACHE_DIR")
+    if not base:
+        xdg = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        base = os.path.join(xdg, "liveboxplaytv")
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
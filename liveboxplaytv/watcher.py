@@ -0,0 +1,232 @@
+# coding: utf-8
+
+
+from collections import namedtuple
+import logging
+import threading
+import time
+
+import requests
+
+from .exceptions import LiveboxPlayTvError
+
+
+_LOGGER = logging.getLogger(__name__)
+
+CHANNEL = "channel"
+STANDBY = "standby"
+MEDIA_STATE = "media_state"
+MEDIA_TYPE = "media_type"
+OSD_CONTEXT = "osd_context"
+TIMESHIFT = "timeshift"
+
+# LiveboxState fields reported as change events. The media position is left
+# out on purpose, it changes all the time during playback.
+WATCHED_FIELDS = {
+    "epg_id": CHANNEL,
+    "standby": STANDBY,
+    "media_state": MEDIA_STATE,
+    "media_type": MEDIA_TYPE,
+    "osd_context": OSD_CONTEXT,
+    "timeshift": TIMESHIFT,
+}
+
+# Info keys of the events which carry the new state
+EVENT_FIELDS = (
+    "playedMediaId",
+    "activeStandbyState",
+    "playedMediaState",
+    "playedMediaType",
+    "osdContext",
+    "timeShiftingState",
+)
+
+# old and new are typed (see LiveboxState), state is the new LiveboxState
+# and info its raw dict
+StateChange = namedtuple(
+    "StateChange", ["kind", "field", "old", "new", "info", "state"]
+)
+
+
+def diff_states(old, new):
+    """List the StateChanges between two LiveboxStates, old may be None"""
+    changes = new.diff(old)
+    return [
+        StateChange(kind, field, changes[field][0], changes[field][1], new.raw, new)
+        for field, kind in WATCHED_FIELDS.items()
+        if field in changes
+    ]
+
+
+class StateWatcher(object):
+    """
+    Track the state of a box from a background thread and notify subscribers
+    of StateChanges.
+
+    The watcher long polls /remoteControl/notifyEvent, applies the events to
+    the cached info of the client and falls back to adaptive polling of the
+    info when the event endpoint keeps failing.
+    """
+
+    def __init__(
+        self,
+        client,
+        notify_timeout=60,
+        min_backoff=1,
+        max_backoff=60,
+        max_failures=3,
+        min_poll_interval=1,
+        max_poll_interval=30,
+        notify_retry_interval=300,
+    ):
+        self.client = client
+        self.notify_timeout = notify_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.max_failures = max_failures
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.notify_retry_interval = notify_retry_interval
+        self.polling = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def subscribe(self, callback):
+        """Register callback(change), returns a function to unsubscribe"""
+        with self._lock:
+            self._callbacks.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+        return unsubscribe
+
+    async def events(self):
+        """Async iterator over the StateChanges"""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        unsubscribe = self.subscribe(
+            lambda change: loop.call_soon_threadsafe(queue.put_nowait, change)
+        )
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            unsubscribe()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="liveboxplaytv-watcher-{}".format(self.client.hostname),
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        # A pending long poll request is not interrupted, the thread exits
+        # as soon as it returns (see notify_timeout)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _publish(self, changes):
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for change in changes:
+            _LOGGER.debug(
+                "State change: %s %s -> %s", change.kind, change.old, change.new
+            )
+            for callback in callbacks:
+                try:
+                    callback(change)
+                except Exception:
+                    _LOGGER.exception("Error in state change callback")
+
+    def handle_event(self, event):
+        """Apply a notifyEvent payload to the client state"""
+        old = self.client.cached_status
+        data = (event.get("result") or {}).get("data") or {}
+        update = {k: v for k, v in data.items() if k in EVENT_FIELDS}
+        if update:
+            self.client.update_info(update)
+        else:
+            # Events which do not carry the new state (eg. OSD_CONTEXT_CHANGED
+            # with a service name): fetch it
+            _LOGGER.debug("Refresh info after event %s", data.get("eventType"))
+            self.client.refresh()
+        changes = diff_states(old, self.client.cached_status)
+        self._publish(changes)
+        return changes
+
+    def poll(self):
+        """Refresh the client state and publish the changes"""
+        old = self.client.cached_status
+        self.client.refresh()
+        changes = diff_states(old, self.client.cached_status)
+        self._publish(changes)
+        return changes
+
+    def _run(self):
+        failures = 0
+        interval = self.min_poll_interval
+        polling_since = None
+        try:
+            # Initial state, so that the first event can be diffed
+            self.client.refresh()
+        except (requests.RequestException, LiveboxPlayTvError) as exc:
+            _LOGGER.warning("Could not fetch the initial state: %s", exc)
+        while not self._stop.is_set():
+            if not self.polling:
+                try:
+                    event = self.client.event_notify(timeout=self.notify_timeout)
+                    failures = 0
+                    self.handle_event(event)
+                except requests.exceptions.ReadTimeout:
+                    # No event during the long poll
+                    failures = 0
+                except Exception as exc:
+                    failures += 1
+                    backoff = min(
+                        self.min_backoff * 2 ** (failures - 1), self.max_backoff
+                    )
+                    _LOGGER.warning(
+                        "Event notification failed (%s), retrying in %ss",
+                        exc,
+                        backoff,
+                    )
+                    if failures >= self.max_failures:
+                        _LOGGER.warning("Falling back to polling")
+                        self.polling = True
+                        polling_since = time.monotonic()
+                        interval = self.min_poll_interval
+                    self._stop.wait(backoff)
+                continue
+
+            try:
+                changes = self.poll()
+                # Poll faster while things are happening, back off when idle
+                if changes:
+                    interval = self.min_poll_interval
+                else:
+                    interval = min(interval * 2, self.max_poll_interval)
+            except Exception as exc:
+                _LOGGER.warning("Polling failed: %s", exc)
+                interval = self.max_poll_interval
+            if time.monotonic() - polling_since >= self.notify_retry_interval:
+                _LOGGER.info("Retrying event notifications")
+                self.polling = False
+                failures = 0
+            self._stop.wait(interval)
@@ -0,0 +1,83 @@
+# coding: utf-8
+"""
+Wake-on-LAN, to power on boxes in deep standby (their HTTP server does not
+answer then):
+
+    send_magic_packet("a4:3e:51:00:00:01", directed_broadcasts("192.168.1.3"))
+
+Boxes report whether they support it (wolSupport) along with their MAC
+address, see LiveboxPlayTv.power_on.
+"""
+
+import binascii
+import ipaddress
+import logging
+import re
+import socket
+
+
+_LOGGER = logging.getLogger(__name__)
+
+WOL_PORT = 9
+BROADCAST = "255.255.255.255"
+
+
+def parse_mac(mac):
+    """The 6 bytes of a MAC address (aa:bb:cc:dd:ee:ff, aa-bb-..., aabb.cc...)"""
+    digits = re.sub(r"[:\-.]", "", mac)
+    if len(digits) != 12:
+        raise ValueError("Invalid MAC address: {!r}".format(mac))
+    try:
+        return binascii.unhexlify(digits)
+    except (binascii.Error, TypeError):
+        raise ValueError("Invalid MAC address: {!r}".format(mac))
+
+
+def magic_packet(mac):
+    return b"\xff" * 6 + parse_mac(mac) * 16
+
+
+def directed_broadcasts(host, prefix=24):
+    """
+    Broadcast addresses to reach host: the one of its /prefix (routers
+    forward directed broadcasts, not limited ones), then 255.255.255.255
+    """
+    addresses = []
+    try:
+        address = ipaddress.ip_address(socket.gethostbyname(host))
+    except (OSError, ValueError) as exc:
+        _LOGGER.debug("Could not resolve %s: %s", host, exc)
+    else:
+        network = ipaddress.ip_network("{}/{}".format(address, prefix), strict=False)
+        addresses.append(str(network.broadcast_address))
+    addresses.append(BROADCAST)
+    return addresses
+
+
+def send_magic_packet(mac, addresses=(BROADCAST,), port=WOL_PORT, count=3):
+    """
+    Send the magic packet of mac count times to every address (UDP). Fails
+    only if it could not be sent to any of them.
+    """
+    packet = magic_packet(mac)
+    if isinstance(addresses, str):
+        addresses = (addresses,)
+    sent = 0
+    error = None
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        for address in addresses:
+            try:
+                for _ in range(count):
+                    sock.sendto(packet, (address, port))
+                sent += 1
+            except OSError as exc:
+                _LOGGER.debug("Could not send a magic packet to %s: %s", address, exc)
+                error = exc
+    finally:
+        sock.close()
+    if not sent and error is not None:
+        raise error
+    _LOGGER.info("Sent Wake-on-LAN to %s via %s", mac, ", ".join(addresses))
+    return sent
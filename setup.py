@@ -13,11 +13,9 @@ setup(
     url="https://github.com/pschmitt/python-liveboxplaytv",
     packages=find_packages(),
     install_requires=[
-        "fuzzywuzzy",
-        "python-Levenshtein",
+        "aiohttp",
         "pyteleloisirs>=3.6",
         "requests",
-        "wikipedia",
     ],
     entry_points={"console_scripts": ["liveboxplaytv=liveboxplaytv.cli:main"]},
 )
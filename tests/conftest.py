@@ -0,0 +1,36 @@
+# coding: utf-8
+
+import pytest
+
+from liveboxplaytv import REGISTRY, LiveboxPlayTv, lineup
+from liveboxplaytv.simulator import LiveboxSimulator
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    # Keep the discovery, lineup, guide and logo caches out of $HOME
+    path = tmp_path / "cache"
+    monkeypatch.setenv("LIVEBOXPLAYTV_CACHE_DIR", str(path))
+    return path
+
+
+@pytest.fixture
+def sim():
+    with LiveboxSimulator(notify_timeout=2) as sim:
+        yield sim
+
+
+@pytest.fixture
+def box(sim):
+    client = LiveboxPlayTv(sim.host, port=sim.port)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def registry(cache_dir):
+    # The default registry, loaded from the (empty) test cache directory
+    yield REGISTRY
+    # Tests sync or reload it: back to a lazy load for the next one
+    lineup._SYNCS.pop(REGISTRY, None)
+    REGISTRY._indexes = None
@@ -0,0 +1,94 @@
+# coding: utf-8
+
+import asyncio
+
+import aiohttp
+import pytest
+
+from liveboxplaytv import AsyncLiveboxPlayTv, ChannelRegistry
+from liveboxplaytv.aio import _SHARED_SESSIONS
+from liveboxplaytv.keys import KEYS
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+def test_commands(sim):
+    async def main():
+        async with AsyncLiveboxPlayTv(sim.host, port=sim.port) as box:
+            await box.connect()
+            assert box.is_on
+            assert box.status.channel.name == "TF1"
+            await box.set_channel("arte")
+            await box.volume_up()
+            await box.turn_off()
+
+    run(main())
+    assert sim.info["playedMediaId"] == "111"
+    assert sim.info["activeStandbyState"] == "1"
+    assert sim.keys == [(KEYS["VOL+"], 0), (KEYS["POWER"], 0)]
+
+
+def test_resolves_on_the_client_lineup(sim):
+    registry = ChannelRegistry(
+        [{"epg_id": "999", "index": "1", "name": "Nouvelle Chaîne"}]
+    )
+
+    async def main():
+        async with AsyncLiveboxPlayTv(
+            sim.host, port=sim.port, registry=registry
+        ) as box:
+            await box.set_channel("nouvelle chaine")
+            await box.get_info()
+            return box.status.channel
+
+    assert run(main()).name == "Nouvelle Chaîne"
+    assert sim.info["playedMediaId"] == "999"
+
+
+def test_event_notify_has_no_timeout_by_default(sim):
+    async def main():
+        box = AsyncLiveboxPlayTv(sim.host, port=sim.port, timeout=0.5)
+        loop = asyncio.get_running_loop()
+        # Longer than the client timeout
+        loop.call_later(1, lambda: sim.set_state(playedMediaId="111"))
+        event = await box.event_notify()
+        with pytest.raises(asyncio.TimeoutError):
+            await box.event_notify(timeout=0.2)
+        await box.close()
+        return event
+
+    assert run(main())["result"]["data"]["playedMediaId"] == "111"
+
+
+def test_close_releases_the_shared_session(sim):
+    async def main():
+        loop = asyncio.get_running_loop()
+        first = AsyncLiveboxPlayTv(sim.host, port=sim.port)
+        second = AsyncLiveboxPlayTv(sim.host, port=sim.port)
+        await first.get_info()
+        await second.get_info()
+        session = first.session
+        assert second.session is session
+        await first.close()
+        # Still used by the other client
+        assert not session.closed
+        await second.get_info()
+        await second.close()
+        assert session.closed
+        assert loop not in _SHARED_SESSIONS
+
+    run(main())
+
+
+def test_close_leaves_an_explicit_session_open(sim):
+    async def main():
+        async with aiohttp.ClientSession() as session:
+            async with AsyncLiveboxPlayTv(
+                sim.host, port=sim.port, session=session
+            ) as box:
+                await box.get_info()
+            assert not session.closed
+
+    run(main())
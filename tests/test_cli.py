@@ -0,0 +1,70 @@
+# coding: utf-8
+
+import functools
+
+import pytest
+
+from liveboxplaytv import LiveboxPlayTv, cli, server
+from liveboxplaytv.server import LiveboxServer
+
+
+@pytest.fixture
+def run(sim, monkeypatch, capsys):
+    # The CLI only takes host names, the simulator listens on another port
+    monkeypatch.setattr(
+        cli, "LiveboxPlayTv", functools.partial(LiveboxPlayTv, port=sim.port)
+    )
+    monkeypatch.delenv("LIVEBOXPLAYTV_DAEMON", raising=False)
+
+    def run(*argv):
+        monkeypatch.setattr("sys.argv", ["liveboxplaytv"] + list(argv))
+        cli.main()
+        return capsys.readouterr().out.strip()
+
+    return run
+
+
+@pytest.fixture
+def no_daemon(monkeypatch):
+    def is_running(self, timeout=0.2):
+        raise AssertionError("The daemon was tried")
+
+    monkeypatch.setattr(server.DaemonClient, "is_running", is_running)
+
+
+def test_direct_by_default(sim, run, no_daemon):
+    assert run("-H", sim.host, "state") == "on"
+    assert run("-H", sim.host, "channel") == "TF1"
+
+
+def test_mac_cache_only_for_power_commands(sim, run, cache_dir):
+    path = cache_dir / "discovery.json"
+    run("-H", sim.host, "state")
+    run("-H", sim.host, "channel", "Arte")
+    assert not path.exists()
+    run("-H", sim.host, "off")
+    assert sim.info["macAddress"] in path.read_text()
+
+
+def test_daemon_when_asked(sim, run, monkeypatch):
+    host = "{}:{}".format(sim.host, sim.port)
+    with LiveboxServer([host], ("127.0.0.1", 0), watch=False) as daemon:
+        address = "{}:{}".format(*daemon.address)
+        monkeypatch.setenv("LIVEBOXPLAYTV_DAEMON", address)
+        run("-H", host, "channel", "Arte")
+        assert daemon.metrics.summary()["requests"][host]["09"]["count"] == 1
+        # --no-daemon wins over the environment
+        run("--no-daemon", "-H", sim.host, "channel", "France 2")
+        assert daemon.metrics.summary()["requests"][host]["09"]["count"] == 1
+    assert sim.info["playedMediaId"] == "4"
+
+
+def test_uses_daemon(monkeypatch):
+    monkeypatch.delenv("LIVEBOXPLAYTV_DAEMON", raising=False)
+    monkeypatch.setattr("sys.argv", ["liveboxplaytv", "-H", "box", "state"])
+    assert not cli.uses_daemon(cli.parse_args())
+    monkeypatch.setattr("sys.argv", ["liveboxplaytv", "--daemon", "-H", "box", "state"])
+    assert cli.uses_daemon(cli.parse_args())
+    monkeypatch.setenv("LIVEBOXPLAYTV_DAEMON", "127.0.0.1:8765")
+    monkeypatch.setattr("sys.argv", ["liveboxplaytv", "-H", "box", "state"])
+    assert cli.uses_daemon(cli.parse_args())
@@ -0,0 +1,180 @@
+# coding: utf-8
+
+import threading
+import time
+
+import pytest
+import requests
+
+from liveboxplaytv import HostUnavailableError, LiveboxPlayTv
+from liveboxplaytv.health import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from liveboxplaytv.keys import KEYS
+from liveboxplaytv.liveboxplaytv import max_request_time
+from liveboxplaytv.simulator import LiveboxSimulator
+
+
+def test_info_is_cached(sim, box):
+    requests_before = sim.requests
+    assert box.info["playedMediaId"] == "192"
+    assert box.channel == "TF1"
+    assert sim.requests == requests_before
+
+
+def test_invalidate(sim, box):
+    sim.set_state(playedMediaId="111")
+    assert box.info["playedMediaId"] == "192"
+    box.invalidate()
+    assert box.info["playedMediaId"] == "111"
+    assert box.channel == "Arte"
+
+
+def test_commands_invalidate_the_cache(sim, box):
+    box.info
+    box.press_key("PLAY/PAUSE")
+    assert sim.keys == [(KEYS["PLAY/PAUSE"], 0)]
+    assert box.media_state == "PAUSE"
+
+
+def test_status_is_decoded_once_per_snapshot(box):
+    assert box.status is box.status
+    assert box.status.channel.name == "TF1"
+    assert box.cached_status is box.status
+    box.refresh()
+    assert box.cached_status.raw is box._info
+
+
+def test_cached_status_does_no_io(sim):
+    box = LiveboxPlayTv(sim.host, port=sim.port, lazy=True)
+    assert box.cached_status is None
+    assert sim.requests == 0
+
+
+@pytest.mark.parametrize("osd, name", [("VOD", "VOD"), ("AdvPlayer", "Replay")])
+def test_channel_name_without_a_played_media(sim, box, osd, name):
+    del sim.info["playedMediaId"]
+    sim.set_state(osdContext=osd)
+    box.refresh()
+    assert box.status.channel.name == "N/A"
+    assert box.get_current_channel_name() == name
+
+
+def test_turn_on_raises_when_a_key_fails(sim, box):
+    sim.set_state(activeStandbyState="1")
+    box.refresh()
+    sim.failure_rate = 1.0
+    with pytest.raises(requests.HTTPError):
+        box.turn_on()
+
+
+def test_close_resets_the_command_queue(sim, box):
+    queue = box.commands
+    box.close()
+    assert box._commands is None
+    assert box.commands is not queue
+    box.commands.press_key("OK").result(5)
+    assert sim.keys == [(KEYS["OK"], 0)]
+
+
+def test_raw_transport(sim):
+    with LiveboxPlayTv(sim.host, port=sim.port, transport="raw") as box:
+        assert box.rq(10) == LiveboxPlayTv(sim.host, port=sim.port).rq(10)
+        box.set_channel("Arte")
+        box.press_key("OK")
+        assert sim.info["playedMediaId"] == "111"
+        assert sim.keys == [(KEYS["OK"], 0)]
+
+
+def test_raw_transport_concurrent_fallback(sim, monkeypatch):
+    from liveboxplaytv import transport
+
+    def unsupported(sock, buf):
+        raise transport.UnsupportedResponse("test")
+
+    box = LiveboxPlayTv(sim.host, port=sim.port, transport="raw")
+    monkeypatch.setattr(transport, "_read_response", unsupported)
+    errors = []
+
+    def run():
+        for _ in range(10):
+            try:
+                box.refresh()
+            except Exception as exc:
+                errors.append(exc)
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert box._transport is None
+    box.close()
+
+
+def test_circuit_breaker_transitions():
+    changes = []
+    breaker = CircuitBreaker(
+        2, reset_timeout=0.1, on_change=lambda *c: changes.append(c)
+    )
+    assert breaker.acquire() == CLOSED
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.acquire() is None
+    time.sleep(0.15)
+    assert breaker.acquire() == HALF_OPEN
+    # Only one probe at a time
+    assert breaker.acquire() is None
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert changes == [(CLOSED, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, CLOSED)]
+
+
+def test_circuit_opens_on_a_dead_box():
+    with LiveboxSimulator(failure_rate=1.0, failure_mode="drop") as sim:
+        box = LiveboxPlayTv(
+            sim.host,
+            port=sim.port,
+            retries=0,
+            failure_threshold=2,
+            reset_timeout=0.2,
+            lazy=True,
+        )
+        for _ in range(2):
+            with pytest.raises(requests.ConnectionError):
+                box.rq(10)
+        assert box.breaker.state == OPEN
+        requests_before = sim.requests
+        with pytest.raises(HostUnavailableError):
+            box.rq(10)
+        # Failed fast, without reaching the box
+        assert sim.requests == requests_before
+
+        # The probe closes the circuit once the box answers again
+        sim.failure_rate = 0.0
+        time.sleep(0.25)
+        assert box.rq(10)["result"]["data"]["playedMediaId"] == "192"
+        assert box.breaker.state == CLOSED
+        box.close()
+
+
+def test_stale_info_while_unavailable():
+    with LiveboxSimulator() as sim:
+        box = LiveboxPlayTv(
+            sim.host, port=sim.port, retries=0, failure_threshold=1, reset_timeout=60
+        )
+        sim.failure_rate = 1.0
+        sim.failure_mode = "drop"
+        box.invalidate()
+        with pytest.raises(requests.ConnectionError):
+            box.info
+        # Circuit open: the last known state is served
+        assert box.channel == "TF1"
+        box.close()
+
+
+def test_max_request_time():
+    # 3 connection attempts, 0.1 + 0.2 of backoff, then the read
+    assert max_request_time(1, retries=2, backoff_factor=0.1) == pytest.approx(4.3)
+    assert max_request_time(3, connect_timeout=1, retries=0) == 4
@@ -0,0 +1,49 @@
+# coding: utf-8
+
+from liveboxplaytv.commands import CommandQueue
+from liveboxplaytv.keys import KEYS
+
+
+def test_tunes_are_coalesced(sim, box):
+    queue = CommandQueue(box, debounce=0.2)
+    futures = [queue.set_channel(name) for name in ("TF1", "France 2", "Arte")]
+    for future in futures:
+        future.result(5)
+    assert queue.sent == 1
+    assert queue.coalesced == 2
+    assert sim.info["playedMediaId"] == "111"
+    queue.close()
+
+
+def test_volume_steps_add_up(sim, box):
+    queue = CommandQueue(box, debounce=0.2)
+    queue.volume_up(3)
+    queue.volume_down(1).result(5)
+    assert sim.keys == [(KEYS["VOL+"], 0)] * 2
+
+    del sim.keys[:]
+    queue.volume_up()
+    queue.volume_down().result(5)
+    assert sim.keys == []
+    queue.close()
+
+
+def test_keys_are_not_coalesced(sim, box):
+    queue = CommandQueue(box, debounce=0.2)
+    queue.press_key("OK")
+    queue.press_key("OK").result(5)
+    assert sim.keys == [(KEYS["OK"], 0)] * 2
+    assert queue.coalesced == 0
+    queue.close()
+
+
+def test_commands_keep_their_order(sim, box):
+    queue = CommandQueue(box, debounce=0.05)
+    queue.press_key("MENU")
+    queue.set_channel("Arte")
+    queue.press_key("BACK")
+    assert queue.join(5)
+    assert sim.keys == [(KEYS["MENU"], 0), (KEYS["BACK"], 0)]
+    assert sim.info["playedMediaId"] == "111"
+    assert sim.info["osdContext"] == "LIVE"
+    queue.close()
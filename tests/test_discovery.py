@@ -0,0 +1,104 @@
+# coding: utf-8
+
+import json
+
+import pytest
+
+from liveboxplaytv.discovery import DiscoveryCache, discover, probe, ssdp_search
+from liveboxplaytv.simulator import LiveboxSimulator
+
+
+@pytest.fixture
+def ssdp_sim():
+    with LiveboxSimulator(ssdp=True) as sim:
+        yield sim
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DiscoveryCache(str(tmp_path / "discovery.json"))
+
+
+def test_probe(sim):
+    assert probe(sim.host, sim.port)["macAddress"] == sim.info["macAddress"]
+    # Not a box
+    del sim.info["macAddress"]
+    assert probe(sim.host, sim.port) is None
+
+
+def test_ssdp_search(ssdp_sim):
+    answers = list(ssdp_search(0.5, ssdp_sim.ssdp_address))
+    assert len(answers) == 1
+    host, headers = answers[0]
+    assert host == "127.0.0.1"
+    assert headers["LOCATION"] == ssdp_sim.url + "/"
+
+
+def test_discover_over_ssdp(ssdp_sim, cache):
+    boxes = list(
+        discover(
+            ports=(ssdp_sim.port,),
+            ssdp_timeout=0.5,
+            ssdp_address=ssdp_sim.ssdp_address,
+            cache=cache,
+        )
+    )
+    assert [(b.mac, b.host, b.port, b.source) for b in boxes] == [
+        (ssdp_sim.info["macAddress"], "127.0.0.1", ssdp_sim.port, "ssdp")
+    ]
+    assert cache.get(ssdp_sim.info["macAddress"]).port == ssdp_sim.port
+
+
+def test_discover_by_scan(ssdp_sim, cache):
+    # The SSDP answer and the scan find the same box: it is probed once
+    with LiveboxSimulator(info={"macAddress": "a4:3e:51:00:00:02"}) as other:
+        boxes = list(
+            discover(
+                network="127.0.0.1/32",
+                ports=(ssdp_sim.port, other.port),
+                ssdp_timeout=0.5,
+                ssdp_address=ssdp_sim.ssdp_address,
+                cache=cache,
+            )
+        )
+        assert other.requests == 1
+    assert sorted(b.mac for b in boxes) == [
+        "a4:3e:51:00:00:01",
+        "a4:3e:51:00:00:02",
+    ]
+    assert ssdp_sim.requests == 1
+
+
+def test_cache_is_written_once(sim, cache, monkeypatch):
+    saves = []
+    save = cache.save
+    monkeypatch.setattr(cache, "save", lambda: saves.append(save()))
+    with LiveboxSimulator(info={"macAddress": "a4:3e:51:00:00:02"}) as other:
+        boxes = list(
+            discover(
+                network="127.0.0.1/32",
+                ports=(sim.port, other.port),
+                ssdp=False,
+                cache=cache,
+            )
+        )
+    assert len(boxes) == 2
+    assert len(saves) == 1
+    with open(cache.path) as fp:
+        assert len(json.load(fp)["boxes"]) == 2
+    # Found again from the file, by MAC address
+    assert DiscoveryCache(cache.path).get("A4:3E:51:00:00:02").port == other.port
+
+
+def test_stop_iterating(sim, cache):
+    # Stopping early cancels the pending probes, and still saves the cache
+    boxes = discover(
+        network="127.0.0.0/29",
+        ports=(sim.port,),
+        ssdp=False,
+        max_workers=1,
+        cache=cache,
+    )
+    assert next(boxes).host == "127.0.0.1"
+    boxes.close()
+    assert len(DiscoveryCache(cache.path)) == 1
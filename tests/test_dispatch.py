@@ -0,0 +1,49 @@
+# coding: utf-8
+
+import pytest
+import requests
+
+from liveboxplaytv import dispatch
+from liveboxplaytv.dispatch import LazyResponse
+from liveboxplaytv.keys import KEYS
+
+
+def test_commands_run_in_order(sim, box):
+    futures = [box.nowait.press_key(key) for key in ("1", "2", "OK")]
+    futures.append(box.nowait.set_channel("Arte"))
+    for future in futures:
+        response = future.result(5)
+        assert isinstance(response, LazyResponse)
+        assert response["result"]["responseCode"] == "0"
+    assert sim.keys == [(KEYS["1"], 0), (KEYS["2"], 0), (KEYS["OK"], 0)]
+    assert sim.info["playedMediaId"] == "111"
+
+
+def test_lazy_response(sim, box):
+    response = box.nowait.volume_up().result(5)
+    assert response.status_code == 200
+    # Decoded on first access only
+    assert response._data is dispatch._MISSING
+    assert response.get("result")["responseCode"] == "0"
+    assert response._data is response.data
+    assert repr(response) == "<LazyResponse [200]>"
+
+
+def test_errors_are_raised_by_the_future(sim, box):
+    with pytest.raises(AssertionError):
+        box.nowait.press_key("NOPE")
+    sim.failure_rate = 1
+    future = box.nowait.press_key("OK")
+    with pytest.raises(requests.RequestException):
+        future.result(10)
+
+
+def test_close_recreates_the_dispatcher(sim, box):
+    dispatcher = box.nowait
+    dispatcher.mute()
+    box.close()
+    # The pending command was sent before the executor stopped
+    assert sim.keys == [(KEYS["MUTE"], 0)]
+    assert box.nowait is not dispatcher
+    box.nowait.mute().result(5)
+    assert len(sim.keys) == 2
@@ -0,0 +1,88 @@
+# coding: utf-8
+
+import socket
+import threading
+import time
+
+import pytest
+
+from liveboxplaytv.fleet import LiveboxFleet
+from liveboxplaytv.keys import KEYS
+from liveboxplaytv.liveboxplaytv import max_request_time
+from liveboxplaytv.simulator import LiveboxSimulator
+
+
+def free_port():
+    # Nothing listens there once closed: connections are refused
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_broadcast(sim):
+    dead = "127.0.0.1:{}".format(free_port())
+    host = "{}:{}".format(sim.host, sim.port)
+    with LiveboxFleet([host, dead], retries=0) as fleet:
+        results = fleet.press_key("OK")
+        assert results[host].error is None
+        assert results[dead].error is not None
+        assert fleet.health()[host]["healthy"]
+    assert sim.keys == [(KEYS["OK"], 0)]
+
+
+def test_wait_budget_covers_the_client_retries():
+    fleet = LiveboxFleet([], timeout=1, retries=3, backoff_factor=0.5)
+    assert fleet.request_time == max_request_time(1, retries=3, backoff_factor=0.5)
+    # More than the former 2 x timeout
+    assert fleet.request_time > 2 * fleet.timeout
+    fleet.close()
+
+
+def test_close_keeps_the_clients_of_running_operations():
+    with LiveboxSimulator(latency=0.5) as sim:
+        host = "{}:{}".format(sim.host, sim.port)
+        fleet = LiveboxFleet([host])
+        fleet.connect()
+        thread = threading.Thread(target=fleet.info)
+        client = fleet.client(host)
+        client.invalidate()
+        thread.start()
+        time.sleep(0.1)
+        fleet.close()
+        assert client._session is not None
+        thread.join(5)
+        # Closed once the operation ended
+        assert client._session is None
+        with pytest.raises(RuntimeError):
+            fleet._run(host, "refresh", (), {})
+
+
+def test_per_host_deadline():
+    sims = [LiveboxSimulator().start() for _ in range(4)]
+    try:
+        hosts = ["{}:{}".format(s.host, s.port) for s in sims]
+        stuck = hosts[0]
+        release = threading.Event()
+
+        def operation(client):
+            if "{}:{}".format(client.hostname, client.port) == stuck:
+                release.wait(10)
+            return "ok"
+
+        with LiveboxFleet(hosts, max_workers=2, timeout=0.2, retries=0) as fleet:
+            fleet.connect()
+            budget = 2 * fleet.request_time
+            start = time.monotonic()
+            results = fleet.broadcast(operation)
+            elapsed = time.monotonic() - start
+            release.set()
+        # The stuck host only holds the others for its own budget, not for
+        # one per batch of workers
+        assert budget <= elapsed < 1.5 * budget
+        assert isinstance(results[stuck].error, TimeoutError)
+        assert [results[h].result for h in hosts[1:]] == ["ok"] * 3
+    finally:
+        for sim in sims:
+            sim.stop()
@@ -0,0 +1,108 @@
+# coding: utf-8
+
+import asyncio
+import datetime
+import threading
+import time
+
+import pytest
+
+from liveboxplaytv import ChannelRegistry, LiveboxPlayTv
+from liveboxplaytv.guide import Program, ProgramGuide, StaticFetcher
+
+
+def program(name, start, minutes, **extra):
+    return dict(
+        {
+            "name": name,
+            "type": "Film",
+            "img": None,
+            "url": None,
+            "summary": "Résumé de " + name,
+            "start_time": start,
+            "end_time": start + datetime.timedelta(minutes=minutes),
+        },
+        **extra
+    )
+
+
+@pytest.fixture
+def guide(tmp_path):
+    now = datetime.datetime.now().replace(microsecond=0)
+    start = now - datetime.timedelta(minutes=30)
+    fetcher = StaticFetcher(
+        {
+            "TF1": [
+                program("Avant", start - datetime.timedelta(minutes=60), 60),
+                program("Maintenant", start, 60),
+                program("Après", start + datetime.timedelta(minutes=60), 60),
+            ]
+        }
+    )
+    return ProgramGuide(fetcher, path=str(tmp_path / "guide.json"))
+
+
+def test_get_program(guide):
+    assert guide.get_program("TF1").name == "Maintenant"
+    later = time.time() + 3600
+    assert guide.get_program("TF1", at=later).name == "Après"
+    assert [p.name for p in guide.get_programs("TF1")] == ["Maintenant", "Après"]
+    assert guide.get_program("TF1").summary == "Résumé de Maintenant"
+
+
+def test_saved_guide(guide, tmp_path):
+    guide.refresh()
+    loaded = ProgramGuide(StaticFetcher({}), path=guide.path)
+    assert loaded.now_playing()["TF1"].name == "Maintenant"
+    # Guides saved before the summary was kept
+    assert Program(*loaded.now_playing()["TF1"][:6]).summary is None
+
+
+def test_current_program_keeps_the_pyteleloisirs_format(sim, guide):
+    box = LiveboxPlayTv(sim.host, port=sim.port, guide=guide)
+    current = asyncio.run(box.async_get_current_program())
+    assert current["name"] == "Maintenant"
+    assert current["summary"] == "Résumé de Maintenant"
+    assert isinstance(current["start_time"], datetime.datetime)
+    assert current["end_time"] - current["start_time"] == datetime.timedelta(hours=1)
+    assert asyncio.run(box.async_get_current_program_name()) == "Maintenant"
+    # get_program returns the Program itself
+    assert box.get_program().name == "Maintenant"
+    box.close()
+
+
+def test_async_refresh_saves_off_the_event_loop(guide, monkeypatch):
+    threads = []
+    monkeypatch.setattr(guide, "save", lambda: threads.append(threading.get_ident()))
+
+    async def refresh():
+        await guide.async_refresh(["TF1"])
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(refresh())
+    assert threads and loop_thread not in threads
+
+
+def test_blocking_refresh_in_an_event_loop(guide):
+    async def get_program():
+        return guide.get_program("TF1")
+
+    with pytest.raises(RuntimeError, match="async_refresh"):
+        asyncio.run(get_program())
+
+    async def get_fresh_program():
+        await guide.async_refresh(["TF1"])
+        # Fresh: no refresh
+        return guide.get_program("TF1")
+
+    assert asyncio.run(get_fresh_program()).name == "Maintenant"
+
+
+def test_resolves_on_the_guide_lineup(tmp_path):
+    registry = ChannelRegistry(
+        [{"epg_id": "999", "index": "1", "name": "Nouvelle Chaîne"}]
+    )
+    now = datetime.datetime.now()
+    fetcher = StaticFetcher({"Nouvelle Chaîne": [program("Maintenant", now, 60)]})
+    guide = ProgramGuide(fetcher, registry, path=str(tmp_path / "guide.json"))
+    assert guide.get_program("nouvelle chaine").name == "Maintenant"
@@ -0,0 +1,176 @@
+# coding: utf-8
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+import pytest
+
+from liveboxplaytv import images
+from liveboxplaytv.images import (
+    ImageCache,
+    find_logo_src,
+    get_channel_image,
+    prefetch_channel_images,
+    resize_image_url,
+)
+from liveboxplaytv.registry import Channel, ChannelRegistry
+
+LOGO = "//upload.wikimedia.org/wikipedia/commons/thumb/a/a0/TF1.svg/220px-TF1.svg.png"
+
+
+def article(name, logo=LOGO, paragraphs=10):
+    infobox = '<table><tr><td><img alt="Image illustrative de l\'article {}" src="{}">'
+    body = "".join(
+        '<p>Paragraphe {0} <img alt="Figure {0}" src="//upload.wikimedia.org/{0}.png">'
+        "</p>".format(i)
+        for i in range(paragraphs)
+    )
+    html = "<html><body>{}</td></tr></table>{}</body></html>".format(
+        infobox.format(name, logo) if logo else "", body
+    )
+    return html.encode("utf-8")
+
+
+class _WikiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        wiki = self.server.wiki
+        wiki.requests.append(self.path)
+        wiki.clients.add(self.client_address)
+        body = wiki.pages.get(self.path)
+        status = 200 if body is not None else 404
+        body = body if body is not None else b"not found"
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Wiki(object):
+    """Local stand-in for the Wikipedia articles"""
+
+    def __init__(self):
+        self.pages = {}
+        self.requests = []
+        self.clients = set()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _WikiHandler)
+        self._server.daemon_threads = True
+        self._server.wiki = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/wiki/{{}}".format(self._server.server_address[1])
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def wiki(monkeypatch):
+    wiki = Wiki()
+    monkeypatch.setattr(images, "WIKI_URL", wiki.url)
+    yield wiki
+    wiki.stop()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ImageCache(str(tmp_path / "images.sqlite"))
+
+
+def chunked(html, size=64):
+    return [html[i : i + size] for i in range(0, len(html), size)]
+
+
+def test_find_logo_src():
+    chunks = chunked(article("TF1", paragraphs=100))
+    consumed = []
+
+    def feed():
+        for chunk in chunks:
+            consumed.append(chunk)
+            yield chunk
+
+    assert find_logo_src(feed()) == LOGO
+    # Stopped at the logo, with the tag split over several chunks
+    assert len(consumed) < len(chunks) / 10
+    assert find_logo_src(chunked(article("TF1", logo=None))) is None
+
+
+def test_first_illustration_wins():
+    # Articles have a single one, the infobox logo: the first one is kept
+    html = article("TF1") + b'<img alt="Image illustrative bis" src="//other/1px.png">'
+    assert find_logo_src([html]) == LOGO
+
+
+def test_resize_image_url():
+    assert resize_image_url(LOGO, 300) == "https:" + LOGO.replace("220px", "300px")
+    assert resize_image_url("https://x/10px.png", 50) == "https://x/50px.png"
+
+
+def test_image_cache(cache, tmp_path):
+    with pytest.raises(KeyError):
+        cache.get("TF1", 300)
+    assert cache.get("TF1", 300, None) is None
+    cache.set("TF1", 300, "https://logo")
+    cache.set("Arte", 300, None)
+    # Persistent
+    other = ImageCache(cache.path)
+    assert other.get("TF1", 300) == "https://logo"
+    # A failed lookup is cached too
+    assert other.get("Arte", 300, "missing") is None
+    other.clear()
+    assert cache.get("TF1", 300, "missing") == "missing"
+
+
+def test_image_cache_expiry(tmp_path):
+    cache = ImageCache(str(tmp_path / "images.sqlite"), ttl=60, negative_ttl=0)
+    cache.set("TF1", 300, "https://logo")
+    cache.set("Arte", 300, None)
+    time.sleep(0.01)
+    assert cache.get("TF1", 300) == "https://logo"
+    with pytest.raises(KeyError):
+        cache.get("Arte", 300)
+
+
+def test_get_channel_image(wiki, cache):
+    wiki.pages["/wiki/TF1"] = article("TF1")
+    channel = Channel("192", "1", "TF1", "TF1", max_img_size=250)
+    expected = "https:" + LOGO.replace("220px", "250px")
+    assert get_channel_image(channel, 300, cache=cache) == expected
+    assert get_channel_image(channel, 300, cache=cache) == expected
+    assert len(wiki.requests) == 1
+    assert get_channel_image(channel, 300, skip_cache=True, cache=cache) == expected
+    assert len(wiki.requests) == 2
+
+    # Missing articles are cached as well
+    missing = Channel("1", "2", "Nulle part", "Nulle part")
+    assert get_channel_image(missing, cache=cache) is None
+    assert get_channel_image(missing, cache=cache) is None
+    assert wiki.requests[2:] == ["/wiki/Nulle_part"]
+
+
+def test_prefetch_reuses_the_connections(wiki, cache):
+    names = ["TF1", "France 2", "Arte"]
+    registry = ChannelRegistry(
+        [
+            {"epg_id": str(i), "index": str(i), "name": n, "wiki_page": n}
+            for i, n in enumerate(names)
+        ]
+    )
+    for name in names:
+        wiki.pages["/wiki/" + name.replace(" ", "_")] = article(name)
+    logos = prefetch_channel_images(registry, 300, max_workers=1, cache=cache)
+    assert set(logos) == set(names)
+    assert all(logos.values())
+    assert len(wiki.requests) == 3
+    # One worker, one keep-alive connection
+    assert len(wiki.clients) == 1
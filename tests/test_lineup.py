@@ -0,0 +1,79 @@
+# coding: utf-8
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+from liveboxplaytv import CHANNELS, ChannelRegistry, LiveboxPlayTv
+from liveboxplaytv.lineup import (
+    FileSource,
+    LineupSync,
+    get_lineup_path,
+    get_lineup_sync,
+    parse_lineup,
+    save_compiled,
+)
+from liveboxplaytv.registry import default_lineup
+
+
+PAYLOAD = {
+    "channels": [
+        {"epgId": "192", "name": "TF1", "number": "1"},
+        {"epgId": "4", "name": "France 2", "number": "2"},
+        {"epgId": "999", "name": "Nouvelle", "number": "3"},
+    ]
+}
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "lineup.json"
+    path.write_text(json.dumps(PAYLOAD))
+    return FileSource(str(path))
+
+
+def test_sync(registry, source, tmp_path):
+    sync = LineupSync(registry, source, path=str(tmp_path / "lineup.marshal"))
+    diff = sync.sync()
+    assert [c.name for c in diff.added] == ["Nouvelle"]
+    assert registry.get("Nouvelle").epg_id == "999"
+    assert registry.get("Arte") is None
+    # Fresh: nothing fetched
+    assert sync.sync() is None
+
+    other = ChannelRegistry()
+    assert LineupSync(other, source, path=sync.path).load()
+    assert other.get("Nouvelle").epg_id == "999"
+
+
+def test_update_lineup_keeps_the_sync_state(registry, source):
+    box = LiveboxPlayTv("127.0.0.1", registry=registry, lazy=True)
+    assert box.update_lineup(source=source).added
+    sync = get_lineup_sync(registry)
+    assert sync.etag is not None
+    # Same LineupSync, still fresh
+    assert box.update_lineup(source=source) is None
+    assert get_lineup_sync(registry) is sync
+    # Forced, but not modified
+    assert box.update_lineup(force=True, source=source).added == []
+
+
+def test_default_registry_loads_the_cached_lineup(cache_dir):
+    bundled = ChannelRegistry(loader=default_lineup)
+    assert len(bundled) == len(CHANNELS)
+
+    save_compiled(get_lineup_path(), parse_lineup(PAYLOAD))
+    registry = ChannelRegistry(loader=default_lineup)
+    assert registry.get("Nouvelle").epg_id == "999"
+    assert registry.get("Arte") is None
+
+
+def test_import_does_not_build_the_lineup():
+    code = (
+        "import sys, liveboxplaytv; "
+        "assert 'liveboxplaytv.channels' not in sys.modules; "
+        "assert liveboxplaytv.REGISTRY._indexes is None"
+    )
+    subprocess.check_call([sys.executable, "-c", code])
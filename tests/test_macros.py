@@ -0,0 +1,54 @@
+# coding: utf-8
+
+import pytest
+
+from liveboxplaytv.keys import KEYS
+from liveboxplaytv.macros import LONG_PRESS, PRESS, RELEASE, Step, parse_macro
+
+
+def test_parse_macro():
+    assert parse_macro("12, OK") == [
+        Step(KEYS["1"], PRESS, None),
+        Step(KEYS["2"], PRESS, None),
+        Step(KEYS["OK"], PRESS, None),
+    ]
+    assert parse_macro("vol+*3") == [Step(KEYS["VOL+"], PRESS, None)] * 3
+    assert parse_macro(["wait:0.5", "long:OK", "release:OK", 512]) == [
+        Step(None, None, 0.5),
+        Step(KEYS["OK"], LONG_PRESS, None),
+        Step(KEYS["OK"], RELEASE, None),
+        Step(512, PRESS, None),
+    ]
+    with pytest.raises(ValueError):
+        parse_macro("1 NOPE")
+
+
+def test_press_keys(sim, box):
+    result = box.press_keys("1 2 OK long:MENU release:MENU", pace=0.05)
+    assert result.sent == 5
+    assert result.errors == []
+    assert sim.keys == [
+        (KEYS["1"], PRESS),
+        (KEYS["2"], PRESS),
+        (KEYS["OK"], PRESS),
+        (KEYS["MENU"], LONG_PRESS),
+        (KEYS["MENU"], RELEASE),
+    ]
+    # Paced, and the cached state is dropped afterwards
+    assert result.elapsed >= 4 * 0.05
+    assert box.last_command is not None
+
+
+def test_wait_steps(sim, box):
+    result = box.press_keys("OK wait:0.3 OK", pace=0)
+    assert result.sent == 2
+    assert result.elapsed >= 0.3
+
+
+def test_stop_on_error(sim, box):
+    sim.failure_rate = 1
+    result = box.press_keys("1 2 3", pace=0)
+    assert (result.sent, len(result.errors)) == (0, 1)
+    assert result.errors[0][0] == Step(KEYS["1"], PRESS, None)
+    result = box.press_keys("1 2 3", pace=0, stop_on_error=False)
+    assert (result.sent, len(result.errors)) == (0, 3)
@@ -0,0 +1,112 @@
+# coding: utf-8
+
+import pytest
+import requests
+
+from liveboxplaytv import HostUnavailableError, LiveboxPlayTv
+from liveboxplaytv.health import OPEN
+from liveboxplaytv.metrics import (
+    OBSERVERS,
+    Histogram,
+    MetricsCollector,
+    Observer,
+    add_observer,
+    remove_observer,
+)
+
+
+@pytest.fixture
+def collector():
+    return MetricsCollector()
+
+
+@pytest.fixture
+def client(sim, collector):
+    client = LiveboxPlayTv(
+        sim.host,
+        port=sim.port,
+        retries=0,
+        failure_threshold=2,
+        observers=[collector],
+        lazy=True,
+    )
+    yield client
+    client.close()
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1]
+    summary = histogram.summary()
+    assert (summary["count"], summary["p50"], summary["max"]) == (4, 0.5, 5)
+    assert Histogram().summary()["mean"] is None
+
+
+def test_requests_and_caches(sim, client, collector):
+    client.info
+    client.info
+    client.set_channel("Arte")
+    summary = collector.summary()
+    stats = summary["requests"][client.address]
+    assert stats["10"]["count"] == 1
+    assert stats["09"]["count"] == 1
+    assert stats["10"]["errors"] == 0
+    assert stats["10"]["bytes"] > 0
+    info = summary["caches"]["info"]
+    assert (info["hits"], info["misses"], info["ratio"]) == (1, 1, 0.5)
+
+
+def test_errors_and_circuit(sim, client, collector):
+    sim.failure_mode = "drop"
+    sim.failure_rate = 1
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            client.get_info()
+    # Not even sent
+    with pytest.raises(HostUnavailableError):
+        client.get_info()
+    summary = collector.summary()
+    assert summary["requests"][client.address]["10"]["errors"] == 2
+    assert summary["circuits"][client.address] == {"state": OPEN, "opened": 1}
+
+
+def test_timings(sim, client, collector):
+    sim.zap_time = 0.1
+    elapsed = client.set_channel_confirmed("Arte", timeout=5)
+    zap = collector.summary()["histograms"]["zap"][client.address]
+    assert zap["count"] == 1
+    assert zap["max"] == elapsed >= 0.1
+
+
+def test_prometheus(sim, client, collector):
+    client.get_info()
+    text = collector.to_prometheus()
+    labels = 'host="{}",operation="10"'.format(client.address)
+    assert "# TYPE liveboxplaytv_request_duration_seconds histogram" in text
+    assert (
+        'liveboxplaytv_request_duration_seconds_bucket{{{},le="+Inf"}} 1'.format(labels)
+        in text
+    )
+    assert "liveboxplaytv_request_errors_total{{{}}} 0".format(labels) in text
+    collector.reset()
+    assert collector.summary()["requests"] == {}
+
+
+def test_global_observers(sim, box, collector):
+    class Broken(Observer):
+        def on_request(self, *args, **kwargs):
+            raise RuntimeError("ignored")
+
+    broken = add_observer(Broken())
+    add_observer(collector)
+    try:
+        # A failing observer neither breaks the request nor the others
+        box.get_info()
+    finally:
+        remove_observer(broken)
+        remove_observer(collector)
+    assert OBSERVERS == []
+    box.get_info()
+    assert collector.summary()["requests"][box.address]["10"]["count"] == 1
@@ -0,0 +1,52 @@
+# coding: utf-8
+
+import pytest
+
+from liveboxplaytv import ChannelNotFoundError
+from liveboxplaytv.resolver import ChannelResolver, normalize
+
+
+@pytest.fixture
+def resolver(registry):
+    return ChannelResolver(registry)
+
+
+def test_normalize():
+    assert normalize("Canal+ Décalé") == "canal plus decale"
+
+
+def test_exact_names_aliases_and_numbers(resolver):
+    assert resolver.match("France 2")[1] == 1.0
+    assert resolver.resolve("Canal Plus").name == "Canal+"
+    assert resolver.resolve("#7").name == "Arte"
+
+
+def test_fuzzy_match_above_the_threshold(resolver):
+    chan, score = resolver.match("frnce 2")
+    assert chan.name == "France 2"
+    assert resolver.threshold <= score < 1.0
+    assert resolver.resolve("frnce 2") is chan
+
+
+def test_below_the_threshold(resolver):
+    with pytest.raises(ChannelNotFoundError) as excinfo:
+        resolver.resolve("zzzz qqqq")
+    assert excinfo.value.score < resolver.threshold
+    # A looser threshold accepts the best candidate
+    chan, score = resolver.match("Arté HD")
+    assert resolver.resolve("Arté HD", threshold=score) is chan
+    with pytest.raises(ChannelNotFoundError):
+        resolver.resolve("Arté HD", threshold=min(score + 0.01, 1.0))
+
+
+def test_no_fuzzy_match_on_channel_numbers(resolver):
+    with pytest.raises(ChannelNotFoundError):
+        resolver.resolve("#9999")
+
+
+def test_cache_dropped_on_reload(resolver):
+    assert resolver.resolve("frnce 2").epg_id == "4"
+    resolver.registry.load(
+        [{"epg_id": "9", "index": "2", "name": "France 2", "wiki_page": None}]
+    )
+    assert resolver.resolve("frnce 2").epg_id == "9"
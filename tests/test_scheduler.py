@@ -0,0 +1,82 @@
+# coding: utf-8
+
+import gc
+import queue
+import threading
+import weakref
+
+from liveboxplaytv import LiveboxPlayTv, PollScheduler
+from liveboxplaytv.simulator import LiveboxSimulator
+
+
+def make_scheduler(box, **kwargs):
+    kwargs.setdefault("interval", 30)
+    return PollScheduler(
+        box, standby_interval=300, playback_interval=5, command_interval=1, **kwargs
+    )
+
+
+def test_next_interval(sim, box):
+    scheduler = make_scheduler(box)
+    # Live TV is playback too
+    assert scheduler.next_interval(box.status) == 5
+    sim.set_state(playedMediaState="PAUSE", playedMediaType="VOD")
+    assert scheduler.next_interval(box.refresh()) == 5
+    # Nothing played, eg. on the home page
+    del sim.info["playedMediaState"]
+    sim.set_state(osdContext="HOMEPAGE")
+    box.refresh()
+    assert scheduler.next_interval(box.status) == 30
+    sim.set_state(activeStandbyState="1")
+    box.refresh()
+    assert scheduler.next_interval(box.status) == 300
+    assert scheduler.next_interval(None) == 300
+    box.press_key("OK")
+    assert scheduler.next_interval(box.status) == 1
+    scheduler.failures = 3
+    assert scheduler.next_interval(box.status) == 240
+
+
+def test_polls_right_after_a_command(sim, box):
+    snapshots = queue.Queue()
+    scheduler = make_scheduler(box, interval=60)
+    scheduler.add_listener(snapshots.put)
+    scheduler.start()
+    try:
+        assert snapshots.get(timeout=5)["playedMediaId"] == "192"
+        sim.set_state(playedMediaId="111")
+        box.press_key("OK")
+        assert snapshots.get(timeout=5)["playedMediaId"] == "111"
+    finally:
+        scheduler.stop(timeout=5)
+    assert not scheduler.running
+
+
+def test_stop_unregisters_from_the_client(box):
+    scheduler = make_scheduler(box, interval=60)
+    scheduler.start()
+    assert len(box._command_callbacks) == 1
+    scheduler.stop(timeout=5)
+    assert box._command_callbacks == []
+    ref = weakref.ref(scheduler)
+    del scheduler
+    gc.collect()
+    assert ref() is None
+
+
+def test_concurrent_refreshes_share_a_request():
+    with LiveboxSimulator(latency=0.3) as sim:
+        box = LiveboxPlayTv(sim.host, port=sim.port, lazy=True)
+        scheduler = make_scheduler(box)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(scheduler.refresh()))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sim.requests == 1
+        assert all(info is results[0] for info in results)
+        box.close()
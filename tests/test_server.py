@@ -0,0 +1,145 @@
+# coding: utf-8
+
+import json
+import os
+
+import pytest
+
+from liveboxplaytv.keys import KEYS
+from liveboxplaytv.server import (
+    TOKEN_HEADER,
+    DaemonClient,
+    DaemonError,
+    LiveboxServer,
+    get_daemon_token,
+)
+from liveboxplaytv.simulator import LiveboxSimulator
+
+
+@pytest.fixture
+def other():
+    with LiveboxSimulator(info={"macAddress": "a4:3e:51:00:00:02"}) as sim:
+        yield sim
+
+
+def host_of(sim):
+    return "{}:{}".format(sim.host, sim.port)
+
+
+def test_commands(sim):
+    with LiveboxServer([host_of(sim)], ("127.0.0.1", 0), watch=False) as server:
+        daemon = DaemonClient(server.address)
+        assert daemon.call("GET", "/state") == "on"
+        daemon.call("POST", "/channel", channel="Arte")
+        daemon.call("POST", "/key", key="OK")
+        assert daemon.call("GET", "/channel") == "Arte"
+        with pytest.raises(DaemonError) as excinfo:
+            daemon.call("POST", "/channel", channel="zzzz qqqq")
+        assert excinfo.value.status == 404
+        daemon.close()
+    assert sim.keys == [(KEYS["OK"], 0)]
+
+
+def test_unknown_hosts_are_refused(sim, other):
+    with LiveboxServer([host_of(sim)], ("127.0.0.1", 0), watch=False) as server:
+        daemon = DaemonClient(server.address)
+        with pytest.raises(DaemonError) as excinfo:
+            daemon.call("POST", "/key", host=host_of(other), key="OK")
+        assert excinfo.value.status == 403
+        daemon.close()
+        assert server.fleet.hosts == [host_of(sim)]
+    assert other.requests == 0
+
+
+def test_any_host(sim, other):
+    with LiveboxServer(
+        [host_of(sim)], ("127.0.0.1", 0), watch=False, any_host=True
+    ) as server:
+        daemon = DaemonClient(server.address)
+        daemon.call("POST", "/key", host=host_of(other), key="OK")
+        daemon.close()
+        assert server.fleet.hosts == [host_of(sim), host_of(other)]
+    assert other.keys == [(KEYS["OK"], 0)]
+
+
+def test_loopback_only_by_default(sim):
+    for address in ("0.0.0.0", ""):
+        with pytest.raises(ValueError):
+            LiveboxServer([host_of(sim)], (address, 0))
+    server = LiveboxServer([host_of(sim)], ("0.0.0.0", 0), allow_remote=True)
+    server.stop()
+    LiveboxServer([host_of(sim)], ("localhost", 0)).stop()
+
+
+def raw_request(server, method, path, body=None, headers=None):
+    from http.client import HTTPConnection
+
+    conn = HTTPConnection(*server.address, timeout=5)
+    conn.request(method, path, body=body, headers=headers or {})
+    resp = conn.getresponse()
+    payload = json.loads(resp.read().decode("utf-8"))
+    conn.close()
+    return resp.status, payload
+
+
+def test_cross_origin_requests_are_refused(sim):
+    with LiveboxServer([host_of(sim)], ("127.0.0.1", 0), watch=False) as server:
+        token = {TOKEN_HEADER: server.token}
+        # What a web page can send without a preflight
+        for path, body, headers in (
+            ("/key?key=POWER", None, {}),
+            ("/key", '{"key": "POWER"}', {"Content-Type": "text/plain"}),
+            ("/key", '{"key": "POWER"}', {TOKEN_HEADER: "guess"}),
+        ):
+            assert raw_request(server, "POST", path, body, headers)[0] == 401
+        headers = dict(token, **{"Content-Type": "text/plain"})
+        status, _ = raw_request(server, "POST", "/key", '{"key": "POWER"}', headers)
+        assert status == 415
+        # No command parameters from the query string
+        status, _ = raw_request(server, "POST", "/key?key=POWER", None, token)
+        assert status == 400
+        # Reads still accept them
+        status, payload = raw_request(
+            server, "GET", "/channel?host=" + host_of(sim), None, token
+        )
+        assert (status, payload) == (200, {"result": "TF1"})
+    assert sim.keys == []
+
+
+def test_token_file(sim):
+    server = LiveboxServer([host_of(sim)], ("127.0.0.1", 0), watch=False)
+    assert get_daemon_token(server.address) == server.token
+    assert os.stat(server.token_path).st_mode & 0o777 == 0o600
+    server.stop()
+    assert get_daemon_token(server.address) is None
+
+
+def test_confirm_is_a_boolean(sim):
+    with LiveboxServer([host_of(sim)], ("127.0.0.1", 0), watch=False) as server:
+        daemon = DaemonClient(server.address)
+        with pytest.raises(DaemonError) as excinfo:
+            daemon.call("POST", "/channel", channel="Arte", confirm="false")
+        assert excinfo.value.status == 400
+        daemon.call("POST", "/channel", channel="Arte", confirm=False)
+        daemon.close()
+    assert sim.info["playedMediaId"] == "111"
+
+
+def test_stats(sim, monkeypatch, capsys):
+    from liveboxplaytv import cli
+
+    with LiveboxServer([host_of(sim)], ("127.0.0.1", 0), watch=False) as server:
+        daemon = DaemonClient(server.address)
+        for _ in range(3):
+            daemon.call("POST", "/key", key="OK")
+        stats = daemon.call("GET", "/stats")
+        daemon.close()
+        requests = stats["summary"]["requests"][host_of(sim)]
+        assert requests["01"]["count"] == 3
+        assert 'operation="01"} 3' in stats["prometheus"]
+
+        # The CLI reads the metrics of the running daemon
+        monkeypatch.setenv("LIVEBOXPLAYTV_DAEMON", "{}:{}".format(*server.address))
+        monkeypatch.setattr("sys.argv", ["liveboxplaytv", "stats", "--prometheus"])
+        cli.main()
+    assert stats["prometheus"].rstrip() in capsys.readouterr().out
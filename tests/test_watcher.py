@@ -0,0 +1,88 @@
+# coding: utf-8
+
+import asyncio
+import queue
+import time
+
+from liveboxplaytv.state import MediaState
+from liveboxplaytv.watcher import CHANNEL, MEDIA_STATE, STANDBY, StateWatcher
+
+
+def next_changes(changes, count, timeout=5):
+    return [changes.get(timeout=timeout) for _ in range(count)]
+
+
+def watch(sim, box, *args, **kwargs):
+    """Start a watcher, once it fetched the initial state and long polls"""
+    requests_before = sim.requests
+    watcher = box.watch(*args, **kwargs)
+    deadline = time.monotonic() + 5
+    while sim.requests < requests_before + 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return watcher
+
+
+def test_events(sim, box):
+    changes = queue.Queue()
+    watcher = watch(sim, box, changes.put, notify_timeout=2)
+    try:
+        sim.set_state(playedMediaId="111")
+        change = changes.get(timeout=5)
+        assert (change.kind, change.old, change.new) == (CHANNEL, "192", "111")
+        assert change.state.channel.name == "Arte"
+        assert change.info["playedMediaId"] == "111"
+        # The cached state is up to date, without a request
+        requests_before = sim.requests
+        assert box.channel == "Arte"
+        assert sim.requests == requests_before
+
+        sim.set_state(activeStandbyState="1", playedMediaState="PAUSE")
+        received = {c.kind: c for c in next_changes(changes, 2)}
+        assert received[STANDBY].new is True
+        assert received[MEDIA_STATE].old == MediaState.PLAY
+        assert received[MEDIA_STATE].new == MediaState.PAUSE
+    finally:
+        watcher.stop(timeout=1)
+
+
+def test_poll(sim, box):
+    watcher = StateWatcher(box)
+    assert watcher.poll() == []
+    sim.set_state(playedMediaId="4")
+    [change] = watcher.poll()
+    assert (change.kind, change.field, change.new) == (CHANNEL, "epg_id", "4")
+
+
+def test_async_events(sim, box):
+    async def first_change(watcher):
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.2, lambda: sim.set_state(playedMediaId="111"))
+        async for change in watcher.events():
+            return change
+
+    watcher = watch(sim, box, notify_timeout=2)
+    try:
+        change = asyncio.run(asyncio.wait_for(first_change(watcher), 5))
+    finally:
+        watcher.stop(timeout=1)
+    assert change.new == "111"
+
+
+def test_falls_back_to_polling(sim, box):
+    sim.failure_rate = 1.0
+    watcher = StateWatcher(
+        box, min_backoff=0.01, max_failures=2, min_poll_interval=0.05
+    )
+    changes = queue.Queue()
+    watcher.subscribe(changes.put)
+    watcher.start()
+    try:
+        # Info requests fail too: wait for the fallback, then recover
+        deadline = time.monotonic() + 5
+        while not watcher.polling and time.monotonic() < deadline:
+            time.sleep(0.01)
+        sim.failure_rate = 0.0
+        sim.set_state(playedMediaId="111")
+        assert changes.get(timeout=5).new == "111"
+    finally:
+        watcher.stop(timeout=1)
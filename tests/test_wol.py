@@ -0,0 +1,75 @@
+# coding: utf-8
+
+import socket
+
+import pytest
+
+from liveboxplaytv import LiveboxPlayTv
+from liveboxplaytv.simulator import LiveboxSimulator
+from liveboxplaytv.wol import magic_packet, parse_mac, send_magic_packet
+
+
+MAC = "a4:3e:51:00:00:01"
+
+
+@pytest.fixture
+def listener():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(5)
+    yield sock
+    sock.close()
+
+
+def test_parse_mac():
+    expected = b"\xa4\x3e\x51\x00\x00\x01"
+    assert parse_mac(MAC) == expected
+    assert parse_mac("A4-3E-51-00-00-01") == expected
+    assert parse_mac("a43e.5100.0001") == expected
+    for mac in ("a4:3e:51:00:00", "zz:3e:51:00:00:01"):
+        with pytest.raises(ValueError):
+            parse_mac(mac)
+
+
+def test_magic_packet():
+    packet = magic_packet(MAC)
+    assert len(packet) == 102
+    assert packet[:6] == b"\xff" * 6
+    assert packet[6:] == parse_mac(MAC) * 16
+
+
+def test_send_magic_packet(listener):
+    port = listener.getsockname()[1]
+    assert send_magic_packet(MAC, "127.0.0.1", port, count=2) == 1
+    for _ in range(2):
+        assert listener.recvfrom(1024)[0] == magic_packet(MAC)
+
+
+def test_wake_on_lan_uses_the_known_mac(sim, box, listener):
+    box.wake_on_lan("127.0.0.1", listener.getsockname()[1])
+    assert listener.recvfrom(1024)[0] == magic_packet(sim.info["macAddress"])
+
+
+def test_power_on_from_deep_standby():
+    with LiveboxSimulator(wol=True, wake_time=0.2) as sim:
+        # Learn the MAC address, then the box goes to deep standby
+        box = LiveboxPlayTv(sim.host, port=sim.port, retries=0)
+        sim.set_state(activeStandbyState="1")
+        sim.deep_standby = True
+        elapsed = box.power_on(
+            timeout=10, wol_address="127.0.0.1", wol_port=sim.wol_address[1]
+        )
+        assert sim.wol_packets
+        assert not sim.deep_standby
+        assert sim.info["activeStandbyState"] == "0"
+        assert elapsed < 10
+        box.close()
+
+
+def test_power_on_without_a_known_mac():
+    with LiveboxSimulator(wol=True, deep_standby=True) as sim:
+        box = LiveboxPlayTv(sim.host, port=sim.port, retries=0, lazy=True)
+        assert box.known_mac is None
+        with pytest.raises(Exception):
+            box.power_on(timeout=1, wol_address="127.0.0.1")
+        assert sim.wol_packets == 0